@@ -1,19 +1,51 @@
 # afusion/api.py
 
 import os
+import contextlib
+import glob
+import itertools
 import json
 import re
+import shutil
+import string
+import tempfile
+import time
 import uuid
+import numpy as np
 import pandas as pd
-from afusion.execution import run_alphafold
+from afusion.buckets import plan_bucket_order
+from afusion.execution import build_docker_command, run_alphafold
+from afusion.fasta import is_fasta_file, iter_tasks_from_fasta
+from afusion.inference_worker import InferenceWorkerError
+from afusion.input_files import BATCH_FILES_FOLDER, link_input_files, reference_chain_files, reference_input_files, store_input_file
+from afusion.journal import (
+    DONE,
+    FAILED,
+    INFERENCE_RUNNING,
+    PIPELINE_DONE,
+    PIPELINE_RUNNING,
+    QUEUED,
+    JobJournal,
+)
+from afusion.msa_cache import MsaCache, make_chain_task, plan_unique_chains
+from afusion.profiling import merge_resource_usage
+from afusion.progress import ProgressParser, merge_stage_timings
+from afusion.retry import INVALID_INPUT, LARGER_GPU, UNKNOWN, StageWatchdog, apply_remedies, classify_failure, with_gpus
+from afusion.scheduler import CpuSlots, GpuSlots, run_parallel, run_pipelined
+from afusion.seed_fanout import merge_seed_shard_outputs, split_model_seeds
 from afusion.utils import compress_output_folder
+from afusion.validation import normalize_task, validate_tasks
 from loguru import logger
 
 
-def create_batch_task(job_name, entities, model_seeds, bonded_atom_pairs=None, user_ccd=None):
+def create_batch_task(job_name, entities, model_seeds, bonded_atom_pairs=None, user_ccd=None, files_dir=None):
     """
     Creates a batch task dictionary for a single prediction.
 
+    Consecutive entities with the same type and sequence data (e.g. the
+    copies of a homo-oligomer) become one entry with a list of IDs, so
+    their sequence, MSAs and templates appear in the JSON once.
+
     :param job_name: Name of the job.
     :type job_name: str
     :param entities: List of dictionaries, each representing an Entity.
@@ -28,6 +60,9 @@ def create_batch_task(job_name, entities, model_seeds, bonded_atom_pairs=None, u
     :type bonded_atom_pairs: list, optional
     :param user_ccd: Optional user CCD.
     :type user_ccd: str, optional
+    :param files_dir: If given, the user CCD is written to a content-addressed
+        file in this directory and referenced as ``userCCDPath``.
+    :type files_dir: str, optional
     :return: Dictionary representing the AlphaFold input JSON structure.
     :rtype: dict
     """
@@ -37,21 +72,19 @@ def create_batch_task(job_name, entities, model_seeds, bonded_atom_pairs=None, u
         sequence_data = entity['sequence_data']
         entity_id = entity['id']
 
-        sequence_entry = sequence_data.copy()
-        sequence_entry['id'] = entity_id
-
-        if entity_type == 'protein':
-            sequences.append({'protein': sequence_entry})
-        elif entity_type == 'rna':
-            sequences.append({'rna': sequence_entry})
-        elif entity_type == 'dna':
-            sequences.append({'dna': sequence_entry})
-        elif entity_type == 'ligand':
-            sequences.append({'ligand': sequence_entry})
-        else:
+        if entity_type not in ('protein', 'rna', 'dna', 'ligand'):
             logger.error(f"Unknown entity type: {entity_type}")
             continue
 
+        previous_entry = sequences[-1].get(entity_type) if sequences else None
+        if previous_entry is not None and _same_sequence_data(previous_entry, sequence_data):
+            previous_entry['id'] = _id_list(previous_entry['id']) + _id_list(entity_id)
+            continue
+
+        sequence_entry = sequence_data.copy()
+        sequence_entry['id'] = entity_id
+        sequences.append({entity_type: sequence_entry})
+
     alphafold_input = {
         "name": job_name,
         "modelSeeds": model_seeds,
@@ -63,13 +96,97 @@ def create_batch_task(job_name, entities, model_seeds, bonded_atom_pairs=None, u
     if bonded_atom_pairs:
         alphafold_input["bondedAtomPairs"] = bonded_atom_pairs
 
-    if user_ccd:
+    if user_ccd and files_dir is not None:
+        alphafold_input["userCCDPath"] = store_input_file(user_ccd, files_dir, 'cif')
+    elif user_ccd:
         alphafold_input["userCCD"] = user_ccd
 
     logger.debug(f"Created task for job: {job_name}")
     return alphafold_input
 
 
+def _same_sequence_data(sequence_entry, sequence_data):
+    """Whether a sequences entry holds the same entity as ``sequence_data``, apart from its ID."""
+    return ({key: value for key, value in sequence_entry.items() if key != 'id'}
+            == {key: value for key, value in sequence_data.items() if key != 'id'})
+
+
+def _id_list(entity_id):
+    return list(entity_id) if isinstance(entity_id, list) else [entity_id]
+
+
+_SANITIZED_NAME_CHARS = set(string.ascii_lowercase + string.digits + '_-.')
+
+
+def sanitize_job_name(job_name):
+    """
+    Returns the folder name AlphaFold 3 uses for a job.
+
+    AlphaFold 3 lowercases the job name, replaces spaces with underscores and
+    drops every character other than letters, digits, '_', '-' and '.'.
+
+    :param job_name: Name of the job.
+    :type job_name: str
+    :return: Sanitized job name.
+    :rtype: str
+    """
+    lower_spaceless_name = job_name.lower().replace(' ', '_')
+    return ''.join(c for c in lower_spaceless_name if c in _SANITIZED_NAME_CHARS)
+
+
+def save_task_json(task, input_path, files_dir=None):
+    """
+    Writes a task to ``fold_input.json`` in its input folder.
+
+    The JSON is written without indentation. Files the task references
+    (``unpairedMsaPath``, ``pairedMsaPath``, ``mmcifPath``, ``userCCDPath``)
+    by an absolute path are linked into the input folder so the container
+    can read them (see :func:`afusion.input_files.link_input_files`).
+
+    :param task: Task dict, as generated by create_batch_task.
+    :type task: dict
+    :param input_path: The task's input folder; created if needed.
+    :type input_path: str
+    :param files_dir: If given, inline MSAs, template mmCIFs and user CCD
+        are first moved into content-addressed files in this directory, so
+        tasks sharing them share one file.
+    :type files_dir: str, optional
+    :return: Path of the written JSON file.
+    :rtype: str
+    """
+    os.makedirs(input_path, exist_ok=True)
+    if files_dir is not None:
+        task = reference_input_files(task, files_dir)
+    task = link_input_files(task, input_path)
+    json_save_path = os.path.join(input_path, "fold_input.json")
+    with open(json_save_path, "w") as json_file:
+        json.dump(task, json_file, separators=(',', ':'))
+    logger.info(f"JSON file saved for job '{task['name']}' at {json_save_path}")
+    return json_save_path
+
+
+def find_data_json(pipeline_output_path, job_name):
+    """
+    Finds the ``*_data.json`` written by the data pipeline for a job.
+
+    AlphaFold 3 writes to a timestamped sibling folder when the job folder
+    already exists, so the most recently written match is returned.
+
+    :param pipeline_output_path: Output directory the data pipeline wrote to.
+    :type pipeline_output_path: str
+    :param job_name: Name of the job.
+    :type job_name: str
+    :return: Path to the data JSON, or None if the pipeline produced none.
+    :rtype: str or None
+    """
+    name = sanitize_job_name(job_name)
+    pattern = os.path.join(glob.escape(pipeline_output_path), f"{glob.escape(name)}*", f"{glob.escape(name)}_data.json")
+    candidates = glob.glob(pattern)
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+
 def run_batch_predictions(
     tasks,
     af_input_base_path,
@@ -79,12 +196,123 @@ def run_batch_predictions(
     run_data_pipeline=True,
     run_inference=True,
     bucket_sizes=None,
+    pipelined=False,
+    pipeline_lookahead=1,
+    pipeline_workers=1,
+    cores_per_job=None,
+    memory_per_job=None,
+    inference_worker=None,
+    msa_cache=None,
+    deduplicate_chains=False,
+    order_by_bucket=False,
+    journal_path=None,
+    gpu_devices=None,
+    gpu_probe=None,
+    seed_shards=None,
+    resource_profiler=None,
+    metrics=None,
+    retry_policy=None,
+    validate=True,
 ):
     """
     Runs batch predictions for the given tasks.
 
-    :param tasks: List of task dicts, as generated by create_batch_task.
-    :type tasks: list of dict
+    With ``pipelined=True`` (and both stages enabled) every task is split into
+    a CPU-only data pipeline container and a GPU inference container. The data
+    pipeline for the next ``pipeline_lookahead`` tasks runs while inference
+    runs for the current one, and the stages hand over through the
+    ``*_data.json`` the data pipeline writes into the task's input folder.
+
+    ``pipeline_workers`` runs several data pipeline containers at the same
+    time, both for data-pipeline-only batches and for the data pipeline stage
+    of pipelined batches. Each running container is pinned to its own set of
+    ``cores_per_job`` cores, and jackhmmer/nhmmer get the same thread count,
+    so concurrent searches do not oversubscribe the host.
+
+    An ``inference_worker`` (see :class:`afusion.inference_worker.WarmInferenceWorker`)
+    keeps one model loaded for the whole batch. When both stages are enabled
+    it implies pipelined mode, and it is also used for inference-only
+    batches. If the worker is not running or dies, the remaining tasks fall
+    back to one ``docker run`` per task.
+
+    With an ``msa_cache`` (see :class:`afusion.msa_cache.MsaCache`), chains
+    already in the cache get their MSAs and templates injected before the
+    task is written, and a task whose chains are all cached skips the data
+    pipeline entirely. Chains the data pipeline searched for are added to
+    the cache. The cache's counters are reset at the start of the batch and
+    a hit/miss report is logged at the end; ``msa_cache.report()`` returns it.
+
+    ``deduplicate_chains=True`` adds a planning pass that finds the distinct
+    chains across the whole batch and runs the data pipeline once per chain
+    (on the ``pipeline_workers`` pool) before any task runs. The results are
+    injected into every task that uses the chain, so those tasks go straight
+    to inference. Without an ``msa_cache`` a temporary one is used for the
+    batch.
+
+    ``order_by_bucket=True`` estimates each task's token count, runs all
+    tasks that compile for the same bucket back to back (which keeps a warm
+    inference worker on one compiled model for as long as possible), and
+    adds 'num_tokens' and 'bucket' to each result. Results are then in run
+    order rather than input order; :func:`afusion.buckets.plan_bucket_order`
+    returns the same plan with the number of recompiles avoided.
+
+    With a ``journal_path`` every task's state (queued, pipeline-running,
+    pipeline-done, inference-running, done, failed) is committed to a SQLite
+    journal (see :class:`afusion.journal.JobJournal`). Running the same batch
+    again with the same journal skips tasks that are done and whose outputs
+    are on disk (their results carry the 'log_path' and 'stage_timings' of
+    the run that completed them), and sends tasks whose data pipeline
+    finished straight to inference. Incomplete output folders of resumed
+    tasks are moved aside.
+
+    ``gpu_devices`` spreads inference over several GPUs: every inference
+    container is pinned to one device with ``--gpus device=<id>``, and as
+    many jobs run at once as there are devices, drawing from one shared
+    queue. Pass a list of device ids, or 'auto' to find them with
+    ``gpu_probe`` (by default :func:`afusion.scheduler.probe_gpu_devices`).
+    Jobs sent to a warm ``inference_worker`` run on the worker's device.
+
+    ``seed_shards`` splits the ``modelSeeds`` of each task across that many
+    inference runs, which run at the same time (one per device with
+    ``gpu_devices``) on the task's single data pipeline result. Their
+    sample folders, ranking scores and top-ranked model are then merged into
+    the usual output folder (see :mod:`afusion.seed_fanout`). With both
+    stages enabled this implies pipelined mode; seed shards do not use the
+    warm ``inference_worker``.
+
+    With a ``resource_profiler``, every container a job runs is sampled for
+    CPU time, peak memory, disk I/O and GPU memory, and the job's result
+    gets a 'resource_usage' summary (see
+    :class:`afusion.profiling.ResourceProfiler`). ``metrics`` collects the
+    results of the jobs that ran into Prometheus counters and histograms.
+
+    Every failed run gets a failure class from its exit code and output
+    (see :func:`afusion.retry.classify_failure`). With a ``retry_policy``
+    (see :class:`afusion.retry.RetryPolicy`) each container is also stopped
+    when a stage exceeds its timeout, and failed runs are retried after a
+    backoff or, for GPU out-of-memory failures, with the next remedy. Jobs
+    that should move to a larger GPU are requeued onto the policy's
+    ``large_gpu_devices`` once the rest of the batch is done.
+
+    With ``validate=True`` common input slips are fixed with
+    :func:`afusion.validation.normalize_task` and the batch is checked with
+    :func:`afusion.validation.validate_tasks` before anything else happens
+    to it: a list of tasks in one pass, an iterator in chunks of 1000
+    tasks. An invalid task fails with its errors instead of running, and is
+    left out of chain deduplication and bucket ordering.
+
+    Inline MSAs, template mmCIFs and user CCDs are written once per distinct
+    content to ``<af_input_base_path>/_input_files`` and every task refers
+    to its copy by path (see :func:`save_task_json`), so an MSA shared by a
+    thousand tasks is stored once.
+
+    ``tasks`` may be any iterable, such as :func:`iter_tasks_from_file`.
+    Each task is written to its input folder and dropped before the next one
+    is read, so only small per-job bookkeeping stays in memory. Ordering by
+    bucket and deduplicating chains need the whole batch and read it up front.
+
+    :param tasks: Task dicts, as generated by create_batch_task.
+    :type tasks: iterable of dict
     :param af_input_base_path: Base path for AlphaFold input.
     :type af_input_base_path: str
     :param af_output_base_path: Base path for AlphaFold output.
@@ -99,25 +327,146 @@ def run_batch_predictions(
     :type run_inference: bool
     :param bucket_sizes: Optional list of bucket sizes.
     :type bucket_sizes: list of int, optional
-    :return: List of dicts with keys 'job_name', 'output_folder', 'status'.
+    :param pipelined: Whether to overlap the data pipeline of upcoming tasks
+        with inference of the current task.
+    :type pipelined: bool
+    :param pipeline_lookahead: How many tasks the data pipeline may run ahead
+        of inference in pipelined mode.
+    :type pipeline_lookahead: int
+    :param pipeline_workers: Number of data pipeline containers to run at the
+        same time.
+    :type pipeline_workers: int
+    :param cores_per_job: Cores given to each data pipeline container.
+        Defaults to an even split of the host's cores across the workers.
+    :type cores_per_job: int, optional
+    :param memory_per_job: Memory cap for each data pipeline container, in
+        Docker's ``--memory`` format (e.g. '64g').
+    :type memory_per_job: str, optional
+    :param inference_worker: Optional started warm inference worker whose
+        mounts cover ``af_input_base_path`` and ``af_output_base_path``.
+    :type inference_worker: afusion.inference_worker.WarmInferenceWorker, optional
+    :param msa_cache: Optional cache of per-chain data pipeline results.
+    :type msa_cache: afusion.msa_cache.MsaCache, optional
+    :param deduplicate_chains: Whether to search each distinct chain of the
+        batch only once.
+    :type deduplicate_chains: bool
+    :param order_by_bucket: Whether to group tasks by compilation bucket.
+    :type order_by_bucket: bool
+    :param journal_path: Optional path of a SQLite job journal for resumable runs.
+    :type journal_path: str, optional
+    :param gpu_devices: GPU device ids to run inference on, or 'auto'.
+        Defaults to one job at a time on all GPUs.
+    :type gpu_devices: list or str, optional
+    :param gpu_probe: Callable returning the device ids for 'auto'.
+    :type gpu_probe: callable, optional
+    :param seed_shards: Number of parallel inference runs to split each
+        task's model seeds across.
+    :type seed_shards: int, optional
+    :param resource_profiler: Optional profiler sampling each job's resource use.
+    :type resource_profiler: afusion.profiling.ResourceProfiler, optional
+    :param metrics: Optional metrics to add each finished job to.
+    :type metrics: afusion.metrics.JobMetrics, optional
+    :param retry_policy: Optional timeouts and retry rules for failed runs.
+    :type retry_policy: afusion.retry.RetryPolicy, optional
+    :param validate: Whether to reject invalid tasks before running them.
+    :type validate: bool
+    :return: List of dicts with keys 'job_name', 'output_folder', 'status',
+        plus 'log_path' (the job's full AlphaFold output) and 'stage_timings'
+        (wall-clock seconds per stage, see :class:`afusion.progress.ProgressParser`)
+        for jobs that ran, 'failure' (the failure class of the last run, None
+        if it succeeded) and 'retries' for jobs whose runs finished,
+        'resource_usage' for profiled jobs, and 'num_tokens' and 'bucket' when ordering by bucket.
     :rtype: list of dict
     """
+    output_path = af_output_base_path
+    os.makedirs(output_path, exist_ok=True)
+
+    cpu_slots = None
+    if pipeline_workers > 1 or cores_per_job:
+        cpu_slots = CpuSlots(pipeline_workers, cores_per_job=cores_per_job)
+
+    gpu_slots = None
+    if gpu_devices is not None and run_inference:
+        gpu_slots = GpuSlots(None if gpu_devices == 'auto' else gpu_devices, probe=gpu_probe)
+    if seed_shards and seed_shards > 1 and run_inference and gpu_slots is None:
+        logger.warning("seed_shards without gpu_devices runs every seed shard on all GPUs at once.")
+
+    batch_cache_dir = None
+    if deduplicate_chains and run_data_pipeline and msa_cache is None:
+        batch_cache_dir = tempfile.TemporaryDirectory(prefix='afusion_msa_cache_')
+        msa_cache = MsaCache(batch_cache_dir.name)
+
+    if msa_cache is not None:
+        msa_cache.reset_stats()
+
+    journal = JobJournal(journal_path) if journal_path else None
+    input_files_dir = os.path.join(af_input_base_path, BATCH_FILES_FOLDER)
+
     results = []
+    if validate:
+        tasks = _valid_tasks(tasks, results, output_path, journal)
+
+    bucket_plan = {}
+    if order_by_bucket:
+        tasks, plan, _ = plan_bucket_order(tasks, bucket_sizes)
+        bucket_plan = {entry['job_name']: entry for entry in plan}
+
+    if deduplicate_chains and run_data_pipeline:
+        tasks = list(tasks)
+        _prefetch_unique_chains(
+            tasks,
+            msa_cache,
+            os.path.join(af_input_base_path, _UNIQUE_CHAINS_FOLDER),
+            model_parameters_dir=model_parameters_dir,
+            databases_dir=databases_dir,
+            cpu_slots=cpu_slots,
+            memory_per_job=memory_per_job,
+            retry_policy=retry_policy,
+        )
+
+    jobs = []
     for task in tasks:
         job_name = task['name']
         job_folder_name = job_name
-        
-        input_path = os.path.join(af_input_base_path, job_folder_name)
-        output_path = af_output_base_path
-        
-        os.makedirs(input_path, exist_ok=True)
-        os.makedirs(output_path, exist_ok=True) 
+        data_ready = False
+        resumed_data_json_path = None
+        resumed_stage_timings = {}
 
-        json_save_path = os.path.join(input_path, "fold_input.json")
+        entry = journal.get(job_name) if journal is not None else None
+        if entry is not None:
+            if _journal_entry_complete(entry, output_path, run_data_pipeline, run_inference):
+                logger.info(f"Job '{job_name}' is already done according to the journal; skipping.")
+                # The log and timings of the run that completed the job.
+                result = {
+                    'job_name': job_name,
+                    'output_folder': output_path,
+                    'status': 'Success',
+                    'log_path': os.path.join(entry['input_path'] or os.path.join(af_input_base_path, job_folder_name),
+                                             _JOB_LOG_FILE),
+                    'stage_timings': entry['stage_timings'],
+                }
+                if job_name in bucket_plan:
+                    result['num_tokens'] = bucket_plan[job_name]['num_tokens']
+                    result['bucket'] = bucket_plan[job_name]['bucket']
+                results.append(result)
+                continue
+            if run_inference:
+                move_incomplete_output_aside(output_path, job_name)
+            if (run_data_pipeline and run_inference and entry['state'] == PIPELINE_DONE
+                    and entry['data_json_path'] and os.path.exists(entry['data_json_path'])):
+                logger.info(f"Resuming job '{job_name}' after its data pipeline: {entry['data_json_path']}")
+                with open(entry['data_json_path']) as data_file:
+                    task = json.load(data_file)
+                data_ready = True
+                # The data pipeline's timings, from the run that did it.
+                resumed_stage_timings = dict(entry['stage_timings'])
+
+        if msa_cache is not None and run_data_pipeline and not data_ready:
+            task, data_ready = msa_cache.inject(task)
+
+        input_path = os.path.join(af_input_base_path, job_folder_name)
         try:
-            with open(json_save_path, "w") as json_file:
-                json.dump(task, json_file, indent=2)
-            logger.info(f"JSON file saved for job '{job_name}' at {json_save_path}")
+            json_save_path = save_task_json(task, input_path, files_dir=input_files_dir)
         except Exception as e:
             logger.error(f"Error saving JSON file for job '{job_name}': {e}")
             results.append({
@@ -125,55 +474,733 @@ def run_batch_predictions(
                 'output_folder': output_path,
                 'status': f'Failed to save JSON: {e}'
             })
+            if journal is not None:
+                journal.record(job_name, FAILED, status=f'Failed to save JSON: {e}')
             continue
 
-        # Build the Docker command
-        docker_command = (
-            f"docker run --rm "
-            f"--volume {input_path}:/root/af_input "
-            f"--volume {output_path}:/root/af_output "
-            f"--volume {model_parameters_dir}:/root/models "
-            f"--volume {databases_dir}:/root/public_databases "
-            f"--gpus all "
-            f"alphafold3 "
-            f"python run_alphafold.py "
-            f"--json_path=/root/af_input/fold_input.json "
-            f"--model_dir=/root/models "
-            f"--output_dir=/root/af_output "
-            f"{'--run_data_pipeline' if run_data_pipeline else ''} "
-            f"{'--run_inference' if run_inference else ''} "
-            f"{'--buckets ' + ','.join(map(str, bucket_sizes)) if bucket_sizes else ''}"
+        job = {
+            'job_name': job_name,
+            'input_path': input_path,
+            'json_path': json_save_path,
+            'output_folder': output_path,
+            'log_path': os.path.join(input_path, _JOB_LOG_FILE),
+            'stage_timings': resumed_stage_timings,
+            'resource_profiler': resource_profiler,
+            'retry_policy': retry_policy,
+            'status': None,
+            'data_ready': data_ready,
+        }
+        if job_name in bucket_plan:
+            job['num_tokens'] = bucket_plan[job_name]['num_tokens']
+            job['bucket'] = bucket_plan[job_name]['bucket']
+        jobs.append(job)
+        results.append(job)
+        _record(journal, job, QUEUED, input_path=input_path, output_folder=output_path)
+
+    if (inference_worker is not None or seed_shards) and run_data_pipeline and run_inference:
+        pipelined = True
+
+    if pipelined and run_data_pipeline and run_inference:
+        _run_pipelined_jobs(
+            jobs,
+            model_parameters_dir=model_parameters_dir,
+            databases_dir=databases_dir,
+            bucket_sizes=bucket_sizes,
+            lookahead=pipeline_lookahead,
+            cpu_slots=cpu_slots,
+            memory_per_job=memory_per_job,
+            inference_worker=inference_worker,
+            msa_cache=msa_cache,
+            journal=journal,
+            gpu_slots=gpu_slots,
+            seed_shards=seed_shards,
+        )
+    elif run_data_pipeline and not run_inference:
+        def pipeline_only_stage(job):
+            if job['data_ready']:
+                _write_cached_data_json(job)
+            else:
+                _record(journal, job, PIPELINE_RUNNING)
+                with _cpu_budget(cpu_slots) as slot:
+                    docker_command = build_docker_command(
+                        job['input_path'],
+                        job['output_folder'],
+                        model_parameters_dir,
+                        databases_dir,
+                        run_data_pipeline=True,
+                        run_inference=False,
+                        gpus=None,
+                        cpuset_cpus=slot.get('cpuset'),
+                        memory=memory_per_job,
+                        n_cpu=slot.get('n_cpu'),
+                    )
+                    _run_job_command(job, docker_command)
+                _cache_pipeline_result(msa_cache, job, job['output_folder'])
+            _record_outcome(
+                journal, job, PIPELINE_DONE,
+                data_json_path=find_data_json(job['output_folder'], job['job_name']),
+            )
+
+        run_parallel(jobs, pipeline_only_stage, workers=cpu_slots.workers if cpu_slots else 1)
+    else:
+        def job_stage(job):
+            _record(journal, job, PIPELINE_RUNNING if run_data_pipeline and not job['data_ready'] else INFERENCE_RUNNING)
+            if run_inference and not run_data_pipeline and _run_seed_shards(
+                    job, job['json_path'], seed_shards, model_parameters_dir, databases_dir, bucket_sizes, gpu_slots):
+                _record_outcome(journal, job)
+                return
+            if run_inference and _run_job_on_worker(job, job['json_path'], inference_worker):
+                _record_outcome(journal, job)
+                return
+            if job['data_ready']:
+                logger.info(f"All chains of job '{job['job_name']}' are cached; skipping the data pipeline.")
+            with _gpu_device(gpu_slots) as gpus:
+                docker_command = build_docker_command(
+                    job['input_path'],
+                    job['output_folder'],
+                    model_parameters_dir,
+                    databases_dir,
+                    run_data_pipeline=run_data_pipeline and not job['data_ready'],
+                    run_inference=run_inference,
+                    bucket_sizes=bucket_sizes,
+                    gpus=gpus,
+                )
+                _run_job_command(job, docker_command, gpus)
+            if run_data_pipeline and not job['data_ready']:
+                _cache_pipeline_result(msa_cache, job, job['output_folder'])
+            _record_outcome(journal, job)
+
+        run_parallel(jobs, job_stage, workers=gpu_slots.workers if gpu_slots else 1)
+
+    requeued = [job for job in jobs if job.get('requeue')]
+    if requeued:
+        _run_requeued_jobs(requeued, retry_policy, journal)
+
+    if msa_cache is not None:
+        report = msa_cache.report()
+        logger.info(
+            f"MSA cache: {report['hits']} hits, {report['misses']} misses, "
+            f"{report['stored']} chains stored, {report['evicted']} evicted, "
+            f"{report['size_bytes']} bytes on disk."
+        )
+    if batch_cache_dir is not None:
+        batch_cache_dir.cleanup()
+    if journal is not None:
+        logger.info(f"Journal {journal_path}: {journal.summary()}")
+        journal.close()
+
+    results = [
+        {key: result[key] for key in _RESULT_KEYS if key in result}
+        for result in results
+    ]
+    if metrics is not None:
+        ran = {job['job_name'] for job in jobs}
+        for result in results:
+            if result['job_name'] in ran:
+                metrics.observe(result)
+    return results
+
+
+# Keys of a job's bookkeeping dict that run_batch_predictions returns.
+_RESULT_KEYS = (
+    'job_name', 'output_folder', 'status', 'failure', 'retries', 'log_path', 'stage_timings', 'resource_usage',
+    'num_tokens', 'bucket',
+)
+
+# Each job's AlphaFold output, next to its fold_input.json.
+_JOB_LOG_FILE = 'alphafold.log'
+
+# Tasks validated at a time when run_batch_predictions reads an iterator.
+_VALIDATION_CHUNK_SIZE = 1000
+
+
+def _valid_tasks(tasks, results, output_path, journal=None):
+    """
+    Normalizes and validates tasks a chunk at a time and yields the valid ones.
+
+    Each invalid task gets a failed result in ``results`` (and the journal)
+    when its chunk is validated, so for a lazily consumed iterator results
+    stay in task order. A list is validated in one pass. Output folders are
+    remembered across chunks, so two tasks with the same sanitized name in
+    different chunks are caught too (the later one is failed).
+    """
+    chunk_size = len(tasks) if isinstance(tasks, list) else _VALIDATION_CHUNK_SIZE
+    tasks = iter(tasks)
+    seen_folders = set()
+    while True:
+        chunk = [normalize_task(task) if isinstance(task, dict) else task for task in itertools.islice(tasks, chunk_size)]
+        if not chunk:
+            return
+        invalid = {entry['index']: entry for entry in validate_tasks(chunk, seen_folders=seen_folders)}
+        for index, task in enumerate(chunk):
+            if index not in invalid:
+                yield task
+                continue
+            job_name = invalid[index]['job_name']
+            errors = '; '.join(invalid[index]['errors'])
+            logger.error(f"Job '{job_name}' is invalid: {errors}")
+            results.append({
+                'job_name': job_name,
+                'output_folder': output_path,
+                'status': f'Invalid task: {errors}',
+                'failure': INVALID_INPUT,
+            })
+            if journal is not None and job_name:
+                journal.record(job_name, FAILED, status=f'Invalid task: {errors}')
+
+
+def is_job_output_complete(af_output_base_path, job_name):
+    """
+    Returns whether a job's inference outputs were written completely.
+
+    AlphaFold 3 writes the top-ranked ``<job>_model.cif`` to the job's
+    output folder after every seed has finished.
+
+    :param af_output_base_path: Base path for AlphaFold output.
+    :type af_output_base_path: str
+    :param job_name: Name of the job.
+    :type job_name: str
+    :rtype: bool
+    """
+    name = sanitize_job_name(job_name)
+    return os.path.exists(os.path.join(af_output_base_path, name, f"{name}_model.cif"))
+
+
+def move_incomplete_output_aside(af_output_base_path, job_name):
+    """
+    Renames a leftover, incomplete output folder so a rerun does not mistake
+    it for its own output (AlphaFold 3 would write to a timestamped sibling).
+
+    :param af_output_base_path: Base path for AlphaFold output.
+    :type af_output_base_path: str
+    :param job_name: Name of the job.
+    :type job_name: str
+    """
+    output_folder = os.path.join(af_output_base_path, sanitize_job_name(job_name))
+    if not os.path.isdir(output_folder) or is_job_output_complete(af_output_base_path, job_name):
+        return
+    aside = f"{output_folder}.incomplete-{time.strftime('%Y%m%d_%H%M%S')}"
+    suffix = 1
+    while os.path.exists(aside):
+        # Retries can fail more than once a second.
+        suffix += 1
+        aside = f"{output_folder}.incomplete-{time.strftime('%Y%m%d_%H%M%S')}-{suffix}"
+    os.rename(output_folder, aside)
+    logger.warning(f"Moved incomplete output of job '{job_name}' to {aside}")
+
+
+def _journal_entry_complete(entry, af_output_base_path, run_data_pipeline, run_inference):
+    """Checks a journal entry against the files on disk before a job is skipped."""
+    if run_inference:
+        # A driver that died right after inference finished never recorded 'done'.
+        return (entry['state'] in (INFERENCE_RUNNING, DONE)
+                and is_job_output_complete(af_output_base_path, entry['job_name']))
+    if run_data_pipeline:
+        return (entry['state'] in (PIPELINE_DONE, DONE) and bool(entry['data_json_path'])
+                and os.path.exists(entry['data_json_path']))
+    return entry['state'] == DONE
+
+
+def _record(journal, job, state, **fields):
+    """
+    Records a job's state in the journal, if there is one, with the job's
+    stage timings once a stage has finished, so a resumed or skipped job
+    still reports them.
+    """
+    if journal is not None:
+        if state in (PIPELINE_DONE, DONE) and job.get('stage_timings'):
+            fields.setdefault('stage_timings', job['stage_timings'])
+        journal.record(job['job_name'], state, **fields)
+
+
+def _record_outcome(journal, job, success_state=DONE, **fields):
+    """Records a finished stage as ``success_state`` or failed, from the job's status."""
+    if job['status'] == 'Success':
+        _record(journal, job, success_state, status=job['status'], **fields)
+    else:
+        _record(journal, job, FAILED, status=job['status'] or 'Failed')
+
+
+def _run_with_progress(job, docker_command, gpus=None, output_folder=None):
+    """
+    Runs one AlphaFold container for a job and adds its stage timings and resource usage to the job's.
+
+    The job gets the 'failure' class of the run. With the job's
+    'retry_policy', the run is stopped at the policy's stage timeouts and
+    retried as the policy says; a run that should move to a larger GPU is
+    left in the job's 'requeue' instead. ``output_folder`` is where the run
+    writes (the job's output folder by default); incomplete output there is
+    moved aside before a retry.
+    """
+    job_name = job['job_name']
+    policy = job.get('retry_policy')
+    profiler = job.get('resource_profiler')
+    inference = '--run_inference' in docker_command
+    remedies = list(job.pop('oom_remedies', None) or [])
+    attempt = 0
+    while True:
+        attempt += 1
+        command = apply_remedies(docker_command, remedies, policy) if remedies else docker_command
+        if attempt > 1 or remedies:
+            logger.debug(f"Attempt {attempt} of job '{job_name}': {command}")
+        progress = ProgressParser()
+        watchdog = StageWatchdog(policy, progress) if policy is not None else None
+        with (profiler.profile(command, gpus) if profiler else contextlib.nullcontext()) as run_profile:
+            def on_start(process):
+                if run_profile is not None:
+                    run_profile.attach(process)
+                if watchdog is not None:
+                    watchdog.attach(process)
+
+            try:
+                result = run_alphafold(
+                    run_profile.command if run_profile else command,
+                    log_path=job.get('log_path'),
+                    on_line=progress.feed,
+                    on_start=on_start,
+                )
+            finally:
+                if watchdog is not None:
+                    watchdog.stop()
+        progress.finish()
+        job['stage_timings'] = dict(job.get('stage_timings') or {}, **progress.timings())
+        logger.info(f"Stage timings for job '{job_name}': {job['stage_timings']}")
+        if run_profile is not None:
+            job['resource_usage'] = merge_resource_usage(job.get('resource_usage'), run_profile.usage())
+
+        job['failure'] = classify_failure(
+            result.returncode, result.tail, timed_out=watchdog is not None and watchdog.timed_out_stage is not None
         )
+        if job['failure'] is None or policy is None:
+            return result
+        decision = policy.retry(job['failure'], attempt, remedies, gpus, inference)
+        if decision is None:
+            return result
+        delay, remedy = decision
+        job['retries'] = job.get('retries', 0) + 1
+        if remedy == LARGER_GPU:
+            logger.warning(f"Job '{job_name}' ran out of GPU memory; requeueing it onto a larger GPU.")
+            job['requeue'] = {
+                'command': docker_command,
+                'remedies': remedies + [LARGER_GPU],
+                'output_folder': output_folder or job['output_folder'],
+            }
+            return result
+        if remedy is not None:
+            remedies.append(remedy)
+        logger.warning(
+            f"Attempt {attempt} of job '{job_name}' failed ({job['failure']}); retrying"
+            f"{f' with {remedy}' if remedy else ''}{f' in {delay:.0f} seconds' if delay else ''}."
+        )
+        time.sleep(delay)
+        if inference:
+            move_incomplete_output_aside(output_folder or job['output_folder'], job_name)
+
+
+def _run_job_command(job, docker_command, gpus=None):
+    """Runs one AlphaFold container for a job and records its status."""
+    job_name = job['job_name']
+    logger.debug(f"Running Docker command for job '{job_name}': {docker_command}")
+
+    try:
+        result = _run_with_progress(job, docker_command, gpus)
+        if job.get('requeue'):
+            job['status'] = f"Failed ({job['failure']}): requeued onto a larger GPU"
+            return
+        job['status'] = run_status(job_name, result.returncode, job['output_folder'], job['failure'])
+    except Exception as e:
+        logger.error(f"Error running AlphaFold for job '{job_name}': {e}")
+        job['status'] = f'Failed to run AlphaFold: {e}'
+
+
+def run_status(job_name, returncode, output_folder, failure=None):
+    """
+    Returns the status of a job after its last AlphaFold run.
+
+    :param job_name: Name of the job.
+    :type job_name: str
+    :param returncode: Exit code of the run.
+    :type returncode: int
+    :param output_folder: Folder the run wrote the job's output folder into.
+    :type output_folder: str
+    :param failure: Failure class of the run, from :func:`afusion.retry.classify_failure`.
+    :type failure: str, optional
+    :return: 'Success' if the run exited with 0 and left the job's output
+        folder, otherwise a 'Failed ...' message.
+    :rtype: str
+    """
+    if returncode != 0:
+        logger.error(f"AlphaFold exited with code {returncode} for job '{job_name}' ({failure}).")
+        return f"Failed ({failure or UNKNOWN}): exit code {returncode}"
+    logger.info(f"AlphaFold execution completed for job '{job_name}'.")
+
+    # Check if the output directory exists
+    expected_output_folder = os.path.join(output_folder, sanitize_job_name(job_name))
+    if os.path.exists(expected_output_folder):
+        logger.info(f"Results saved in: {expected_output_folder}")
+        return 'Success'
+    logger.error(f"Output folder '{expected_output_folder}' not found for job '{job_name}'.")
+    return 'Failed'
+
+
+def pipeline_data_json(job_name, returncode, pipeline_output_path, failure=None):
+    """
+    Returns the data JSON a data-pipeline-only run wrote, for the inference run.
+
+    A failed run has no usable data JSON, even if an earlier run left one.
 
-        logger.debug(f"Running Docker command for job '{job_name}': {docker_command}")
+    :param job_name: Name of the job.
+    :type job_name: str
+    :param returncode: Exit code of the data pipeline run.
+    :type returncode: int
+    :param pipeline_output_path: Folder the data pipeline wrote into.
+    :type pipeline_output_path: str
+    :param failure: Failure class of the run, from :func:`afusion.retry.classify_failure`.
+    :type failure: str, optional
+    :return: ``(data JSON path, None)``, or ``(None, status)`` with the
+        job's 'Failed ...' status.
+    :rtype: tuple
+    """
+    if returncode != 0:
+        logger.error(f"Data pipeline exited with code {returncode} for job '{job_name}' ({failure}).")
+        return None, f"Failed ({failure or UNKNOWN}): data pipeline exit code {returncode}"
+    data_json_path = find_data_json(pipeline_output_path, job_name)
+    if data_json_path is None:
+        logger.error(f"Data pipeline produced no data JSON for job '{job_name}'.")
+        return None, 'Failed: data pipeline produced no data JSON'
+    return data_json_path, None
+
+
+def _run_requeued_jobs(jobs, retry_policy, journal=None):
+    """Runs jobs that ran out of GPU memory again, one at a time per large GPU of the policy."""
+    large_gpu_slots = GpuSlots(retry_policy.large_gpu_devices)
+    logger.info(f"Requeueing {len(jobs)} job(s) that ran out of GPU memory onto the larger GPUs.")
+
+    def requeued_stage(job):
+        requeue = job.pop('requeue')
+        _record(journal, job, INFERENCE_RUNNING)
+        move_incomplete_output_aside(requeue['output_folder'], job['job_name'])
+        job['oom_remedies'] = requeue['remedies']
+        with _gpu_device(large_gpu_slots) as gpus:
+            _run_job_command(job, with_gpus(requeue['command'], gpus), gpus)
+        _record_outcome(journal, job)
+
+    run_parallel(jobs, requeued_stage, workers=large_gpu_slots.workers)
+
+
+# Input folder, under af_input_base_path, for the single-chain tasks of
+# deduplicate_chains.
+_UNIQUE_CHAINS_FOLDER = '_unique_chains'
+
+
+def _prefetch_unique_chains(tasks, msa_cache, chains_input_path, model_parameters_dir, databases_dir,
+                            cpu_slots=None, memory_per_job=None, retry_policy=None):
+    """Runs the data pipeline once per distinct uncached chain and caches the results."""
+    unique_chains = plan_unique_chains(tasks, msa_cache)
+    chain_count = sum(chain['task_count'] for chain in unique_chains)
+    logger.info(
+        f"Chain deduplication: {len(unique_chains)} distinct chains to search "
+        f"for {chain_count} chains across {len(tasks)} tasks."
+    )
+
+    chain_jobs = []
+    for chain in unique_chains:
+        name = f"chain_{msa_cache.key(chain['entity_type'], chain['sequence'])[:16]}"
+        input_path = os.path.join(chains_input_path, name)
+        json_path = os.path.join(input_path, "fold_input.json")
+        os.makedirs(input_path, exist_ok=True)
+        with open(json_path, "w") as json_file:
+            json.dump(
+                make_chain_task(name, chain['entity_type'], chain['sequence'], chain['search_fields']),
+                json_file,
+                separators=(',', ':'),
+            )
+        chain_jobs.append({
+            'job_name': name,
+            'input_path': input_path,
+            'json_path': json_path,
+            'output_folder': input_path,
+            'log_path': os.path.join(input_path, _JOB_LOG_FILE),
+            'retry_policy': retry_policy,
+            'status': None,
+        })
+
+    def chain_stage(job):
+        with _cpu_budget(cpu_slots) as slot:
+            docker_command = build_docker_command(
+                job['input_path'],
+                job['output_folder'],
+                model_parameters_dir,
+                databases_dir,
+                run_data_pipeline=True,
+                run_inference=False,
+                gpus=None,
+                cpuset_cpus=slot.get('cpuset'),
+                memory=memory_per_job,
+                n_cpu=slot.get('n_cpu'),
+            )
+            _run_job_command(job, docker_command)
+        if job['status'] != 'Success':
+            logger.warning(f"Data pipeline failed for chain '{job['job_name']}'; its tasks will search it themselves.")
+        _cache_pipeline_result(msa_cache, job, job['output_folder'])
+
+    run_parallel(chain_jobs, chain_stage, workers=cpu_slots.workers if cpu_slots else 1)
+
+
+def _cache_pipeline_result(msa_cache, job, pipeline_output_path):
+    """Adds the chains a job's data pipeline searched for to the MSA cache."""
+    if msa_cache is None or job['status'] not in (None, 'Success'):
+        return
+    data_json_path = find_data_json(pipeline_output_path, job['job_name'])
+    if data_json_path is None:
+        return
+    try:
+        with open(job['json_path']) as input_file:
+            input_task = json.load(input_file)
+        with open(data_json_path) as data_file:
+            data_task = json.load(data_file)
+        msa_cache.store(input_task, data_task)
+    except Exception as e:
+        logger.warning(f"Could not cache data pipeline results of job '{job['job_name']}': {e}")
+
+
+def _write_cached_data_json(job):
+    """Writes a fully cached task to where the data pipeline would have written it."""
+    job_name = job['job_name']
+    name = sanitize_job_name(job_name)
+    data_json_path = os.path.join(job['output_folder'], name, f"{name}_data.json")
+    try:
+        os.makedirs(os.path.dirname(data_json_path), exist_ok=True)
+        with open(job['json_path']) as json_file:
+            task = json.load(json_file)
+        # Files the task references are linked next to the copy, too.
+        task = link_input_files(task, os.path.dirname(data_json_path), source_dir=job['input_path'])
+        with open(data_json_path, 'w') as data_file:
+            json.dump(task, data_file, separators=(',', ':'))
+    except (OSError, ValueError) as e:
+        logger.error(f"Error writing cached data JSON for job '{job_name}': {e}")
+        job['status'] = f'Failed to write cached data JSON: {e}'
+        return
+    logger.info(f"All chains of job '{job_name}' are cached; data JSON written to {data_json_path}")
+    job['status'] = 'Success'
+
+
+def _run_job_on_worker(job, json_path, inference_worker):
+    """
+    Runs inference for a job on the warm worker and records its status.
+
+    Returns False, leaving the job untouched, when the worker is unavailable
+    and the caller should fall back to a per-task container.
+    """
+    if inference_worker is None or not inference_worker.alive:
+        return False
+    job_name = job['job_name']
+    expected_output_folder = os.path.join(job['output_folder'], sanitize_job_name(job_name))
+    try:
+        response = inference_worker.run(json_path, expected_output_folder)
+    except InferenceWorkerError as e:
+        logger.warning(f"Warm inference worker unavailable for job '{job_name}', falling back to docker run: {e}")
+        return False
+
+    if response.get('status') != 'ok':
+        logger.error(f"Warm inference worker failed job '{job_name}': {response.get('error')}")
+        job['status'] = f"Failed to run AlphaFold: {response.get('error')}"
+    elif os.path.exists(expected_output_folder):
+        logger.info(f"Results saved in: {expected_output_folder}")
+        job['status'] = 'Success'
+    else:
+        logger.error(f"Output folder '{expected_output_folder}' not found for job '{job_name}'.")
+        job['status'] = 'Failed'
+    return True
 
-        # Run AlphaFold
+
+@contextlib.contextmanager
+def _cpu_budget(cpu_slots):
+    """Checks out a CPU slot, or yields an empty budget when none is configured."""
+    if cpu_slots is None:
+        yield {}
+    else:
+        with cpu_slots.acquire() as slot:
+            yield slot
+
+
+def _run_seed_shards(job, data_json_path, seed_shards, model_parameters_dir, databases_dir, bucket_sizes,
+                     gpu_slots=None):
+    """
+    Runs inference for a job as parallel runs over disjoint seeds and merges them.
+
+    Returns False, leaving the job untouched, when the job has too few seeds
+    to split and the caller should run it as usual.
+    """
+    if not seed_shards or seed_shards < 2:
+        return False
+    with open(data_json_path) as data_file:
+        task = json.load(data_file)
+    seed_groups = split_model_seeds(task.get('modelSeeds') or [1], seed_shards)
+    if len(seed_groups) < 2:
+        return False
+
+    job_name = job['job_name']
+    name = sanitize_job_name(job_name)
+    shards_path = os.path.join(job['output_folder'], f".{name}_seed_shards")
+    shards = [
+        {
+            'job_name': job_name,
+            'output_folder': os.path.join(shards_path, f"shard-{index}"),
+            'index': index,
+            'seeds': seeds,
+            'log_path': os.path.join(job['input_path'], f"alphafold_seeds_{index}.log"),
+            'resource_profiler': job.get('resource_profiler'),
+            # Shards are retried in place; only whole jobs move to a larger GPU.
+            'retry_policy': job['retry_policy'].without_requeue() if job.get('retry_policy') else None,
+            'status': None,
+        }
+        for index, seeds in enumerate(seed_groups)
+    ]
+    logger.info(f"Running job '{job_name}' as {len(shards)} inference runs over seeds {seed_groups}.")
+
+    def shard_stage(shard):
+        # Shard inputs sit in the job's input folder so the container sees them.
+        json_name = f"fold_input_seeds_{shard['index']}.json"
+        with open(os.path.join(job['input_path'], json_name), 'w') as shard_file:
+            json.dump(dict(task, modelSeeds=shard['seeds']), shard_file, separators=(',', ':'))
+        os.makedirs(shard['output_folder'], exist_ok=True)
+        with _gpu_device(gpu_slots) as gpus:
+            docker_command = build_docker_command(
+                job['input_path'],
+                shard['output_folder'],
+                model_parameters_dir,
+                databases_dir,
+                json_path=f"/root/af_input/{json_name}",
+                run_data_pipeline=False,
+                run_inference=True,
+                bucket_sizes=bucket_sizes,
+                gpus=gpus,
+            )
+            _run_job_command(shard, docker_command, gpus)
+
+    run_parallel(shards, shard_stage, workers=len(shards))
+    failed = [shard for shard in shards if shard['status'] != 'Success']
+    if failed:
+        job['status'] = f"Failed: seed shard(s) {', '.join(str(shard['seeds']) for shard in failed)} did not finish"
+        return True
+    try:
+        merge_seed_shard_outputs(
+            [os.path.join(shard['output_folder'], name) for shard in shards],
+            os.path.join(job['output_folder'], name),
+        )
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not merge the seed shards of job '{job_name}': {e}")
+        job['status'] = f'Failed to merge seed shards: {e}'
+        return True
+    shutil.rmtree(shards_path, ignore_errors=True)
+    job['stage_timings'] = dict(
+        job.get('stage_timings') or {},
+        **merge_stage_timings(*(shard.get('stage_timings') for shard in shards)),
+    )
+    if job.get('resource_profiler') is not None:
+        job['resource_usage'] = merge_resource_usage(
+            job.get('resource_usage'), *(shard.get('resource_usage') for shard in shards)
+        )
+    job['status'] = 'Success' if is_job_output_complete(job['output_folder'], job_name) else 'Failed'
+    return True
+
+
+@contextlib.contextmanager
+def _gpu_device(gpu_slots):
+    """Checks out a GPU and yields its ``--gpus`` value, or 'all' when no devices are configured."""
+    if gpu_slots is None:
+        yield "all"
+    else:
+        with gpu_slots.acquire() as device:
+            yield f"device={device}"
+
+
+def _run_pipelined_jobs(jobs, model_parameters_dir, databases_dir, bucket_sizes, lookahead,
+                        cpu_slots=None, memory_per_job=None, inference_worker=None, msa_cache=None,
+                        journal=None, gpu_slots=None, seed_shards=None):
+    """Runs jobs with the data pipeline of upcoming jobs overlapping inference."""
+
+    def pipeline_stage(job):
+        job_name = job['job_name']
+        if job['data_ready']:
+            logger.info(f"Job '{job_name}' already has its MSAs and templates; skipping the data pipeline.")
+            job['data_json_path'] = job['json_path']
+            _record(journal, job, PIPELINE_DONE, data_json_path=job['data_json_path'])
+            return True
+        _record(journal, job, PIPELINE_RUNNING)
         try:
-            output = run_alphafold(docker_command)
-            logger.info(f"AlphaFold execution completed for job '{job_name}'.")
-
-            # Check if the output directory exists
-            expected_output_folder = os.path.join(af_output_base_path, job_folder_name)
-            if os.path.exists(expected_output_folder):
-                logger.info(f"Results saved in: {expected_output_folder}")
-                status = 'Success'
-            else:
-                logger.error(f"Output folder '{expected_output_folder}' not found for job '{job_name}'.")
-                status = 'Failed'
+            with _cpu_budget(cpu_slots) as slot:
+                # The data pipeline writes its *_data.json next to fold_input.json so
+                # the inference container can read it through the same input volume.
+                docker_command = build_docker_command(
+                    job['input_path'],
+                    job['input_path'],
+                    model_parameters_dir,
+                    databases_dir,
+                    run_data_pipeline=True,
+                    run_inference=False,
+                    gpus=None,
+                    cpuset_cpus=slot.get('cpuset'),
+                    memory=memory_per_job,
+                    n_cpu=slot.get('n_cpu'),
+                )
+                logger.debug(f"Running data pipeline for job '{job_name}': {docker_command}")
+                result = _run_with_progress(job, docker_command, output_folder=job['input_path'])
         except Exception as e:
-            logger.error(f"Error running AlphaFold for job '{job_name}': {e}")
-            status = f'Failed to run AlphaFold: {e}'
+            logger.error(f"Error running data pipeline for job '{job_name}': {e}")
+            job['status'] = f'Failed to run data pipeline: {e}'
+            _record_outcome(journal, job)
+            return False
+        data_json_path, failed_status = pipeline_data_json(job_name, result.returncode, job['input_path'],
+                                                           job['failure'])
+        if data_json_path is None:
+            job['status'] = failed_status
+            _record_outcome(journal, job)
+            return False
+        logger.info(f"Data pipeline completed for job '{job_name}': {data_json_path}")
+        job['data_json_path'] = data_json_path
+        _record(journal, job, PIPELINE_DONE, data_json_path=data_json_path)
+        _cache_pipeline_result(msa_cache, job, job['input_path'])
+        return True
 
-        results.append({
-            'job_name': job_name,
-            'output_folder': output_path,
-            'status': status
-        })
+    def inference_stage(job):
+        _record(journal, job, INFERENCE_RUNNING)
+        if _run_seed_shards(job, job['data_json_path'], seed_shards, model_parameters_dir, databases_dir,
+                            bucket_sizes, gpu_slots):
+            _record_outcome(journal, job)
+            return
+        if _run_job_on_worker(job, job['data_json_path'], inference_worker):
+            _record_outcome(journal, job)
+            return
+        relative_json_path = os.path.relpath(job['data_json_path'], job['input_path'])
+        with _gpu_device(gpu_slots) as gpus:
+            docker_command = build_docker_command(
+                job['input_path'],
+                job['output_folder'],
+                model_parameters_dir,
+                databases_dir,
+                json_path=f"/root/af_input/{relative_json_path}",
+                run_data_pipeline=False,
+                run_inference=True,
+                bucket_sizes=bucket_sizes,
+                gpus=gpus,
+            )
+            _run_job_command(job, docker_command, gpus)
+        _record_outcome(journal, job)
 
-    return results
+    run_pipelined(
+        jobs,
+        pipeline_stage,
+        inference_stage,
+        lookahead=lookahead,
+        pipeline_workers=cpu_slots.workers if cpu_slots else 1,
+        inference_workers=gpu_slots.workers if gpu_slots else 1,
+    )
 
 
-def create_protein_sequence_data(sequence, modifications=None, msa_option='auto', unpaired_msa=None, paired_msa=None, templates=None):
+def create_protein_sequence_data(sequence, modifications=None, msa_option='auto', unpaired_msa=None, paired_msa=None, templates=None,
+                                 files_dir=None):
     """
     Creates sequence data for a protein entity.
 
@@ -189,6 +1216,10 @@ def create_protein_sequence_data(sequence, modifications=None, msa_option='auto'
     :type paired_msa: str, optional
     :param templates: Optional list of template dicts.
     :type templates: list of dict, optional
+    :param files_dir: If given, uploaded MSAs and template mmCIFs are written
+        to content-addressed files in this directory and referenced as
+        ``unpairedMsaPath``, ``pairedMsaPath`` and ``mmcifPath``.
+    :type files_dir: str, optional
     :return: Sequence data dictionary.
     :rtype: dict
     """
@@ -211,10 +1242,12 @@ def create_protein_sequence_data(sequence, modifications=None, msa_option='auto'
         protein_entry["templates"] = templates or []
     else:
         logger.error(f"Invalid msa_option: {msa_option}")
+    if files_dir is not None:
+        protein_entry = reference_chain_files(protein_entry, files_dir)
     return protein_entry
 
 
-def create_rna_sequence_data(sequence, modifications=None, msa_option='auto', unpaired_msa=None):
+def create_rna_sequence_data(sequence, modifications=None, msa_option='auto', unpaired_msa=None, files_dir=None):
     """
     Creates sequence data for an RNA entity.
 
@@ -226,6 +1259,10 @@ def create_rna_sequence_data(sequence, modifications=None, msa_option='auto', un
     :type msa_option: str
     :param unpaired_msa: Unpaired MSA (if msa_option is 'upload').
     :type unpaired_msa: str, optional
+    :param files_dir: If given, an uploaded MSA is written to a
+        content-addressed file in this directory and referenced as
+        ``unpairedMsaPath``.
+    :type files_dir: str, optional
     :return: Sequence data dictionary.
     :rtype: dict
     """
@@ -242,6 +1279,8 @@ def create_rna_sequence_data(sequence, modifications=None, msa_option='auto', un
         rna_entry["unpairedMsa"] = unpaired_msa or ""
     else:
         logger.error(f"Invalid msa_option: {msa_option}")
+    if files_dir is not None:
+        rna_entry = reference_chain_files(rna_entry, files_dir)
     return rna_entry
 
 
@@ -293,14 +1332,16 @@ def create_ligand_sequence_data(ccd_codes=None, smiles=None):
         return {}
 
 
-def create_tasks_from_dataframe(df):
+def create_tasks_from_dataframe(df, files_dir=None):
     """
     Creates batch tasks from a DataFrame.
 
     :param df: DataFrame with columns representing parameters:
         - 'job_name': str
         - 'type': 'protein', 'rna', 'dna', or 'ligand'
-        - 'id': str or list
+        - 'id': str or list; comma-separated IDs ('A,B') give one entity
+          with several copies, as do consecutive rows of a job with the
+          same entity
         - 'sequence': str
         - Other optional parameters:
             - 'modifications': list of dicts (as JSON string)
@@ -312,57 +1353,204 @@ def create_tasks_from_dataframe(df):
             - 'bonded_atom_pairs': list (as JSON string)
             - 'user_ccd': str
     :type df: pandas.DataFrame
+    :param files_dir: If given, uploaded MSAs, template mmCIFs and user CCDs
+        are written once per distinct content to this directory and the
+        tasks reference them by path (see :func:`create_protein_sequence_data`).
+    :type files_dir: str, optional
     :return: List of task dictionaries.
     :rtype: list of dict
     """
-    tasks = []
-    grouped = df.groupby('job_name')
-    for job_name, group in grouped:
+    # Jobs come out in sorted job_name order, as with groupby; rows without a
+    # job_name are dropped.
+    codes, job_names = pd.factorize(df['job_name'].where(_has_job_name(df['job_name'])), sort=True)
+    return list(_create_tasks_from_columns(df, codes, job_names, files_dir))
+
+
+def iter_tasks_from_file(path, chunksize=1000, file_format=None, files_dir=None, fasta_options=None):
+    """
+    Lazily creates batch tasks from a CSV, Parquet or FASTA file.
+
+    The file is read ``chunksize`` rows at a time and each task is yielded
+    as soon as all of its rows have been read, so memory use depends on the
+    chunk size and the largest job rather than on the size of the file.
+    The columns are the same as for :func:`create_tasks_from_dataframe`.
+
+    The rows of each job must be next to each other (for example, the file
+    is sorted by ``job_name``); tasks are yielded in file order. Parquet
+    input needs ``pyarrow``. FASTA files are read with
+    :func:`afusion.fasta.iter_tasks_from_fasta`.
+
+    :param path: Path to a ``.csv``, ``.parquet`` or FASTA file.
+    :type path: str
+    :param chunksize: Number of rows to read at a time.
+    :type chunksize: int
+    :param file_format: 'csv', 'parquet' or 'fasta'; guessed from the file
+        extension by default.
+    :type file_format: str, optional
+    :param files_dir: Directory for uploaded MSAs, template mmCIFs and user
+        CCDs, as for :func:`create_tasks_from_dataframe`.
+    :type files_dir: str, optional
+    :param fasta_options: Keyword arguments for FASTA files, such as
+        ``group_size`` or ``msa_dir``.
+    :type fasta_options: dict, optional
+    :return: Generator of task dictionaries.
+    :rtype: generator of dict
+    :raises ValueError: If the rows of a job are not contiguous.
+    """
+    if file_format is None:
+        if is_fasta_file(path):
+            file_format = 'fasta'
+        else:
+            file_format = 'parquet' if path.lower().endswith(('.parquet', '.pq')) else 'csv'
+    if file_format == 'fasta':
+        yield from iter_tasks_from_fasta(path, files_dir=files_dir, **(fasta_options or {}))
+        return
+    if file_format == 'csv':
+        # Read every column as text, as parse_list_field/parse_json_field expect.
+        chunks = pd.read_csv(path, chunksize=chunksize, dtype=str)
+    elif file_format == 'parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Reading Parquet batch files requires pyarrow: pip install pyarrow") from e
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize))
+    else:
+        raise ValueError(f"Unsupported batch file format: {file_format}")
+    yield from iter_tasks_from_chunks(chunks, files_dir)
+
+
+def iter_tasks_from_chunks(chunks, files_dir=None):
+    """
+    Lazily creates batch tasks from consecutive DataFrame chunks.
+
+    A job's rows may span chunks but must be contiguous; rows without a
+    job_name are dropped. The rows of the last job in a chunk are held back until the next chunk shows that the
+    job is complete.
+
+    :param chunks: DataFrames with the columns of :func:`create_tasks_from_dataframe`.
+    :type chunks: iterable of pandas.DataFrame
+    :param files_dir: Directory for uploaded MSAs, template mmCIFs and user
+        CCDs, as for :func:`create_tasks_from_dataframe`.
+    :type files_dir: str, optional
+    :return: Generator of task dictionaries.
+    :rtype: generator of dict
+    :raises ValueError: If the rows of a job are not contiguous.
+    """
+    finished_jobs = set()
+    pending = None
+    for chunk in chunks:
+        # Rows without a job_name are dropped, as by create_tasks_from_dataframe.
+        chunk = chunk[_has_job_name(chunk['job_name'])]
+        if chunk.empty:
+            continue
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+        job_names = chunk['job_name']
+        run_starts = job_names.ne(job_names.shift()).to_numpy()
+        codes = np.cumsum(run_starts) - 1
+        run_names = job_names[run_starts].tolist()
+        for job_name in run_names[:-1]:
+            if job_name in finished_jobs:
+                raise ValueError(
+                    f"Rows of job '{job_name}' are not contiguous; sort the batch file by job_name."
+                )
+            finished_jobs.add(job_name)
+        if run_names[-1] in finished_jobs:
+            raise ValueError(
+                f"Rows of job '{run_names[-1]}' are not contiguous; sort the batch file by job_name."
+            )
+        complete = codes < len(run_names) - 1
+        yield from _create_tasks_from_columns(chunk[complete], codes[complete], run_names[:-1], files_dir)
+        pending = chunk[~complete]
+    if pending is not None:
+        last_job_name = pending['job_name'].iloc[0]
+        yield from _create_tasks_from_columns(pending, np.zeros(len(pending), dtype=int), [last_job_name], files_dir)
+
+
+def _has_job_name(job_names):
+    """Returns which entries of a job_name column are neither missing nor blank."""
+    return job_names.notna() & job_names.astype(str).str.strip().ne('')
+
+
+def _create_tasks_from_columns(df, codes, job_names, files_dir=None):
+    """
+    Creates one batch task per job from a DataFrame, column by column.
+
+    ``codes`` gives the position in ``job_names`` of each row's job (-1 to
+    skip the row). Each column is converted to a list once, and the JSON
+    and list fields are parsed only where a value is present, instead of
+    going through the DataFrame row by row.
+    """
+    num_rows = len(df)
+
+    def column(name, default=None):
+        return df[name].tolist() if name in df.columns else [default] * num_rows
+
+    types = df['type'].tolist()
+    # 'A,B' gives one entity with several copies.
+    ids = [
+        parse_list_field(entity_id) if isinstance(entity_id, str) and ',' in entity_id else entity_id
+        for entity_id in df['id'].tolist()
+    ]
+    sequences = column('sequence', '')
+    msa_options = column('msa_option', 'auto')
+    unpaired_msas = column('unpaired_msa')
+    paired_msas = column('paired_msa')
+    smiles_values = column('smiles')
+    model_seeds_values = column('model_seeds')
+    bonded_atom_pairs_values = column('bonded_atom_pairs')
+    user_ccd_values = column('user_ccd')
+    modifications_values = _parse_column(df, 'modifications', parse_json_field)
+    templates_values = _parse_column(df, 'templates', parse_json_field)
+    ccd_codes_values = _parse_column(df, 'ccd_codes', parse_list_field, rows=df['type'].eq('ligand').to_numpy())
+
+    codes = np.asarray(codes)
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    group_codes = codes[order]
+    boundaries = np.flatnonzero(np.diff(group_codes)) + 1
+    for positions in np.split(order, boundaries):
+        if len(positions) == 0:
+            continue
+        job_name = job_names[codes[positions[0]]]
         entities = []
         model_seeds = None
         bonded_atom_pairs = None
         user_ccd = None
 
-        for _, row in group.iterrows():
-            entity_type = row['type']
-            entity_id = row['id']
-            sequence = row.get('sequence', '')
-
-            # Parse optional fields
-            modifications = parse_json_field(row.get('modifications'))
-            msa_option = row.get('msa_option', 'auto')
-            unpaired_msa = row.get('unpaired_msa')
-            paired_msa = row.get('paired_msa')
-            templates = parse_json_field(row.get('templates'))
+        for i in positions.tolist():
+            entity_type = types[i]
+            modifications = modifications_values[i]
+            msa_option = msa_options[i]
 
             # Create sequence data based on entity type
             if entity_type == 'protein':
                 sequence_data = create_protein_sequence_data(
-                    sequence=sequence,
+                    sequence=sequences[i],
                     modifications=modifications,
                     msa_option=msa_option,
-                    unpaired_msa=unpaired_msa,
-                    paired_msa=paired_msa,
-                    templates=templates
+                    unpaired_msa=unpaired_msas[i],
+                    paired_msa=paired_msas[i],
+                    templates=templates_values[i],
+                    files_dir=files_dir
                 )
             elif entity_type == 'rna':
                 sequence_data = create_rna_sequence_data(
-                    sequence=sequence,
+                    sequence=sequences[i],
                     modifications=modifications,
                     msa_option=msa_option,
-                    unpaired_msa=unpaired_msa
+                    unpaired_msa=unpaired_msas[i],
+                    files_dir=files_dir
                 )
             elif entity_type == 'dna':
                 sequence_data = create_dna_sequence_data(
-                    sequence=sequence,
+                    sequence=sequences[i],
                     modifications=modifications
                 )
             elif entity_type == 'ligand':
-                ccd_codes = parse_list_field(row.get('ccd_codes'))
-                smiles = row.get('smiles')
                 sequence_data = create_ligand_sequence_data(
-                    ccd_codes=ccd_codes,
-                    smiles=smiles
+                    ccd_codes=ccd_codes_values[i],
+                    smiles=smiles_values[i]
                 )
             else:
                 logger.error(f"Unknown entity type: {entity_type}")
@@ -370,30 +1558,44 @@ def create_tasks_from_dataframe(df):
 
             entities.append({
                 'type': entity_type,
-                'id': entity_id,
+                'id': ids[i],
                 'sequence_data': sequence_data
             })
 
             # Get job-level parameters (assuming they are the same for all entities in the group)
-            if model_seeds is None and pd.notna(row.get('model_seeds')):
-                model_seeds = parse_list_field(row.get('model_seeds'), data_type=int)
-            if bonded_atom_pairs is None and pd.notna(row.get('bonded_atom_pairs')):
-                bonded_atom_pairs = parse_json_field(row.get('bonded_atom_pairs'))
-            if user_ccd is None and pd.notna(row.get('user_ccd')):
-                user_ccd = row.get('user_ccd')
+            if model_seeds is None and pd.notna(model_seeds_values[i]):
+                model_seeds = parse_list_field(model_seeds_values[i], data_type=int)
+            if bonded_atom_pairs is None and pd.notna(bonded_atom_pairs_values[i]):
+                bonded_atom_pairs = parse_json_field(bonded_atom_pairs_values[i])
+            if user_ccd is None and pd.notna(user_ccd_values[i]):
+                user_ccd = user_ccd_values[i]
 
         if model_seeds is None:
             model_seeds = [1]  # Default seed if not provided
 
-        task = create_batch_task(
+        yield create_batch_task(
             job_name=job_name,
             entities=entities,
             model_seeds=model_seeds,
             bonded_atom_pairs=bonded_atom_pairs,
-            user_ccd=user_ccd
+            user_ccd=user_ccd,
+            files_dir=files_dir
         )
-        tasks.append(task)
-    return tasks
+
+
+def _parse_column(df, name, parse, rows=None):
+    """Parses the non-empty cells of a column (optionally only in ``rows``); other cells are None."""
+    parsed = [None] * len(df)
+    if name not in df.columns:
+        return parsed
+    values = df[name]
+    present = values.notna().to_numpy() & values.ne('').to_numpy()
+    if rows is not None:
+        present &= rows
+    values = values.tolist()
+    for i in np.flatnonzero(present).tolist():
+        parsed[i] = parse(values[i])
+    return parsed
 
 
 def parse_json_field(value):
@@ -5,6 +5,7 @@ import json
 import re
 import os
 import sys
+import time
 from loguru import logger
 import pandas as pd
 import numpy as np
@@ -14,7 +15,12 @@ import py3Dmol
 from Bio import PDB
 
 # Import your modules (make sure they are correctly installed in your environment)
-from afusion.execution import run_alphafold
+from afusion.execution import build_docker_command, run_alphafold
+from afusion.api import find_data_json, sanitize_job_name, save_task_json
+from afusion.input_files import INPUT_FILES_FOLDER
+from afusion.background import LOST, background_job_status, cancel_background_job, read_log_tail, start_background_job
+from afusion.inference_worker import InferenceWorkerError, WarmInferenceWorker
+from afusion.job_queue import CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobQueue
 from afusion.sequence_input import (
     collect_protein_sequence_data,
     collect_rna_sequence_data,
@@ -23,6 +29,7 @@ from afusion.sequence_input import (
 )
 from afusion.bonds import handle_bond
 from afusion.utils import log_to_ga, compress_output_folder
+from afusion.validation import validate_tasks
 
 # Import visualization functions
 from afusion.visualization import (
@@ -89,6 +96,25 @@ def get_color_from_bfactor(bfactor):
             return mapping['color']
     return 'grey'  # Default color
 
+@st.cache_resource
+def get_warm_inference_worker(af_input_path, af_output_path, model_parameters_dir, bucket_sizes):
+    # Shared by every session and rerun with the same settings, so the model
+    # stays loaded between clicks of "Run AlphaFold 3 Now".
+    return WarmInferenceWorker.docker(
+        af_input_path,
+        af_output_path,
+        model_parameters_dir,
+        bucket_sizes=list(bucket_sizes),
+    )
+
+# Seconds between status checks of a running job; only the job panel reruns.
+JOB_POLL_INTERVAL = 5
+
+@st.cache_resource
+def get_job_queue():
+    # One connection to the shared queue database per Streamlit server.
+    return JobQueue()
+
 def main():
 
     # Log to Google Analytics when the app starts
@@ -225,19 +251,19 @@ def main():
                     continue
                 logger.debug(f"Entity {i+1} IDs: {entity_ids}")
 
-                for copy_id in entity_ids:
-                    # Clone the sequence data and set the ID
-                    sequence_entry = sequence_data.copy()
-                    sequence_entry['id'] = copy_id
-                    # Wrap the entry appropriately
-                    if entity_type.startswith("Protein"):
-                        sequences.append({"protein": sequence_entry})
-                    elif entity_type.startswith("RNA"):
-                        sequences.append({"rna": sequence_entry})
-                    elif entity_type.startswith("DNA"):
-                        sequences.append({"dna": sequence_entry})
-                    elif entity_type.startswith("Ligand"):
-                        sequences.append({"ligand": sequence_entry})
+                # All copies share one entry with a list of IDs, so the
+                # sequence and its MSAs appear in the JSON once.
+                sequence_entry = sequence_data.copy()
+                sequence_entry['id'] = entity_ids if len(entity_ids) > 1 else entity_ids[0]
+                # Wrap the entry appropriately
+                if entity_type.startswith("Protein"):
+                    sequences.append({"protein": sequence_entry})
+                elif entity_type.startswith("RNA"):
+                    sequences.append({"rna": sequence_entry})
+                elif entity_type.startswith("DNA"):
+                    sequences.append({"dna": sequence_entry})
+                elif entity_type.startswith("Ligand"):
+                    sequences.append({"ligand": sequence_entry})
             else:
                 st.error("Copy number must be at least 1.")
                 logger.error("Invalid copy number.")
@@ -285,6 +311,12 @@ def main():
     st.header("📄 Generated JSON Content")
     st.code(json_output, language="json")
 
+    validation_report = validate_tasks([alphafold_input])
+    validation_errors = validation_report[0]['errors'] if validation_report else []
+    if validation_errors:
+        st.warning("AlphaFold 3 would reject this input:\n\n" + "\n".join(f"- {error}" for error in validation_errors))
+        logger.warning(f"Invalid input: {validation_errors}")
+
     st.markdown('<div id="execution_settings"></div>', unsafe_allow_html=True)
     st.header("⚙️ AlphaFold 3 Execution Settings")
     with st.expander("Configure Execution Settings", expanded=True):
@@ -302,6 +334,23 @@ def main():
 
         logger.info(f"Run data pipeline: {run_data_pipeline}, Run inference: {run_inference}")
 
+        use_warm_worker = st.checkbox(
+            "Keep Model Loaded Between Runs (warm inference worker)",
+            value=False,
+            help="Runs inference in a long-lived container that keeps the model parameters and compiled buckets in memory. Falls back to a fresh container if the worker cannot start."
+        )
+        logger.info(f"Use warm inference worker: {use_warm_worker}")
+
+        use_job_queue = st.checkbox(
+            "Submit to Shared Job Queue",
+            value=False,
+            help="Queue the run on this server's job queue instead of starting it right away, so runs from several sessions take turns on the GPUs. Requires `afusion queue-daemon` to be running."
+        )
+        if use_job_queue:
+            queue_user = st.text_input("User Name", value=os.environ.get("USER", "anonymous"), help="Used to share the GPUs fairly between users.")
+            queue_priority = st.number_input("Priority", value=0, step=1, help="Jobs with a higher priority start first.")
+        logger.info(f"Use shared job queue: {use_job_queue}")
+
         # Bucket Sizes Configuration
         use_custom_buckets = st.checkbox("Specify Custom Compilation Buckets", value=False)
         if use_custom_buckets:
@@ -323,11 +372,11 @@ def main():
     st.markdown('<div id="run_alphafold"></div>', unsafe_allow_html=True)
     st.header("🚀 Run AlphaFold 3")
     # Save JSON to file
-    json_save_path = os.path.join(af_input_path, "fold_input.json")
     try:
-        os.makedirs(af_input_path, exist_ok=True)
-        with open(json_save_path, "w") as json_file:
-            json.dump(alphafold_input, json_file, indent=2)
+        # Uploaded MSAs, templates and CCD go to files next to the JSON.
+        json_save_path = save_task_json(
+            alphafold_input, af_input_path, files_dir=os.path.join(af_input_path, INPUT_FILES_FOLDER)
+        )
         st.success(f"JSON file saved to {json_save_path}")
         logger.info(f"JSON file saved to {json_save_path}")
     except Exception as e:
@@ -335,23 +384,48 @@ def main():
         logger.error(f"Error saving JSON file: {e}")
 
     # Run AlphaFold 3
-    if st.button("Run AlphaFold 3 Now ▶️"):
+    run_clicked = st.button("Run AlphaFold 3 Now ▶️")
+    if run_clicked and validation_errors:
+        st.error("Please fix the input errors listed above before running.")
+        st.stop()
+    run_in_session = run_clicked and use_warm_worker and run_inference and not use_job_queue
+    if run_clicked and use_job_queue:
+        st.query_params.clear()
+        st.query_params["queued_job"] = submit_to_job_queue(
+            alphafold_input, af_input_path, af_output_path, model_parameters_dir, databases_dir,
+            run_data_pipeline, run_inference, bucket_sizes, queue_user, queue_priority
+        )
+    elif run_clicked and not run_in_session:
+        # The job runs detached from this session; its id in the URL lets a
+        # reloaded page find it again.
+        job_input_path = save_job_input(alphafold_input, af_input_path)
+        docker_command = build_docker_command(
+            job_input_path,
+            af_output_path,
+            model_parameters_dir,
+            databases_dir,
+            run_data_pipeline=run_data_pipeline,
+            run_inference=run_inference,
+            bucket_sizes=bucket_sizes,
+        )
+        st.markdown("#### Docker Command:")
+        st.code(docker_command, language="bash")
+        logger.debug(f"Docker command: {docker_command}")
+        st.query_params.clear()
+        st.query_params["job"] = start_background_job(docker_command, job_name, af_output_path)
+
+    if run_in_session:
+        # The warm worker lives in this server process, so these runs stay
+        # attached to the session.
         # Build the Docker command
-        docker_command = (
-            f"docker run --rm "
-            f"--volume {af_input_path}:/root/af_input "
-            f"--volume {af_output_path}:/root/af_output "
-            f"--volume {model_parameters_dir}:/root/models "
-            f"--volume {databases_dir}:/root/public_databases "
-            f"--gpus all "
-            f"alphafold3 "
-            f"python run_alphafold.py "
-            f"--json_path=/root/af_input/fold_input.json "
-            f"--model_dir=/root/models "
-            f"--output_dir=/root/af_output "
-            f"{'--run_data_pipeline' if run_data_pipeline else ''} "
-            f"{'--run_inference' if run_inference else ''} "
-            f"{'--buckets ' + ','.join(map(str, bucket_sizes)) if bucket_sizes else ''}"
+        docker_command = build_docker_command(
+            af_input_path,
+            af_output_path,
+            model_parameters_dir,
+            databases_dir,
+            run_data_pipeline=run_data_pipeline,
+            run_inference=run_inference,
+            bucket_sizes=bucket_sizes,
         )
 
         st.markdown("#### Docker Command:")
@@ -361,103 +435,27 @@ def main():
         # Run the command and display output in a box
         with st.spinner('AlphaFold 3 is running...'):
             output_placeholder = st.empty()
-            output = run_alphafold(docker_command, placeholder=output_placeholder)
+            log_path = os.path.join(af_input_path, f"{sanitize_job_name(job_name)}_alphafold.log")
+            output = run_on_warm_worker(
+                job_name, af_input_path, af_output_path, model_parameters_dir,
+                databases_dir, run_data_pipeline, bucket_sizes, output_placeholder, log_path
+            )
+            if output is None:
+                output = run_alphafold(docker_command, placeholder=output_placeholder, log_path=log_path).tail
 
         # Display the output in an expander box
         st.markdown("#### Command Output:")
+        st.caption(f"Full output: {log_path}")
         with st.expander("Show Command Output 📄", expanded=False):
             st.text_area("Command Output", value=output, height=400)
 
         logger.info("AlphaFold 3 execution completed.")
 
-        # Check if the output directory exists
-        job_output_folder_name = job_name.lower().replace(' ', '_')
-        output_folder_path = os.path.join(af_output_path, job_output_folder_name)
-
-        if os.path.exists(output_folder_path):
-            st.success("AlphaFold 3 execution completed successfully.")
-            st.info(f"Results are saved in: {output_folder_path}")
-            logger.info(f"Results saved in: {output_folder_path}")
-
-            # Provide download option
-            st.markdown("### Download Results 📥")
-            zip_data = compress_output_folder(output_folder_path, job_output_folder_name)
-            st.download_button(
-                label="Download ZIP",
-                data=zip_data,
-                file_name=f"{job_output_folder_name}.zip",
-                mime="application/zip"
-            )
-            logger.info("User downloaded the results ZIP file.")
-
-            # Visualize the results directly on the same page
-            st.markdown("### Visualize Your Results")
-            st.write("The prediction results are visualized below.")
-
-            # Get the paths to the necessary files
-            def find_file_by_suffix(directory_path, suffix):
-                for root, dirs, files in os.walk(directory_path):
-                    for file_name in files:
-                        if file_name.endswith(suffix):
-                            return os.path.join(root, file_name)
-                return None
-            
-            def find_file_by_suffix_exclude_summary(directory_path, suffix, exclude_name):
-                for root, dirs, files in os.walk(directory_path):
-                    for file_name in files:
-                        if file_name.endswith(suffix) and exclude_name not in file_name:
-                            return os.path.join(root, file_name)
-                return None
-
-            required_files = {
-                "model.cif": find_file_by_suffix(output_folder_path, 'model.cif'),
-                "confidences.json": find_file_by_suffix_exclude_summary(output_folder_path, 'confidences.json', 'summary_confidences.json'),
-                "summary_confidences.json": find_file_by_suffix(output_folder_path, 'summary_confidences.json')
-            }
-
-            missing_files = [fname for fname, fpath in required_files.items() if fpath is None]
-            if missing_files:
-                st.error(f"Missing files: {', '.join(missing_files)} in the output directory or its subdirectories.")
-                logger.error(f"Missing files: {', '.join(missing_files)}")
-            else:
-                st.success("All required files are found.")
-                logger.info(f"Required files found: {required_files}")
-
-                # Load the data
-                structure, cif_content = read_cif_file(required_files["model.cif"])
-                residue_bfactors, ligands = extract_residue_bfactors(structure)
-                pae_matrix, token_chain_ids = extract_pae_from_json(required_files["confidences.json"])
-                summary_data = extract_summary_confidences(required_files["summary_confidences.json"])
-                
-                chain_ids = list(set(token_chain_ids))
-                chain_ids.sort()  # Sort for consistency
-
-                logger.debug("Successfully loaded data from output folder.")
-
-                # Display the visualizations
-                display_visualization_header()
-
-                # Create two columns with width ratio 3:2
-                col1, col2 = st.columns([3, 2])
-
-                with col1:
-                    st.write("### 3D Model Visualization")
-                    if residue_bfactors or ligands:
-                        view_html = visualize_structure(residue_bfactors, ligands, cif_content)
-                        st.components.v1.html(view_html, height=600, scrolling=False)
-                    else:
-                        st.error("Failed to extract atom data.")
-                        logger.error("Failed to extract atom data.")
-
-                with col2:
-                    # Visualize the PAE matrix
-                    visualize_pae(pae_matrix, token_chain_ids)
-
-                # Display summary data
-                display_summary_data(summary_data, chain_ids)
-        else:
-            st.error("AlphaFold 3 execution did not complete successfully. Please check the logs.")
-            logger.error("AlphaFold 3 execution did not complete successfully.")
+        show_results(af_output_path, job_name)
+    elif st.query_params.get("job"):
+        show_background_job(st.query_params["job"])
+    elif st.query_params.get("queued_job"):
+        show_queued_job(int(st.query_params["queued_job"]))
     else:
         st.info("Click the 'Run AlphaFold 3 Now ▶️' button to execute the command.")
 
@@ -482,5 +480,267 @@ def main():
     # Add footer
     st.markdown("<p style='text-align: center; font-size: 12px; color: #95a5a6;'>© 2024 Hanzi. All rights reserved.</p>", unsafe_allow_html=True)
 
+def show_results(af_output_path, job_name):
+    """Shows the download button and visualizations of a finished job."""
+    # Check if the output directory exists
+    job_output_folder_name = sanitize_job_name(job_name)
+    output_folder_path = os.path.join(af_output_path, job_output_folder_name)
+
+    if os.path.exists(output_folder_path):
+        st.success("AlphaFold 3 execution completed successfully.")
+        st.info(f"Results are saved in: {output_folder_path}")
+        logger.info(f"Results saved in: {output_folder_path}")
+
+        # Provide download option
+        st.markdown("### Download Results 📥")
+        zip_data = compress_output_folder(output_folder_path, job_output_folder_name)
+        st.download_button(
+            label="Download ZIP",
+            data=zip_data,
+            file_name=f"{job_output_folder_name}.zip",
+            mime="application/zip"
+        )
+        logger.info("User downloaded the results ZIP file.")
+
+        # Visualize the results directly on the same page
+        st.markdown("### Visualize Your Results")
+        st.write("The prediction results are visualized below.")
+
+        # Get the paths to the necessary files
+        def find_file_by_suffix(directory_path, suffix):
+            for root, dirs, files in os.walk(directory_path):
+                for file_name in files:
+                    if file_name.endswith(suffix):
+                        return os.path.join(root, file_name)
+            return None
+        
+        def find_file_by_suffix_exclude_summary(directory_path, suffix, exclude_name):
+            for root, dirs, files in os.walk(directory_path):
+                for file_name in files:
+                    if file_name.endswith(suffix) and exclude_name not in file_name:
+                        return os.path.join(root, file_name)
+            return None
+
+        required_files = {
+            "model.cif": find_file_by_suffix(output_folder_path, 'model.cif'),
+            "confidences.json": find_file_by_suffix_exclude_summary(output_folder_path, 'confidences.json', 'summary_confidences.json'),
+            "summary_confidences.json": find_file_by_suffix(output_folder_path, 'summary_confidences.json')
+        }
+
+        missing_files = [fname for fname, fpath in required_files.items() if fpath is None]
+        if missing_files:
+            st.error(f"Missing files: {', '.join(missing_files)} in the output directory or its subdirectories.")
+            logger.error(f"Missing files: {', '.join(missing_files)}")
+        else:
+            st.success("All required files are found.")
+            logger.info(f"Required files found: {required_files}")
+
+            # Load the data
+            structure, cif_content = read_cif_file(required_files["model.cif"])
+            residue_bfactors, ligands = extract_residue_bfactors(structure)
+            pae_matrix, token_chain_ids = extract_pae_from_json(required_files["confidences.json"])
+            summary_data = extract_summary_confidences(required_files["summary_confidences.json"])
+            
+            chain_ids = list(set(token_chain_ids))
+            chain_ids.sort()  # Sort for consistency
+
+            logger.debug("Successfully loaded data from output folder.")
+
+            # Display the visualizations
+            display_visualization_header()
+
+            # Create two columns with width ratio 3:2
+            col1, col2 = st.columns([3, 2])
+
+            with col1:
+                st.write("### 3D Model Visualization")
+                if residue_bfactors or ligands:
+                    view_html = visualize_structure(residue_bfactors, ligands, cif_content)
+                    st.components.v1.html(view_html, height=600, scrolling=False)
+                else:
+                    st.error("Failed to extract atom data.")
+                    logger.error("Failed to extract atom data.")
+
+            with col2:
+                # Visualize the PAE matrix
+                visualize_pae(pae_matrix, token_chain_ids)
+
+            # Display summary data
+            display_summary_data(summary_data, chain_ids)
+    else:
+        st.error("AlphaFold 3 execution did not complete successfully. Please check the logs.")
+        logger.error("AlphaFold 3 execution did not complete successfully.")
+
+def save_job_input(alphafold_input, af_input_path):
+    """
+    Saves the input JSON to a folder of its own and returns the folder.
+
+    Jobs that outlive the script run need their own copy, because the shared
+    fold_input.json is rewritten on every rerun of the page.
+    """
+    job_input_path = os.path.join(
+        af_input_path, "jobs", f"{sanitize_job_name(alphafold_input['name'])}-{time.strftime('%Y%m%d_%H%M%S')}"
+    )
+    save_task_json(alphafold_input, job_input_path, files_dir=os.path.join(af_input_path, INPUT_FILES_FOLDER))
+    return job_input_path
+
+def submit_to_job_queue(alphafold_input, af_input_path, af_output_path, model_parameters_dir, databases_dir,
+                        run_data_pipeline, run_inference, bucket_sizes, user, priority):
+    """Queues the job on the shared job queue and returns its id."""
+    job_name = alphafold_input["name"]
+    job_id = get_job_queue().submit(
+        job_name,
+        {
+            "af_input_path": save_job_input(alphafold_input, af_input_path),
+            "af_output_path": af_output_path,
+            "model_parameters_dir": model_parameters_dir,
+            "databases_dir": databases_dir,
+            "run_data_pipeline": run_data_pipeline,
+            "run_inference": run_inference,
+            "bucket_sizes": bucket_sizes,
+        },
+        user=user,
+        priority=int(priority),
+    )
+    st.success(f"Job '{job_name}' was added to the queue as #{job_id}.")
+    return job_id
+
+def show_background_job(job_id):
+    """Follows a background job until it ends, then shows its output and results."""
+    job = background_job_status(job_id)
+    if job is None:
+        st.error(f"Background job {job_id} was not found.")
+        return
+    if job["state"] == RUNNING:
+        poll_background_job(job_id)
+        return
+
+    st.markdown(f"#### Job {job['job_name']} ({job_id})")
+    with st.expander("Show Command Output 📄", expanded=False):
+        st.code(read_log_tail(job["log_path"]))
+    if job["state"] == DONE:
+        show_results(job["af_output_path"], job["job_name"])
+    elif job["state"] == FAILED:
+        st.error(f"AlphaFold 3 exited with code {job['returncode']}. Please check the output above.")
+    elif job["state"] == CANCELLED:
+        st.warning("The job was cancelled.")
+    elif job["state"] == LOST:
+        st.error("The job stopped without reporting an exit code, e.g. because the server restarted.")
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def poll_background_job(job_id):
+    """Refreshes a running background job's status and log tail."""
+    job = background_job_status(job_id)
+    if job["state"] != RUNNING:
+        # Show the final state and results with a full rerun.
+        st.rerun()
+    started = time.strftime('%H:%M:%S', time.localtime(job['started_at']))
+    st.info(f"AlphaFold 3 is running job '{job['job_name']}' in the background (started {started}). "
+            "You can close or reload this page; bookmark its address to come back to the job.")
+    st.code(read_log_tail(job["log_path"], max_lines=50))
+    if st.button("Cancel Job ✖️"):
+        cancel_background_job(job_id)
+        st.rerun()
+
+def show_queued_job(job_id):
+    """Follows a job on the shared job queue until it ends, then shows its output and results."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        st.error(f"Job #{job_id} is not in the queue.")
+        return
+    if job["state"] in (QUEUED, RUNNING):
+        poll_queued_job(job_id)
+        return
+
+    st.markdown(f"#### Queued Job #{job_id}: {job['job_name']}")
+    if job["log_path"]:
+        with st.expander("Show Command Output 📄", expanded=False):
+            st.code(read_log_tail(job["log_path"]))
+    if job["state"] == DONE:
+        show_results(json.loads(job["command_args"])["af_output_path"], job["job_name"])
+    elif job["state"] == FAILED:
+        st.error(f"The job failed (exit code {job['returncode']}). Please check the output above.")
+    elif job["state"] == CANCELLED:
+        st.warning("The job was cancelled.")
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def poll_queued_job(job_id):
+    """Refreshes a queued job's position, state and log tail."""
+    job_queue = get_job_queue()
+    job = job_queue.get(job_id)
+    if job["state"] not in (QUEUED, RUNNING):
+        st.rerun()
+    st.markdown(f"#### Queued Job #{job_id}: {job['job_name']}")
+    if job["state"] == QUEUED:
+        st.info(f"Waiting in the queue, position {job_queue.position(job_id)}.")
+    else:
+        started = time.strftime('%H:%M:%S', time.localtime(job['started_at']))
+        st.info(f"Running on GPU {job['device']} since {started}.")
+        if job["log_path"]:
+            st.code(read_log_tail(job["log_path"], max_lines=50))
+    if st.button("Cancel Job ✖️"):
+        job_queue.cancel(job_id)
+        st.rerun()
+
+def run_on_warm_worker(job_name, af_input_path, af_output_path, model_parameters_dir,
+                       databases_dir, run_data_pipeline, bucket_sizes, placeholder, log_path):
+    """
+    Runs the job with inference on the shared warm worker.
+
+    The data pipeline, if requested, still runs in its own CPU-only container
+    and hands its data JSON to the worker. Returns the command output, or
+    None if the worker is unavailable and the job should run in a fresh
+    container instead. Container output is appended to ``log_path``.
+    """
+    worker = get_warm_inference_worker(af_input_path, af_output_path, model_parameters_dir, tuple(bucket_sizes))
+    try:
+        worker.start()
+    except InferenceWorkerError as e:
+        st.warning(f"Warm inference worker unavailable, running a fresh container instead: {e}")
+        logger.warning(f"Warm inference worker unavailable: {e}")
+        return None
+
+    output = ""
+    json_path = os.path.join(af_input_path, "fold_input.json")
+    if run_data_pipeline:
+        pipeline_command = build_docker_command(
+            af_input_path,
+            af_input_path,
+            model_parameters_dir,
+            databases_dir,
+            run_data_pipeline=True,
+            run_inference=False,
+            gpus=None,
+        )
+        logger.debug(f"Data pipeline command: {pipeline_command}")
+        output = run_alphafold(pipeline_command, placeholder=placeholder, log_path=log_path).tail
+        json_path = find_data_json(af_input_path, job_name)
+        if json_path is None:
+            st.error("The data pipeline did not produce a data JSON.")
+            logger.error("Data pipeline produced no data JSON.")
+            return output
+
+    output_folder_path = os.path.join(af_output_path, sanitize_job_name(job_name))
+    try:
+        response = worker.run(json_path, output_folder_path)
+    except InferenceWorkerError as e:
+        st.warning(f"Warm inference worker stopped, running inference in a fresh container instead: {e}")
+        logger.warning(f"Warm inference worker stopped: {e}")
+        relative_json_path = os.path.relpath(json_path, af_input_path)
+        inference_command = build_docker_command(
+            af_input_path,
+            af_output_path,
+            model_parameters_dir,
+            databases_dir,
+            json_path=f"/root/af_input/{relative_json_path}",
+            run_data_pipeline=False,
+            run_inference=True,
+            bucket_sizes=bucket_sizes,
+        )
+        return output + run_alphafold(inference_command, placeholder=placeholder, log_path=log_path).tail
+
+    logger.info(f"Warm inference worker response: {response}")
+    return output + f"Warm inference worker: {json.dumps(response)}\n"
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,236 @@
+# afusion/async_api.py
+
+import asyncio
+import collections
+import contextlib
+import os
+import time
+from afusion.api import pipeline_data_json, run_status, save_task_json
+from afusion.execution import build_docker_command, run_alphafold_async
+from afusion.input_files import BATCH_FILES_FOLDER
+from afusion.progress import ProgressParser
+from afusion.retry import classify_failure
+from loguru import logger
+
+async def stream_batch_predictions(
+    tasks,
+    af_input_base_path,
+    af_output_base_path,
+    model_parameters_dir,
+    databases_dir,
+    run_data_pipeline=True,
+    run_inference=True,
+    bucket_sizes=None,
+    max_concurrent_jobs=1,
+    split_stages=False,
+    max_concurrent_inference=1,
+    max_queued_events=1000,
+):
+    """
+    Runs batch predictions as asyncio subprocesses and yields per-job events.
+
+    This is the asyncio counterpart of :func:`afusion.api.run_batch_predictions`.
+    Up to ``max_concurrent_jobs`` containers run at once, and no thread is
+    tied up per job. Every event is a dict with keys 'event', 'job_name' and
+    'time', plus:
+
+    - ``started``: the job's input JSON was written and it is waiting to run.
+    - ``stage_start`` and ``stage_end``: the events of an
+      :class:`afusion.progress.ProgressParser` fed with the job's output,
+      with 'stage', 'detail' and, for ends, 'seconds', as soon as the line
+      that produced them is read.
+    - ``log``: 'stage' (the stage running, or the stage of the container
+      before its first stage line) and 'line', one per line of AlphaFold output.
+    - ``finished``: 'status', 'output_folder', 'returncode' and
+      'stage_timings', with the same status values and timings as
+      run_batch_predictions.
+
+    With ``split_stages=True`` (and both stages enabled) each job runs a
+    CPU-only data pipeline container followed by a GPU inference container.
+    Up to ``max_concurrent_jobs`` data pipelines run at once, but only
+    ``max_concurrent_inference`` inference containers, so upcoming jobs
+    search their MSAs while earlier ones hold the GPU.
+
+    Events are buffered in a queue of ``max_queued_events``; a consumer that
+    falls behind slows the jobs' output reading rather than growing memory.
+    Closing the generator early (or cancelling the task consuming it) stops
+    all running containers.
+
+    Example::
+
+        async for event in stream_batch_predictions(tasks, ...):
+            if event['event'] == 'finished':
+                print(event['job_name'], event['status'])
+
+    :param tasks: Task dicts, as generated by create_batch_task. An
+        iterator (e.g. :func:`afusion.api.iter_tasks_from_file`) is read
+        only as jobs can be started.
+    :type tasks: iterable of dict
+    :param af_input_base_path: Base path for AlphaFold input.
+    :type af_input_base_path: str
+    :param af_output_base_path: Base path for AlphaFold output.
+    :type af_output_base_path: str
+    :param model_parameters_dir: Path to model parameters directory.
+    :type model_parameters_dir: str
+    :param databases_dir: Path to databases directory.
+    :type databases_dir: str
+    :param run_data_pipeline: Whether to run data pipeline.
+    :type run_data_pipeline: bool
+    :param run_inference: Whether to run inference.
+    :type run_inference: bool
+    :param bucket_sizes: Optional list of bucket sizes.
+    :type bucket_sizes: list of int, optional
+    :param max_concurrent_jobs: Number of jobs (or data pipelines, with
+        ``split_stages``) to run at the same time.
+    :type max_concurrent_jobs: int
+    :param split_stages: Whether to run the data pipeline and inference in
+        separate containers with separate limits.
+    :type split_stages: bool
+    :param max_concurrent_inference: Number of inference containers to run
+        at the same time with ``split_stages``.
+    :type max_concurrent_inference: int
+    :param max_queued_events: Number of events buffered for the consumer.
+    :type max_queued_events: int
+    :return: Async iterator of event dicts.
+    """
+    os.makedirs(af_output_base_path, exist_ok=True)
+    events = asyncio.Queue(maxsize=max_queued_events)
+    job_slots = asyncio.Semaphore(max_concurrent_jobs)
+    inference_slots = asyncio.Semaphore(max_concurrent_inference)
+    split_stages = split_stages and run_data_pipeline and run_inference
+
+    async def emit(job_name, event, **fields):
+        await events.put(dict(fields, event=event, job_name=job_name, time=time.time()))
+
+    async def run_container(job_name, docker_command, stage, progress):
+        """Runs one container; returns its exit code and failure class."""
+        tail = collections.deque(maxlen=200)
+
+        async def emit_progress(progress_events):
+            for progress_event in progress_events:
+                await events.put(dict(progress_event, job_name=job_name))
+
+        async def on_line(line):
+            await emit_progress(progress.feed(line))
+            tail.append(line)
+            current = progress.current_stage()
+            await emit(job_name, 'log', stage=current[0] if current else stage, line=line.rstrip('\n'))
+
+        logger.debug(f"Running Docker command for job '{job_name}': {docker_command}")
+        try:
+            returncode = await run_alphafold_async(docker_command, on_line=on_line)
+        except BaseException:
+            progress.finish()
+            raise
+        await emit_progress(progress.finish())
+        return returncode, classify_failure(returncode, ''.join(tail))
+
+    async def run_job(task):
+        job_name = task['name']
+        input_path = os.path.join(af_input_base_path, job_name)
+        returncode = None
+        progress = ProgressParser()
+        try:
+            # Writing the JSON and its input files is blocking file I/O.
+            await asyncio.to_thread(save_task_json, task, input_path,
+                                    files_dir=os.path.join(af_input_base_path, BATCH_FILES_FOLDER))
+        except Exception as e:
+            logger.error(f"Error saving JSON file for job '{job_name}': {e}")
+            await emit(job_name, 'finished', status=f'Failed to save JSON: {e}',
+                       output_folder=af_output_base_path, returncode=None, stage_timings={})
+            return
+        await emit(job_name, 'started')
+
+        try:
+            if split_stages:
+                async with job_slots:
+                    # As in pipelined run_batch_predictions, the data JSON is
+                    # written into the input folder for the inference container.
+                    returncode, failure = await run_container(job_name, build_docker_command(
+                        input_path,
+                        input_path,
+                        model_parameters_dir,
+                        databases_dir,
+                        run_data_pipeline=True,
+                        run_inference=False,
+                        gpus=None,
+                    ), 'data_pipeline', progress)
+                data_json_path, status = pipeline_data_json(job_name, returncode, input_path, failure)
+                if data_json_path is not None:
+                    relative_json_path = os.path.relpath(data_json_path, input_path)
+                    async with inference_slots:
+                        returncode, failure = await run_container(job_name, build_docker_command(
+                            input_path,
+                            af_output_base_path,
+                            model_parameters_dir,
+                            databases_dir,
+                            json_path=f"/root/af_input/{relative_json_path}",
+                            run_data_pipeline=False,
+                            run_inference=True,
+                            bucket_sizes=bucket_sizes,
+                        ), 'inference', progress)
+                    status = run_status(job_name, returncode, af_output_base_path, failure)
+            else:
+                async with job_slots:
+                    returncode, failure = await run_container(job_name, build_docker_command(
+                        input_path,
+                        af_output_base_path,
+                        model_parameters_dir,
+                        databases_dir,
+                        run_data_pipeline=run_data_pipeline,
+                        run_inference=run_inference,
+                        bucket_sizes=bucket_sizes,
+                    ), 'data_pipeline' if run_data_pipeline else 'inference', progress)
+                status = run_status(job_name, returncode, af_output_base_path, failure)
+        except Exception as e:
+            logger.error(f"Error running AlphaFold for job '{job_name}': {e}")
+            status = f'Failed to run AlphaFold: {e}'
+
+        logger.info(f"Job '{job_name}' finished: {status}")
+        await emit(job_name, 'finished', status=status, output_folder=af_output_base_path, returncode=returncode,
+                   stage_timings=progress.timings())
+
+    # Jobs are admitted as running ones finish, so a large iterator of tasks
+    # is read lazily; with split_stages, jobs waiting for inference count too.
+    admission = asyncio.Semaphore(max_concurrent_jobs + (max_concurrent_inference if split_stages else 0))
+    job_tasks = set()
+    admission_state = {'admitted': 0, 'done': False, 'error': None}
+
+    def job_done(job_task):
+        job_tasks.discard(job_task)
+        admission.release()
+
+    async def admit_jobs():
+        try:
+            for task in tasks:
+                await admission.acquire()
+                job_task = asyncio.ensure_future(run_job(task))
+                job_tasks.add(job_task)
+                job_task.add_done_callback(job_done)
+                admission_state['admitted'] += 1
+        except Exception as e:
+            admission_state['error'] = e
+        finally:
+            # Wakes the consumer up to notice that no more jobs are coming.
+            admission_state['done'] = True
+            await events.put(None)
+
+    # run_job handles its own errors, so every job ends with a 'finished' event.
+    producer = asyncio.ensure_future(admit_jobs())
+    finished = 0
+    try:
+        while not admission_state['done'] or finished < admission_state['admitted']:
+            event = await events.get()
+            if event is None:
+                if admission_state['error'] is not None:
+                    raise admission_state['error']
+                continue
+            if event['event'] == 'finished':
+                finished += 1
+            yield event
+    finally:
+        producer.cancel()
+        for job_task in list(job_tasks):
+            job_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await asyncio.gather(producer, *job_tasks, return_exceptions=True)
@@ -0,0 +1,186 @@
+# afusion/background.py
+
+import json
+import os
+import signal
+import subprocess
+import time
+import uuid
+from afusion.execution import name_container, stop_container
+from afusion.job_queue import CANCELLED, DONE, FAILED, RUNNING
+from loguru import logger
+
+# The job's process is gone without having recorded an exit code, e.g.
+# because the host rebooted.
+LOST = 'lost'
+
+DEFAULT_JOBS_DIR = os.path.expanduser("~/.afusion/jobs")
+
+_JOB_FILE = 'job.json'
+_SCRIPT_FILE = 'run.sh'
+_LOG_FILE = 'output.log'
+_EXIT_CODE_FILE = 'exit_code'
+_CANCELLED_FILE = 'cancelled'
+
+
+def start_background_job(command, job_name, af_output_path, jobs_dir=DEFAULT_JOBS_DIR):
+    """
+    Starts an AlphaFold 3 command in a detached process and returns at once.
+
+    The command runs in its own session, so it keeps running when the
+    Streamlit script run, the browser session or the Streamlit server goes
+    away. Everything about the job lives in ``<jobs_dir>/<job id>``: the
+    command's output in ``output.log`` and, once it exits, its exit code in
+    ``exit_code``. Any process that knows the job id can follow it with
+    :func:`background_job_status` and :func:`read_log_tail`.
+
+    :param command: Shell command to run, e.g. from build_docker_command.
+    :type command: str
+    :param job_name: Name of the job, for display.
+    :type job_name: str
+    :param af_output_path: Base output path of the job, so its results can be
+        found after reattaching.
+    :type af_output_path: str
+    :param jobs_dir: Directory holding the background jobs.
+    :type jobs_dir: str
+    :return: The job id.
+    :rtype: str
+    """
+    job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    # Named, so cancelling can stop the container and not just the docker run client.
+    command, container_name = name_container(command)
+    job_dir = os.path.join(jobs_dir, job_id)
+    os.makedirs(job_dir)
+    with open(os.path.join(job_dir, _SCRIPT_FILE), 'w') as script_file:
+        script_file.write(command + "\n")
+
+    # The subshell is left running when the launching shell exits, so it is
+    # re-parented to init and never becomes a zombie of the Streamlit server.
+    # The exit code is renamed into place so readers never see a partial file.
+    wrapper = (
+        f"(sh {_SCRIPT_FILE} > {_LOG_FILE} 2>&1; echo $? > {_EXIT_CODE_FILE}.tmp; "
+        f"mv {_EXIT_CODE_FILE}.tmp {_EXIT_CODE_FILE}) &"
+    )
+    launcher = subprocess.Popen(
+        ['/bin/sh', '-c', wrapper],
+        cwd=job_dir,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    launcher.wait()
+
+    with open(os.path.join(job_dir, _JOB_FILE), 'w') as job_file:
+        json.dump({
+            'job_id': job_id,
+            'job_name': job_name,
+            'af_output_path': af_output_path,
+            'command': command,
+            # The launcher's pid is the id of the job's process group.
+            'process_group': launcher.pid,
+            'container_name': container_name,
+            'started_at': time.time(),
+        }, job_file)
+    logger.info(f"Started background job {job_id} for '{job_name}': {command}")
+    return job_id
+
+
+def background_job_status(job_id, jobs_dir=DEFAULT_JOBS_DIR):
+    """
+    Looks up a background job.
+
+    :param job_id: The id returned by start_background_job.
+    :type job_id: str
+    :param jobs_dir: Directory holding the background jobs.
+    :type jobs_dir: str
+    :return: The job's details with 'state' ('running', 'done', 'failed',
+        'cancelled' or 'lost'), 'returncode' and 'log_path', or None for an
+        unknown job.
+    :rtype: dict or None
+    """
+    job_dir = os.path.join(jobs_dir, os.path.basename(job_id))
+    try:
+        with open(os.path.join(job_dir, _JOB_FILE)) as job_file:
+            job = json.load(job_file)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+    job['log_path'] = os.path.join(job_dir, _LOG_FILE)
+    job['returncode'] = None
+    cancelled = os.path.exists(os.path.join(job_dir, _CANCELLED_FILE))
+    try:
+        with open(os.path.join(job_dir, _EXIT_CODE_FILE)) as exit_code_file:
+            job['returncode'] = int(exit_code_file.read().strip())
+    except (OSError, ValueError):
+        if _process_group_alive(job['process_group']):
+            job['state'] = RUNNING
+        else:
+            job['state'] = CANCELLED if cancelled else LOST
+        return job
+
+    if cancelled:
+        job['state'] = CANCELLED
+    else:
+        job['state'] = DONE if job['returncode'] == 0 else FAILED
+    return job
+
+
+def cancel_background_job(job_id, jobs_dir=DEFAULT_JOBS_DIR):
+    """
+    Stops a running background job: its container with ``docker stop``,
+    then the shell that started it.
+
+    :return: False if the job was not running.
+    :rtype: bool
+    """
+    job = background_job_status(job_id, jobs_dir)
+    if job is None or job['state'] != RUNNING:
+        return False
+    open(os.path.join(jobs_dir, os.path.basename(job_id), _CANCELLED_FILE), 'w').close()
+    if job.get('container_name'):
+        stop_container(job['container_name'])
+    try:
+        os.killpg(job['process_group'], signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    logger.info(f"Cancelled background job {job_id}.")
+    return True
+
+
+def read_log_tail(log_path, max_lines=200, max_bytes=65536):
+    """
+    Returns the last lines of a log file without reading the whole file.
+
+    :param log_path: Path of the log file.
+    :type log_path: str
+    :param max_lines: Maximum number of lines to return.
+    :type max_lines: int
+    :param max_bytes: Maximum number of bytes to read from the end.
+    :type max_bytes: int
+    :return: The tail, or an empty string if the file does not exist yet.
+    :rtype: str
+    """
+    try:
+        with open(log_path, 'rb') as log_file:
+            log_file.seek(0, os.SEEK_END)
+            size = log_file.tell()
+            log_file.seek(max(0, size - max_bytes))
+            data = log_file.read()
+    except FileNotFoundError:
+        return ''
+    lines = data.decode(errors='replace').splitlines(keepends=True)
+    if size > max_bytes and lines:
+        # The first line was cut by the seek.
+        lines = lines[1:]
+    return ''.join(lines[-max_lines:])
+
+
+def _process_group_alive(process_group):
+    try:
+        os.killpg(process_group, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
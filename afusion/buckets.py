@@ -0,0 +1,154 @@
+# afusion/buckets.py
+
+import collections
+import re
+from loguru import logger
+
+# AlphaFold 3's default compilation buckets (run_alphafold.py --buckets).
+DEFAULT_BUCKETS = (256, 512, 768, 1024, 1280, 1536, 2048, 2560, 3072, 3584, 4096, 4608, 5120)
+
+# Heavy-atom counts of common CCD components. Ligands and modified residues
+# are tokenized per atom, so these decide their token counts.
+CCD_ATOM_COUNTS = {
+    # Single-atom ions
+    'MG': 1, 'ZN': 1, 'CA': 1, 'NA': 1, 'K': 1, 'CL': 1, 'MN': 1, 'FE': 1, 'FE2': 1,
+    'CU': 1, 'CU1': 1, 'CO': 1, 'NI': 1, 'CD': 1, 'IOD': 1, 'BR': 1, 'HG': 1, 'SR': 1,
+    # Common ligands and buffer components
+    'ATP': 31, 'ADP': 27, 'AMP': 23, 'ANP': 31, 'GTP': 32, 'GDP': 28, 'GNP': 32,
+    'NAD': 44, 'NAP': 48, 'FAD': 53, 'FMN': 31, 'SAM': 27, 'SAH': 26, 'COA': 48,
+    'HEM': 43, 'PLP': 15, 'SO4': 5, 'PO4': 5, 'GOL': 6, 'EDO': 4, 'ACT': 4, 'PEG': 7,
+    # Modified residues
+    'SEP': 10, 'TPO': 11, 'PTR': 16, 'MLY': 11, 'M3L': 12, 'ALY': 12, 'HYP': 8,
+    'MSE': 8, 'CSO': 7, 'NEP': 14, 'HIP': 14, '5MC': 21, '6MA': 23, 'PSU': 20,
+}
+DEFAULT_CCD_ATOM_COUNT = 30
+DEFAULT_MODIFIED_RESIDUE_ATOM_COUNT = 12
+
+_SMILES_ATOM = re.compile(r"\[([^\]]+)\]|Br|Cl|[BCNOPSFIbcnops]")
+
+
+def count_smiles_heavy_atoms(smiles):
+    """
+    Counts the heavy atoms in a SMILES string without a chemistry toolkit.
+
+    :param smiles: SMILES string.
+    :type smiles: str
+    :rtype: int
+    """
+    count = 0
+    for match in _SMILES_ATOM.finditer(smiles):
+        bracket_atom = match.group(1)
+        if bracket_atom is not None and re.fullmatch(r"\d*H\d*[+-]*\d*", bracket_atom):
+            continue  # Explicit hydrogen
+        count += 1
+    return count
+
+
+def count_tokens(task, ccd_atom_counts=None):
+    """
+    Estimates the number of AlphaFold 3 tokens in a task.
+
+    Standard residues and nucleotides are one token each. Ligands and
+    modified residues are one token per heavy atom, looked up in
+    :data:`CCD_ATOM_COUNTS` (or counted from SMILES), with a default for
+    unknown CCD codes. Every copy listed in an entity's ``id`` counts.
+
+    :param task: Task dict, as generated by create_batch_task.
+    :type task: dict
+    :param ccd_atom_counts: Extra or overriding CCD heavy-atom counts.
+    :type ccd_atom_counts: dict, optional
+    :return: Estimated token count.
+    :rtype: int
+    """
+    atom_counts = dict(CCD_ATOM_COUNTS, **(ccd_atom_counts or {}))
+    total = 0
+    for sequence_entry in task.get('sequences', []):
+        for entity_type, chain in sequence_entry.items():
+            if entity_type == 'ligand':
+                if chain.get('smiles'):
+                    tokens = count_smiles_heavy_atoms(chain['smiles'])
+                else:
+                    tokens = sum(atom_counts.get(code, DEFAULT_CCD_ATOM_COUNT) for code in chain.get('ccdCodes', []))
+            else:
+                tokens = len(chain.get('sequence', ''))
+                for modification in chain.get('modifications') or []:
+                    code = modification.get('ptmType') or modification.get('modificationType')
+                    # The modified residue's single token is replaced by one per atom.
+                    tokens += atom_counts.get(code, DEFAULT_MODIFIED_RESIDUE_ATOM_COUNT) - 1
+            chain_ids = chain.get('id')
+            copies = len(chain_ids) if isinstance(chain_ids, list) else 1
+            total += tokens * copies
+    return total
+
+
+def predict_bucket(num_tokens, bucket_sizes=None):
+    """
+    Returns the padded size AlphaFold 3 compiles a task for.
+
+    Tasks larger than the largest bucket are not padded, so they compile
+    for their exact token count.
+
+    :param num_tokens: Token count of the task.
+    :type num_tokens: int
+    :param bucket_sizes: Bucket sizes; defaults to :data:`DEFAULT_BUCKETS`.
+    :type bucket_sizes: list of int, optional
+    :rtype: int
+    """
+    for bucket in sorted(bucket_sizes or DEFAULT_BUCKETS):
+        if num_tokens <= bucket:
+            return bucket
+    return num_tokens
+
+
+def plan_bucket_order(tasks, bucket_sizes=None, ccd_atom_counts=None):
+    """
+    Orders tasks so that all tasks of one compilation bucket run back to back.
+
+    Recompiles are counted as bucket changes between consecutive tasks, which
+    is what a process that keeps its current compiled model pays. The order
+    within a bucket, and the order of the buckets, follow the input.
+
+    :param tasks: Task dicts, as generated by create_batch_task.
+    :type tasks: list of dict
+    :param bucket_sizes: Bucket sizes; defaults to :data:`DEFAULT_BUCKETS`.
+    :type bucket_sizes: list of int, optional
+    :param ccd_atom_counts: Extra or overriding CCD heavy-atom counts.
+    :type ccd_atom_counts: dict, optional
+    :return: The reordered tasks, a list of dicts with keys 'job_name',
+        'num_tokens' and 'bucket' in the new order, and a summary dict with
+        keys 'buckets', 'recompiles_before', 'recompiles_after' and
+        'recompiles_avoided'.
+    :rtype: tuple of (list of dict, list of dict, dict)
+    """
+    tasks = list(tasks)
+    plan = []
+    for task in tasks:
+        num_tokens = count_tokens(task, ccd_atom_counts)
+        plan.append({
+            'job_name': task['name'],
+            'num_tokens': num_tokens,
+            'bucket': predict_bucket(num_tokens, bucket_sizes),
+        })
+
+    bucket_order = list(dict.fromkeys(entry['bucket'] for entry in plan))
+    bucket_rank = {bucket: rank for rank, bucket in enumerate(bucket_order)}
+    order = sorted(range(len(tasks)), key=lambda i: bucket_rank[plan[i]['bucket']])
+
+    recompiles_before = _count_bucket_changes([entry['bucket'] for entry in plan])
+    recompiles_after = len(bucket_order)
+    bucket_counts = collections.Counter(entry['bucket'] for entry in plan)
+    summary = {
+        'buckets': {bucket: bucket_counts[bucket] for bucket in bucket_order},
+        'recompiles_before': recompiles_before,
+        'recompiles_after': recompiles_after,
+        'recompiles_avoided': recompiles_before - recompiles_after,
+    }
+    logger.info(
+        f"Bucket ordering: {len(tasks)} tasks in {recompiles_after} buckets, "
+        f"{summary['recompiles_avoided']} recompiles avoided ({recompiles_before} -> {recompiles_after})."
+    )
+    return [tasks[i] for i in order], [plan[i] for i in order], summary
+
+
+def _count_bucket_changes(buckets):
+    return sum(1 for i, bucket in enumerate(buckets) if i == 0 or bucket != buckets[i - 1])
@@ -38,6 +38,66 @@ def main():
         help='Path to the AlphaFold 3 output directory for visualization'
     )
 
+    # 'queue' sub-command: shared-directory work queue for multi-host batches
+    queue_parser = subparsers.add_parser(
+        'queue',
+        help='Submit to, work on, or inspect a shared batch work queue'
+    )
+    queue_parser.add_argument('action', choices=['submit', 'work', 'status'])
+    queue_parser.add_argument('--queue_dir', required=True, help='Shared directory holding the queue')
+    queue_parser.add_argument('--batch_file', help='CSV, Parquet or FASTA batch file to submit')
+    add_fasta_arguments(queue_parser)
+    queue_parser.add_argument('--af_input_base_path', help='Base path for AlphaFold input')
+    queue_parser.add_argument('--af_output_base_path', help='Base path for AlphaFold output')
+    queue_parser.add_argument('--model_parameters_dir', help='Path to model parameters directory')
+    queue_parser.add_argument('--databases_dir', help='Path to databases directory')
+    queue_parser.add_argument('--gpu_devices', help="Comma-separated GPU ids, or 'auto'; work runs one task on each at a time")
+    queue_parser.add_argument('--lease_seconds', type=float, default=600)
+    queue_parser.add_argument('--poll_interval', type=float, default=30)
+    queue_parser.add_argument(
+        '--profile_resources',
+        action='store_true',
+        help='Sample CPU, memory, disk I/O and GPU memory of every job'
+    )
+    queue_parser.add_argument('--metrics_file', help='Write Prometheus metrics to this file after every job')
+    queue_parser.add_argument(
+        '--max_attempts',
+        type=int,
+        default=None,
+        help='Runs per container before a job fails (3 if any retry option is given); failures are retried by class'
+    )
+    queue_parser.add_argument(
+        '--stage_timeouts',
+        default=None,
+        help="Seconds per stage before a run is stopped, e.g. 'data_pipeline=14400,inference=3600,total=21600'"
+    )
+    queue_parser.add_argument(
+        '--large_gpu_devices',
+        default=None,
+        help='Comma-separated GPU ids that jobs running out of GPU memory are requeued onto'
+    )
+
+    # 'queue-daemon' sub-command: runs GUI submissions from the shared job queue
+    daemon_parser = subparsers.add_parser(
+        'queue-daemon',
+        help='Run jobs submitted to the shared job queue from the GUI'
+    )
+    daemon_parser.add_argument('--queue_path', default=None, help='Path of the job queue database')
+    daemon_parser.add_argument(
+        '--device_limits',
+        default=None,
+        help="Jobs allowed at once per GPU, e.g. '0=1,1=2'; defaults to one job on every GPU found"
+    )
+    daemon_parser.add_argument('--poll_interval', type=float, default=2.0)
+
+    # 'validate' sub-command: checks a batch file before it is submitted
+    validate_parser = subparsers.add_parser(
+        'validate',
+        help='Check the tasks of a batch file for errors AlphaFold 3 would reject'
+    )
+    validate_parser.add_argument('--batch_file', required=True, help='CSV, Parquet or FASTA batch file to check')
+    add_fasta_arguments(validate_parser)
+
     # Parse the command-line arguments
     args = parser.parse_args()
 
@@ -91,9 +151,96 @@ def main():
 
         os.execvp('streamlit', streamlit_command)
 
+    elif args.command == 'queue':
+        run_queue_command(queue_parser, args)
+
+    elif args.command == 'validate':
+        from afusion.api import iter_tasks_from_file
+        from afusion.validation import format_report, normalize_task, validate_tasks
+
+        # Normalized as run_batch_predictions does, so only what it would reject is reported.
+        tasks = [normalize_task(task) for task in iter_tasks_from_file(args.batch_file, fasta_options=fasta_options(args))]
+        report = validate_tasks(tasks)
+        if report:
+            print(format_report(report))
+        print(f"{len(tasks) - len(report)} of {len(tasks)} tasks are valid.")
+        sys.exit(1 if report else 0)
+
+    elif args.command == 'queue-daemon':
+        from afusion.job_queue import DEFAULT_QUEUE_PATH, JobQueue, JobQueueDaemon
+
+        device_limits = None
+        if args.device_limits:
+            device_limits = dict(item.split('=') for item in args.device_limits.split(','))
+        daemon = JobQueueDaemon(
+            JobQueue(args.queue_path or DEFAULT_QUEUE_PATH),
+            device_limits=device_limits,
+            poll_interval=args.poll_interval,
+        )
+        try:
+            daemon.run_forever()
+        except KeyboardInterrupt:
+            pass
+
     else:
         # Handle other commands or display help information
         parser.print_help()
 
+def add_fasta_arguments(parser):
+    parser.add_argument(
+        '--group_size',
+        type=int,
+        default=1,
+        help='FASTA batch files: consecutive records per complex (records with chains separated by ":" are complexes too)'
+    )
+    parser.add_argument('--msa_dir', default=None, help='FASTA batch files: directory with precomputed <record id>.a3m alignments')
+    parser.add_argument('--entity_type', default='protein', choices=['protein', 'rna', 'dna'], help='FASTA batch files: type of every chain')
+
+def fasta_options(args):
+    return {'group_size': args.group_size, 'msa_dir': args.msa_dir, 'entity_type': args.entity_type}
+
+def run_queue_command(queue_parser, args):
+    from afusion.api import iter_tasks_from_file
+    from afusion.profiling import ResourceProfiler
+    from afusion.retry import RetryPolicy
+    from afusion.work_queue import FileWorkQueue, run_queue_worker
+
+    if args.action == 'submit':
+        if not args.batch_file:
+            queue_parser.error('submit needs --batch_file')
+        FileWorkQueue(args.queue_dir).submit(iter_tasks_from_file(args.batch_file, fasta_options=fasta_options(args)))
+
+    elif args.action == 'work':
+        paths = ['af_input_base_path', 'af_output_base_path', 'model_parameters_dir', 'databases_dir']
+        missing = [f'--{name}' for name in paths if not getattr(args, name)]
+        if missing:
+            queue_parser.error(f"work needs {', '.join(missing)}")
+        gpu_devices = args.gpu_devices
+        if gpu_devices and gpu_devices != 'auto':
+            gpu_devices = gpu_devices.split(',')
+        retry_options = {}
+        if args.max_attempts:
+            retry_options['max_attempts'] = args.max_attempts
+        if args.stage_timeouts:
+            retry_options['stage_timeouts'] = {
+                stage: float(seconds) for stage, seconds in (item.split('=') for item in args.stage_timeouts.split(','))
+            }
+        if args.large_gpu_devices:
+            retry_options['large_gpu_devices'] = args.large_gpu_devices.split(',')
+        retry_policy = RetryPolicy(**retry_options) if retry_options else None
+        run_queue_worker(
+            args.queue_dir,
+            *(getattr(args, name) for name in paths),
+            lease_seconds=args.lease_seconds,
+            poll_interval=args.poll_interval,
+            gpu_devices=gpu_devices,
+            resource_profiler=ResourceProfiler() if args.profile_resources else None,
+            metrics_path=args.metrics_file,
+            retry_policy=retry_policy,
+        )
+
+    elif args.action == 'status':
+        print(FileWorkQueue(args.queue_dir).status())
+
 if __name__ == '__main__':
     main()
@@ -1,22 +1,233 @@
 # afusion/execution.py
 
+import asyncio
+import collections
+import os
+import re
+import shlex
+import signal
 import subprocess
+import tempfile
+import time
+import uuid
 from loguru import logger
 
-def run_alphafold(command, placeholder=None):
+def build_docker_command(
+    af_input_path,
+    af_output_path,
+    model_parameters_dir,
+    databases_dir,
+    json_path="/root/af_input/fold_input.json",
+    run_data_pipeline=True,
+    run_inference=True,
+    bucket_sizes=None,
+    gpus="all",
+    docker_image="alphafold3",
+    cpuset_cpus=None,
+    memory=None,
+    n_cpu=None,
+):
     """
-    Runs the AlphaFold Docker command and captures output.
-    Uses placeholder to update output in real-time if provided.
+    Builds the ``docker run`` command for a single AlphaFold 3 invocation.
+
+    Both stage flags are always passed explicitly because AlphaFold 3 enables
+    the data pipeline and inference by default. ``gpus=None`` omits the
+    ``--gpus`` option, which is what CPU-only data pipeline runs want.
+    ``cpuset_cpus`` and ``memory`` cap the container, and ``n_cpu`` is passed
+    to jackhmmer and nhmmer so the searches stay within that budget.
+    ``--init`` runs a minimal init as the container's PID 1, so the SIGTERM
+    of ``docker stop`` reaches ``run_alphafold.py``, which has no handler of
+    its own and would ignore it as PID 1.
     """
-    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, shell=True)
-    output_lines = []
-    for line in iter(process.stdout.readline, ''):
-        if line:
-            output_lines.append(line)
-            logger.debug(line.strip())
-            # Update placeholder if provided
-            if placeholder is not None:
-                placeholder.markdown(f"```\n{''.join(output_lines)}\n```")
+    gpus_option = f"--gpus {gpus} " if gpus else ""
+    cpuset_option = f"--cpuset-cpus {cpuset_cpus} " if cpuset_cpus else ""
+    memory_option = f"--memory {memory} " if memory else ""
+    n_cpu_option = f"--jackhmmer_n_cpu={n_cpu} --nhmmer_n_cpu={n_cpu} " if n_cpu else ""
+    buckets_option = f"--buckets {','.join(map(str, bucket_sizes))}" if bucket_sizes else ""
+    return (
+        f"docker run --rm --init "
+        f"--volume {shlex.quote(af_input_path)}:/root/af_input "
+        f"--volume {shlex.quote(af_output_path)}:/root/af_output "
+        f"--volume {shlex.quote(model_parameters_dir)}:/root/models "
+        f"--volume {shlex.quote(databases_dir)}:/root/public_databases "
+        f"{gpus_option}"
+        f"{cpuset_option}"
+        f"{memory_option}"
+        f"{docker_image} "
+        f"python run_alphafold.py "
+        f"--json_path={shlex.quote(json_path)} "
+        f"--model_dir=/root/models "
+        f"--output_dir=/root/af_output "
+        f"{'--run_data_pipeline' if run_data_pipeline else '--norun_data_pipeline'} "
+        f"{'--run_inference' if run_inference else '--norun_inference'} "
+        f"{n_cpu_option}"
+        f"{buckets_option}"
+    )
+
+# A --name option of a docker run command, replaced by name_container.
+_NAME_OPTION = re.compile(r'--name \S+ ')
+
+# Outcome of run_alphafold: where the full output went, its last lines and the exit code.
+AlphaFoldRun = collections.namedtuple('AlphaFoldRun', ['log_path', 'tail', 'returncode'])
+
+def run_alphafold(command, placeholder=None, log_path=None, tail_lines=200, update_interval=1.0, on_line=None,
+                  on_start=None):
+    """
+    Runs the AlphaFold Docker command, streaming its output to a log file.
+
+    Every line goes straight to ``log_path`` (appended, so several stages of
+    one job can share a log); only the last ``tail_lines`` lines are kept in
+    memory. If a placeholder is given, it shows that tail and is refreshed
+    at most every ``update_interval`` seconds, plus once at the end.
+    Without ``log_path`` the output goes to a new temporary file.
+    ``on_line``, if given, is called with each line as it arrives, e.g.
+    :meth:`afusion.progress.ProgressParser.feed`, and ``on_start`` with the
+    ``subprocess.Popen`` right after the command starts. The command runs
+    in its own session with a named container (see
+    :func:`start_container_process`) and is stopped with
+    :func:`stop_process_group` if reading its output is interrupted, e.g.
+    by Ctrl-C.
+
+    Returns an :class:`AlphaFoldRun` with the log path, the tail and the
+    exit code.
+    """
+    if log_path is None:
+        log_fd, log_path = tempfile.mkstemp(prefix="afusion-", suffix=".log")
+        os.close(log_fd)
+    tail = collections.deque(maxlen=tail_lines)
+    last_update = 0.0
+    process = start_container_process(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        if on_start is not None:
+            on_start(process)
+        with open(log_path, "a") as log_file:
+            for line in iter(process.stdout.readline, ''):
+                log_file.write(line)
+                tail.append(line)
+                logger.debug(line.strip())
+                if on_line is not None:
+                    on_line(line)
+                # Update placeholder if provided
+                if placeholder is not None and time.monotonic() - last_update >= update_interval:
+                    log_file.flush()
+                    placeholder.markdown(f"```\n{''.join(tail)}\n```")
+                    last_update = time.monotonic()
+    except BaseException:
+        # Ctrl-C no longer reaches the command's session directly.
+        stop_process_group(process)
+        raise
     process.stdout.close()
     process.wait()
-    return ''.join(output_lines)
+    if placeholder is not None:
+        placeholder.markdown(f"```\n{''.join(tail)}\n```")
+    return AlphaFoldRun(log_path, ''.join(tail), process.returncode)
+
+async def run_alphafold_async(command, on_line=None):
+    """
+    Runs the AlphaFold Docker command as an asyncio subprocess.
+
+    Each output line is passed to ``on_line`` (a coroutine function or plain
+    callable) as soon as it is read, instead of being collected. Cancelling
+    the coroutine stops the container with :func:`stop_container` and then
+    the ``docker run`` client's process group: SIGTERM first, then SIGKILL.
+    Returns the process exit code.
+    """
+    command, container_name = name_container(command)
+    process = await asyncio.create_subprocess_shell(
+        command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, start_new_session=True
+    )
+    try:
+        async for raw_line in process.stdout:
+            line = raw_line.decode(errors='replace')
+            logger.debug(line.strip())
+            if on_line is not None:
+                result = on_line(line)
+                if asyncio.iscoroutine(result):
+                    await result
+        return await process.wait()
+    except asyncio.CancelledError:
+        if container_name is not None:
+            await asyncio.to_thread(stop_container, container_name)
+        _signal_process_group(process, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            _signal_process_group(process, signal.SIGKILL)
+            await process.wait()
+        raise
+
+def name_container(command):
+    """
+    Gives the container of a ``docker run`` command a new unique name.
+
+    Signals to the ``docker run`` client do not reliably reach the
+    container, so containers are stopped by name (see :func:`stop_container`).
+    Every run gets its own name, so a retry never clashes with a container
+    of an earlier attempt that is still being removed.
+
+    :param command: Shell command, e.g. from :func:`build_docker_command`.
+    :type command: str
+    :return: The command with ``--name`` and the container name, or the
+        command unchanged and None if it does not start with ``docker run``.
+    :rtype: tuple
+    """
+    if not command.startswith('docker run '):
+        return command, None
+    container_name = f"afusion-{uuid.uuid4().hex[:12]}"
+    command = _NAME_OPTION.sub('', command)
+    return command.replace('docker run ', f'docker run --name {container_name} ', 1), container_name
+
+def start_container_process(command, **popen_options):
+    """
+    Starts a shell command in its own session, naming its container.
+
+    The returned ``subprocess.Popen`` has the name (see
+    :func:`name_container`) in its ``container_name`` attribute, which
+    :func:`stop_process_group` uses.
+
+    :param command: Shell command, e.g. from :func:`build_docker_command`.
+    :type command: str
+    :param popen_options: Further keyword arguments for ``subprocess.Popen``.
+    :rtype: subprocess.Popen
+    """
+    command, container_name = name_container(command)
+    # In its own session, so stop_process_group reaches docker run and not just the shell.
+    process = subprocess.Popen(command, shell=True, start_new_session=True, **popen_options)
+    process.container_name = container_name
+    return process
+
+def stop_container(container_name, grace=10):
+    """
+    Stops a container with ``docker stop``: SIGTERM, then SIGKILL if it is
+    still running ``grace`` seconds later. A container that is already gone
+    is ignored.
+    """
+    try:
+        subprocess.run(['docker', 'stop', '--time', str(int(grace)), container_name],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=grace + 60)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Could not stop container {container_name}: {e}")
+
+def stop_process_group(process, grace=10):
+    """
+    Stops a command started in its own session, with everything it started.
+
+    A container started with :func:`start_container_process` is stopped
+    first with :func:`stop_container`, as the container does not belong to
+    the session. Then the session gets SIGTERM and, if it is still running
+    ``grace`` seconds later, SIGKILL.
+    """
+    container_name = getattr(process, 'container_name', None)
+    if container_name is not None:
+        stop_container(container_name, grace)
+    _signal_process_group(process, signal.SIGTERM)
+    try:
+        process.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        _signal_process_group(process, signal.SIGKILL)
+
+def _signal_process_group(process, signum):
+    try:
+        os.killpg(process.pid, signum)
+    except ProcessLookupError:
+        pass
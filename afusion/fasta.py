@@ -0,0 +1,186 @@
+# afusion/fasta.py
+
+import collections
+import gzip
+import itertools
+import os
+import string
+from loguru import logger
+
+# One FASTA record: the first word of the header, the whole header and the sequence.
+FastaRecord = collections.namedtuple('FastaRecord', ['id', 'description', 'sequence'])
+
+FASTA_EXTENSIONS = ('.fasta', '.fa', '.faa', '.fna', '.fas')
+
+# Separates the chains of a complex inside one record, as in ColabFold's input files.
+CHAIN_SEPARATOR = ':'
+
+
+def iter_fasta_records(path):
+    """
+    Lazily reads the records of a (multi-)FASTA file, optionally gzipped.
+
+    Sequences are upper-cased with whitespace and a trailing stop codon
+    ('*') removed. Only the record being read is held in memory.
+
+    :param path: Path to a FASTA file; ``.gz`` files are decompressed on the fly.
+    :type path: str
+    :return: Generator of records, in file order.
+    :rtype: generator of FastaRecord
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as fasta_file:
+        description = None
+        lines = []
+        for line in fasta_file:
+            if line.startswith('>'):
+                if description is not None:
+                    yield _make_record(description, lines)
+                description = line[1:].strip()
+                lines = []
+            elif line.startswith(';'):
+                continue
+            elif description is not None:
+                lines.append(line.strip())
+            elif line.strip():
+                raise ValueError(f"{path} is not a FASTA file: sequence before the first '>' header")
+        if description is not None:
+            yield _make_record(description, lines)
+
+
+def iter_tasks_from_fasta(path, entity_type='protein', group_size=1, group_by=None, msa_dir=None,
+                          model_seeds=None, msa_option='auto', files_dir=None):
+    """
+    Lazily creates batch tasks from a multi-FASTA file.
+
+    By default every record becomes a single-chain task named after the
+    record's ID. Records are grouped into complexes in one of three ways:
+
+    - A record whose sequence has several chains separated by ':' (as in
+      ColabFold's input files) is one complex.
+    - ``group_size=N`` puts every N consecutive records into one task,
+      named after their IDs joined by '_'.
+    - ``group_by`` is called with each :class:`FastaRecord` and returns the
+      job name of its complex; consecutive records with the same name form
+      one task, e.g. ``group_by=lambda record: record.id.split('_')[0]``.
+
+    The chains of a task get the IDs A, B, ..., Z, AA, AB, ... in file
+    order, and identical consecutive chains become one entity with several
+    IDs. With ``msa_dir``, a record with a precomputed alignment named
+    ``<record ID>.a3m`` (or after the sanitized ID, as for job names) gets
+    it as ``unpairedMsaPath``, with an empty paired MSA and no templates,
+    so the data pipeline skips that chain; other chains use
+    ``msa_option``. Alignments are referenced, never read.
+
+    Tasks are yielded as soon as their last record has been read, so memory
+    use does not grow with the size of the file.
+
+    :param path: Path to a FASTA file, optionally gzipped.
+    :type path: str
+    :param entity_type: 'protein', 'rna' or 'dna'.
+    :type entity_type: str
+    :param group_size: Number of consecutive records per task.
+    :type group_size: int
+    :param group_by: Callable returning the job name of a record's complex;
+        overrides ``group_size``.
+    :type group_by: callable, optional
+    :param msa_dir: Directory with precomputed A3M alignments.
+    :type msa_dir: str, optional
+    :param model_seeds: Model seeds of every task. Defaults to [1].
+    :type model_seeds: list of int, optional
+    :param msa_option: MSA option for chains without an alignment, as for
+        :func:`afusion.api.create_protein_sequence_data`.
+    :type msa_option: str
+    :param files_dir: Directory for content-addressed input files, as for
+        :func:`afusion.api.create_tasks_from_dataframe`.
+    :type files_dir: str, optional
+    :return: Generator of task dictionaries.
+    :rtype: generator of dict
+    """
+    if entity_type not in ('protein', 'rna', 'dna'):
+        raise ValueError(f"Unsupported entity type for FASTA import: {entity_type}")
+    records = iter_fasta_records(path)
+    if group_by is not None:
+        groups = ((job_name, list(group)) for job_name, group in itertools.groupby(records, key=group_by))
+    elif group_size > 1:
+        groups = _fixed_size_groups(records, group_size)
+    else:
+        groups = ((record.id, [record]) for record in records)
+
+    for job_name, group in groups:
+        yield _create_task(job_name, group, entity_type, msa_dir, model_seeds or [1], msa_option, files_dir)
+
+
+def is_fasta_file(path):
+    """Returns whether a path looks like a FASTA file, by its extension."""
+    name = path.lower()
+    if name.endswith('.gz'):
+        name = name[:-len('.gz')]
+    return name.endswith(FASTA_EXTENSIONS)
+
+
+def chain_ids():
+    """Yields the chain IDs A, B, ..., Z, AA, AB, ..., ZZ, AAA, ..."""
+    for length in itertools.count(1):
+        for letters in itertools.product(string.ascii_uppercase, repeat=length):
+            yield ''.join(letters)
+
+
+def _make_record(description, lines):
+    sequence = ''.join(lines).replace(' ', '').upper().rstrip('*')
+    return FastaRecord(description.split(None, 1)[0] if description else '', description, sequence)
+
+
+def _fixed_size_groups(records, group_size):
+    while True:
+        group = list(itertools.islice(records, group_size))
+        if not group:
+            return
+        yield '_'.join(record.id for record in group), group
+
+
+def _create_task(job_name, records, entity_type, msa_dir, model_seeds, msa_option, files_dir):
+    from afusion.api import create_batch_task
+
+    entities = []
+    ids = chain_ids()
+    for record in records:
+        chain_sequences = record.sequence.split(CHAIN_SEPARATOR)
+        # A precomputed alignment belongs to the whole record, so only
+        # single-chain records can use it.
+        msa_path = _find_msa(msa_dir, record.id) if msa_dir and len(chain_sequences) == 1 else None
+        for sequence in chain_sequences:
+            entities.append({
+                'type': entity_type,
+                'id': next(ids),
+                'sequence_data': _sequence_data(sequence, entity_type, msa_path, msa_option, files_dir),
+            })
+    logger.debug(f"FASTA records {[record.id for record in records]} make job '{job_name}'")
+    return create_batch_task(job_name, entities, list(model_seeds), files_dir=files_dir)
+
+
+def _sequence_data(sequence, entity_type, msa_path, msa_option, files_dir):
+    from afusion.api import create_dna_sequence_data, create_protein_sequence_data, create_rna_sequence_data
+
+    if entity_type == 'dna':
+        return create_dna_sequence_data(sequence)
+    if entity_type == 'rna':
+        sequence_data = create_rna_sequence_data(sequence, msa_option='none' if msa_path else msa_option,
+                                                 files_dir=files_dir)
+    else:
+        sequence_data = create_protein_sequence_data(sequence, msa_option='none' if msa_path else msa_option,
+                                                     files_dir=files_dir)
+    if msa_path:
+        del sequence_data['unpairedMsa']
+        sequence_data['unpairedMsaPath'] = msa_path
+    return sequence_data
+
+
+def _find_msa(msa_dir, record_id):
+    from afusion.api import sanitize_job_name
+
+    for name in (record_id, sanitize_job_name(record_id)):
+        path = os.path.join(msa_dir, f"{name}.a3m")
+        if name and os.path.isfile(path):
+            return os.path.abspath(path)
+    return None
@@ -0,0 +1,248 @@
+# afusion/inference_worker.py
+
+import itertools
+import json
+import os
+import queue
+import shlex
+import subprocess
+import threading
+from concurrent.futures import Future
+from loguru import logger
+
+
+class InferenceWorkerError(RuntimeError):
+    """Raised when the warm inference worker cannot take or finish a job."""
+
+
+class WarmInferenceWorker:
+    """
+    A long-lived AlphaFold 3 inference process that keeps the model loaded.
+
+    Jobs are queued locally and sent one at a time to the worker, which runs
+    ``inference_worker_server.py`` and answers each ``fold_input.json`` path
+    with a JSON status line. Container startup, parameter loading and XLA
+    compilation for a bucket are paid once instead of once per job.
+
+    Use :meth:`docker` to start the worker in the ``alphafold3`` image. Any
+    other command speaking the same protocol (for example a local stand-in
+    process) can be passed directly.
+
+    :param command: Command that starts the worker process.
+    :type command: str
+    :param path_map: Pairs of (host prefix, worker prefix) used to translate
+        host paths into paths the worker can see.
+    :type path_map: list of tuple, optional
+    """
+
+    def __init__(self, command, path_map=None):
+        self.command = command
+        self.path_map = sorted(path_map or [], key=lambda pair: len(pair[0]), reverse=True)
+        self._process = None
+        self._queue = queue.Queue()
+        self._ids = itertools.count(1)
+        self._dispatcher = None
+
+    @classmethod
+    def docker(
+        cls,
+        af_input_base_path,
+        af_output_base_path,
+        model_parameters_dir,
+        bucket_sizes=None,
+        gpus="all",
+        docker_image="alphafold3",
+    ):
+        """
+        Creates a worker that runs inside a long-lived ``alphafold3`` container.
+
+        The input and output base paths are mounted once, so any job under
+        them can be sent to the worker.
+
+        :param af_input_base_path: Base path for AlphaFold input.
+        :type af_input_base_path: str
+        :param af_output_base_path: Base path for AlphaFold output.
+        :type af_output_base_path: str
+        :param model_parameters_dir: Path to model parameters directory.
+        :type model_parameters_dir: str
+        :param bucket_sizes: Optional list of bucket sizes, fixed for the
+            lifetime of the worker.
+        :type bucket_sizes: list of int, optional
+        :param gpus: Value for ``docker run --gpus``.
+        :type gpus: str
+        :param docker_image: AlphaFold 3 image name.
+        :type docker_image: str
+        :return: A worker that has not been started yet.
+        :rtype: WarmInferenceWorker
+        """
+        af_input_base_path = os.path.abspath(af_input_base_path)
+        af_output_base_path = os.path.abspath(af_output_base_path)
+        server_dir = os.path.dirname(os.path.abspath(__file__))
+        buckets_option = f" --buckets={','.join(map(str, bucket_sizes))}" if bucket_sizes else ""
+        command = (
+            f"docker run -i --rm "
+            f"--volume {shlex.quote(af_input_base_path)}:/root/af_input "
+            f"--volume {shlex.quote(af_output_base_path)}:/root/af_output "
+            f"--volume {shlex.quote(model_parameters_dir)}:/root/models "
+            f"--volume {shlex.quote(server_dir)}:/root/afusion_worker:ro "
+            f"--gpus {gpus} "
+            f"{docker_image} "
+            f"python /root/afusion_worker/inference_worker_server.py "
+            f"--model_dir=/root/models"
+            f"{buckets_option}"
+        )
+        return cls(command, path_map=[
+            (af_input_base_path, "/root/af_input"),
+            (af_output_base_path, "/root/af_output"),
+        ])
+
+    @property
+    def alive(self):
+        """Whether the worker process is running and accepting jobs."""
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        """
+        Starts the worker process and waits until its model is loaded.
+
+        :raises InferenceWorkerError: If the worker exits or reports an error
+            before it is ready.
+        """
+        if self.alive:
+            return
+        # Retire the queue (and dispatcher) of any previous worker process.
+        self._queue.put(None)
+        self._queue = queue.Queue()
+        logger.info(f"Starting warm inference worker: {self.command}")
+        self._process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            shell=True,
+            bufsize=1,
+        )
+        threading.Thread(target=self._drain_stderr, args=(self._process,), daemon=True).start()
+
+        message = self._read_message()
+        if message is None or message.get('event') != 'ready':
+            error = message.get('error') if message else 'worker exited during startup'
+            self.close()
+            raise InferenceWorkerError(f"Warm inference worker failed to start: {error}")
+        logger.info("Warm inference worker is ready.")
+
+        self._dispatcher = threading.Thread(target=self._dispatch, args=(self._queue, self._process), daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, json_path, output_dir):
+        """
+        Queues one job for the worker.
+
+        :param json_path: Host path of the fold input or data JSON.
+        :type json_path: str
+        :param output_dir: Host path of the job's output folder.
+        :type output_dir: str
+        :return: Future resolving to the worker's response dict.
+        :rtype: concurrent.futures.Future
+        """
+        future = Future()
+        if not self.alive:
+            future.set_exception(InferenceWorkerError("Warm inference worker is not running."))
+            return future
+        request = {
+            'id': next(self._ids),
+            'json_path': self._to_worker_path(json_path),
+            'output_dir': self._to_worker_path(output_dir),
+        }
+        self._queue.put((request, future))
+        return future
+
+    def run(self, json_path, output_dir):
+        """
+        Runs one job on the worker and waits for it to finish.
+
+        :return: The worker's response dict.
+        :rtype: dict
+        :raises InferenceWorkerError: If the worker is not running or dies
+            while the job is in progress.
+        """
+        return self.submit(json_path, output_dir).result()
+
+    def close(self, timeout=None):
+        """
+        Stops the worker after the job in progress, failing queued jobs.
+
+        :param timeout: Seconds to wait for the job in progress before the
+            worker is killed. Waits indefinitely by default.
+        :type timeout: float, optional
+        """
+        self._queue.put(None)
+        process = self._process
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        logger.info("Warm inference worker stopped.")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _to_worker_path(self, path):
+        path = os.path.abspath(path)
+        for host_prefix, worker_prefix in self.path_map:
+            if path == host_prefix or path.startswith(host_prefix + os.sep):
+                return worker_prefix + path[len(host_prefix):]
+        return path
+
+    def _read_message(self, process=None):
+        """Returns the next protocol message, or None once the worker exits."""
+        process = process or self._process
+        for line in iter(process.stdout.readline, ''):
+            try:
+                return json.loads(line)
+            except json.JSONDecodeError:
+                logger.debug(f"[inference worker] {line.rstrip()}")
+        return None
+
+    def _drain_stderr(self, process):
+        for line in iter(process.stderr.readline, ''):
+            logger.debug(f"[inference worker] {line.rstrip()}")
+
+    def _dispatch(self, jobs, process):
+        while True:
+            item = jobs.get()
+            if item is None:
+                break
+            request, future = item
+            if process.poll() is not None:
+                future.set_exception(InferenceWorkerError("Warm inference worker is not running."))
+                continue
+            try:
+                process.stdin.write(json.dumps(request) + "\n")
+                process.stdin.flush()
+                response = self._read_message(process)
+            except (OSError, ValueError) as e:
+                response = None
+                logger.error(f"Lost connection to warm inference worker: {e}")
+            if response is None:
+                future.set_exception(InferenceWorkerError("Warm inference worker exited while running a job."))
+            else:
+                future.set_result(response)
+
+        # Fail anything queued after close() so callers do not wait forever.
+        while not jobs.empty():
+            item = jobs.get_nowait()
+            if item is not None:
+                item[1].set_exception(InferenceWorkerError("Warm inference worker was stopped."))
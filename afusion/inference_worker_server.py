@@ -0,0 +1,90 @@
+# afusion/inference_worker_server.py
+#
+# Runs inside the alphafold3 container and keeps one model loaded across jobs.
+# Only the standard library and AlphaFold 3 itself are importable here, so
+# this module must not import anything from afusion.
+#
+# Protocol (one JSON object per line):
+#   worker -> client: {"event": "ready"} once the model is loaded
+#   client -> worker: {"id": ..., "json_path": ..., "output_dir": ...}
+#   worker -> client: {"id": ..., "status": "ok", "output_dir": ...}
+#                  or {"id": ..., "status": "error", "error": ...}
+# The worker exits when stdin is closed. AlphaFold's own output goes to
+# stderr so that stdout carries protocol messages only.
+
+import argparse
+import json
+import os
+import pathlib
+import sys
+import traceback
+
+
+def _send(stream, message):
+    stream.write(json.dumps(message) + "\n")
+    stream.flush()
+
+
+def _load_model(model_dir, flash_attention_implementation):
+    sys.path.insert(0, os.getcwd())  # run_alphafold.py lives in the image's working directory
+    import jax
+    import run_alphafold
+
+    config = run_alphafold.make_model_config(
+        flash_attention_implementation=flash_attention_implementation,
+    )
+    return run_alphafold.ModelRunner(
+        config=config,
+        device=jax.local_devices(backend='gpu')[0],
+        model_dir=pathlib.Path(model_dir),
+    )
+
+
+def _run_job(model_runner, request, buckets):
+    import run_alphafold
+    from alphafold3.common import folding_input
+
+    for fold_input in folding_input.load_fold_inputs_from_path(pathlib.Path(request['json_path'])):
+        run_alphafold.process_fold_input(
+            fold_input=fold_input,
+            data_pipeline_config=None,
+            model_runner=model_runner,
+            output_dir=request['output_dir'],
+            buckets=buckets,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AFusion warm AlphaFold 3 inference worker')
+    parser.add_argument('--model_dir', default='/root/models')
+    parser.add_argument('--buckets', default='')
+    parser.add_argument('--flash_attention_implementation', default='triton')
+    args = parser.parse_args()
+
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+    buckets = tuple(int(b) for b in args.buckets.split(',') if b.strip()) or None
+
+    try:
+        model_runner = _load_model(args.model_dir, args.flash_attention_implementation)
+    except Exception as e:
+        traceback.print_exc()
+        _send(protocol_out, {"event": "error", "error": f"Failed to load model: {e}"})
+        return 1
+    _send(protocol_out, {"event": "ready"})
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        try:
+            _run_job(model_runner, request, buckets)
+            _send(protocol_out, {"id": request.get('id'), "status": "ok", "output_dir": request['output_dir']})
+        except Exception as e:
+            traceback.print_exc()
+            _send(protocol_out, {"id": request.get('id'), "status": "error", "error": str(e)})
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# afusion/input_files.py
+
+import copy
+import hashlib
+import os
+import shutil
+import tempfile
+from loguru import logger
+
+# Folder, next to each fold_input.json, that referenced files are linked into.
+INPUT_FILES_FOLDER = 'files'
+
+# Folder under a batch's input path with the content-addressed files of all
+# of its tasks.
+BATCH_FILES_FOLDER = '_input_files'
+
+# Inline fields of a chain and the AlphaFold 3 fields that reference a file
+# with the same content instead, with the extension the file gets.
+CHAIN_PATH_FIELDS = {
+    'unpairedMsa': ('unpairedMsaPath', 'a3m'),
+    'pairedMsa': ('pairedMsaPath', 'a3m'),
+}
+TEMPLATE_PATH_FIELDS = {
+    'mmcif': ('mmcifPath', 'cif'),
+}
+TASK_PATH_FIELDS = {
+    'userCCD': ('userCCDPath', 'cif'),
+}
+
+
+def store_input_file(content, files_dir, extension):
+    """
+    Writes content to a content-addressed file, unless it is already there.
+
+    :param content: File content, e.g. an A3M MSA or an mmCIF.
+    :type content: str
+    :param files_dir: Directory holding the files.
+    :type files_dir: str
+    :param extension: File extension, e.g. 'a3m'.
+    :type extension: str
+    :return: Absolute path of ``<files_dir>/<sha256>.<extension>``.
+    :rtype: str
+    """
+    path = os.path.join(os.path.abspath(files_dir), f"{hashlib.sha256(content.encode()).hexdigest()}.{extension}")
+    if os.path.exists(path):
+        return path
+    os.makedirs(files_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=files_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as tmp_file:
+        tmp_file.write(content)
+    os.replace(tmp_path, path)
+    logger.debug(f"Stored input file {path}")
+    return path
+
+
+def reference_input_files(task, files_dir):
+    """
+    Moves a task's inline MSAs, template mmCIFs and user CCD into files.
+
+    Each non-empty inline value is written once to ``files_dir`` (see
+    :func:`store_input_file`) and replaced by the matching AlphaFold 3 path
+    field, e.g. ``unpairedMsa`` by ``unpairedMsaPath``. Empty strings
+    ("use no MSA") and None ("search for an MSA") stay as they are.
+
+    :param task: Task dict, as generated by create_batch_task.
+    :type task: dict
+    :param files_dir: Directory holding the content-addressed files.
+    :type files_dir: str
+    :return: A copy of the task with path fields instead of inline content.
+    :rtype: dict
+    """
+    task = dict(task)
+    _reference_fields(task, TASK_PATH_FIELDS, files_dir)
+    sequences = []
+    for sequence_entry in task.get('sequences', []):
+        sequence_entry = {
+            entity_type: reference_chain_files(chain, files_dir) if isinstance(chain, dict) else chain
+            for entity_type, chain in sequence_entry.items()
+        }
+        sequences.append(sequence_entry)
+    if 'sequences' in task:
+        task['sequences'] = sequences
+    return task
+
+
+def link_input_files(task, input_path, source_dir=None):
+    """
+    Makes the files a task references readable next to its ``fold_input.json``.
+
+    AlphaFold 3 only sees the folder mounted as its input, so every path
+    field with an absolute path that exists on this host is hard linked
+    (copied across file systems) into ``<input_path>/files`` and replaced
+    by a path relative to ``input_path``, which AlphaFold 3 resolves
+    against the JSON file's folder. Other paths are left alone.
+
+    :param task: Task dict with path fields.
+    :type task: dict
+    :param input_path: The task's input folder.
+    :type input_path: str
+    :param source_dir: Folder relative paths in the task are relative to,
+        e.g. when copying a task JSON to another folder. By default
+        relative paths are left alone.
+    :type source_dir: str, optional
+    :return: A copy of the task with relative paths.
+    :rtype: dict
+    """
+    task = copy.deepcopy(task)
+    for fields, path_fields in _path_field_owners(task):
+        for path_field, _ in path_fields.values():
+            path = fields.get(path_field)
+            if not isinstance(path, str) or not path:
+                continue
+            if not os.path.isabs(path) and source_dir is not None:
+                path = os.path.join(os.path.abspath(source_dir), path)
+            if os.path.isabs(path) and os.path.isfile(path):
+                fields[path_field] = _link_into(path, input_path)
+    return task
+
+
+def reference_chain_files(chain, files_dir):
+    """
+    Does what :func:`reference_input_files` does for a single chain entry.
+
+    :rtype: dict
+    """
+    chain = dict(chain)
+    _reference_fields(chain, CHAIN_PATH_FIELDS, files_dir)
+    if isinstance(chain.get('templates'), list):
+        templates = []
+        for template in chain['templates']:
+            if isinstance(template, dict):
+                template = dict(template)
+                _reference_fields(template, TEMPLATE_PATH_FIELDS, files_dir)
+            templates.append(template)
+        chain['templates'] = templates
+    return chain
+
+
+def _reference_fields(fields, path_fields, files_dir):
+    for field, (path_field, extension) in path_fields.items():
+        content = fields.get(field)
+        if isinstance(content, str) and content:
+            fields[path_field] = store_input_file(content, files_dir, extension)
+            del fields[field]
+
+
+def _path_field_owners(task):
+    """Yields (dict, path fields) for the task and every chain and template in it."""
+    yield task, TASK_PATH_FIELDS
+    for sequence_entry in task.get('sequences', []):
+        for chain in sequence_entry.values():
+            if not isinstance(chain, dict):
+                continue
+            yield chain, CHAIN_PATH_FIELDS
+            for template in chain.get('templates') or []:
+                if isinstance(template, dict):
+                    yield template, TEMPLATE_PATH_FIELDS
+
+
+def _link_into(path, input_path):
+    """Links a file into the input folder's files folder and returns its relative path."""
+    relative_path = os.path.join(INPUT_FILES_FOLDER, os.path.basename(path))
+    target = os.path.join(input_path, relative_path)
+    if os.path.exists(target) and not os.path.samefile(path, target):
+        # Another file of the same name, e.g. two users' msa.a3m.
+        prefix = hashlib.sha256(path.encode()).hexdigest()[:16]
+        relative_path = os.path.join(INPUT_FILES_FOLDER, f"{prefix}-{os.path.basename(path)}")
+        target = os.path.join(input_path, relative_path)
+    if os.path.exists(target):
+        return relative_path
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(path, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copyfile(path, target)
+    return relative_path
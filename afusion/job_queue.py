@@ -0,0 +1,282 @@
+# afusion/job_queue.py
+
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from afusion.execution import build_docker_command, start_container_process, stop_process_group
+from afusion.scheduler import probe_gpu_devices
+from loguru import logger
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+STATES = (QUEUED, RUNNING, DONE, FAILED, CANCELLED)
+
+DEFAULT_QUEUE_PATH = os.path.expanduser("~/.afusion/job_queue.db")
+
+# Finished jobs within this many seconds count towards a user's fair share.
+DEFAULT_FAIR_SHARE_WINDOW = 24 * 3600
+
+_COLUMNS = (
+    'id', 'job_name', 'user', 'priority', 'state', 'device', 'command_args', 'log_path', 'returncode',
+    'cancel_requested', 'submitted_at', 'started_at', 'finished_at',
+)
+
+
+class JobQueue:
+    """
+    Shared queue of AlphaFold 3 runs on one host, kept in a SQLite database.
+
+    Every Streamlit session submits to the same database and a single
+    :class:`JobQueueDaemon` starts the jobs, so concurrent clicks on "Run"
+    no longer start competing containers. Jobs are dispatched by priority
+    first (higher runs sooner), then by fair share: among jobs of equal
+    priority, the user who has used the least GPU time recently goes next,
+    and ties go to the oldest submission.
+
+    :param path: Path of the SQLite database file. It is created if needed.
+    :type path: str
+    :param fair_share_window: Seconds of finished-job history that count
+        towards a user's usage.
+    :type fair_share_window: float
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, fair_share_window=DEFAULT_FAIR_SHARE_WINDOW):
+        self.path = path
+        self.fair_share_window = fair_share_window
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " job_name TEXT NOT NULL,"
+            " user TEXT NOT NULL,"
+            " priority INTEGER NOT NULL DEFAULT 0,"
+            " state TEXT NOT NULL,"
+            " device TEXT,"
+            " command_args TEXT NOT NULL,"
+            " log_path TEXT,"
+            " returncode INTEGER,"
+            " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+            " submitted_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL"
+            ")"
+        )
+
+    def submit(self, job_name, command_args, user='anonymous', priority=0):
+        """
+        Adds a run to the queue.
+
+        :param job_name: Name of the job, for display.
+        :type job_name: str
+        :param command_args: Keyword arguments for
+            :func:`afusion.execution.build_docker_command`, except ``gpus``,
+            which the daemon sets to the device it assigns.
+        :type command_args: dict
+        :param user: Who submitted the job, for fair share.
+        :type user: str
+        :param priority: Higher priorities are dispatched first.
+        :type priority: int
+        :return: The job id.
+        :rtype: int
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT INTO jobs (job_name, user, priority, state, command_args, submitted_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_name, user, int(priority), QUEUED, json.dumps(command_args), time.time()),
+            )
+        job_id = cursor.lastrowid
+        logger.info(f"Queued job '{job_name}' as #{job_id} for user '{user}' with priority {priority}.")
+        return job_id
+
+    def get(self, job_id):
+        """
+        Returns a job's queue entry.
+
+        :return: Dict with the queue columns, or None for an unknown job.
+        :rtype: dict or None
+        """
+        rows = self._select("WHERE id = ?", (job_id,))
+        return rows[0] if rows else None
+
+    def jobs(self, state=None):
+        """
+        Returns all jobs, optionally only those in one state.
+
+        :rtype: list of dict
+        """
+        if state is None:
+            return self._select("ORDER BY id")
+        return self._select("WHERE state = ? ORDER BY id", (state,))
+
+    def dispatch_order(self):
+        """
+        Returns the queued jobs in the order they will be started.
+
+        :rtype: list of dict
+        """
+        now = time.time()
+        usage = {}
+        for job in self._select("WHERE state IN (?, ?, ?) AND (finished_at IS NULL OR finished_at > ?)",
+                                (RUNNING, DONE, FAILED, now - self.fair_share_window)):
+            if job['started_at'] is not None:
+                usage[job['user']] = usage.get(job['user'], 0.0) + (job['finished_at'] or now) - job['started_at']
+        queued = self._select("WHERE state = ?", (QUEUED,))
+        return sorted(queued, key=lambda job: (-job['priority'], usage.get(job['user'], 0.0), job['submitted_at']))
+
+    def position(self, job_id):
+        """
+        Returns a queued job's place in line.
+
+        :return: 1 if the job starts next, or None if it is not queued.
+        :rtype: int or None
+        """
+        for index, job in enumerate(self.dispatch_order(), start=1):
+            if job['id'] == job_id:
+                return index
+        return None
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued job, or asks the daemon to stop a running one.
+
+        :rtype: None
+        """
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET state = ?, finished_at = ? WHERE id = ? AND state = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            )
+            self._connection.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND state = ?", (job_id, RUNNING))
+        logger.info(f"Cancellation requested for job #{job_id}.")
+
+    def mark_running(self, job_id, device, log_path):
+        """
+        Claims a queued job for the daemon to start on a device.
+
+        :return: Whether the job was still queued; False if it was cancelled
+            meanwhile, in which case it must not be started.
+        :rtype: bool
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET state = ?, device = ?, log_path = ?, started_at = ? WHERE id = ? AND state = ?",
+                (RUNNING, device, log_path, time.time(), job_id, QUEUED),
+            )
+        return cursor.rowcount == 1
+
+    def mark_finished(self, job_id, returncode, cancelled=False):
+        """Records a job's exit code and final state."""
+        state = CANCELLED if cancelled else DONE if returncode == 0 else FAILED
+        self._update(job_id, state=state, returncode=returncode, finished_at=time.time())
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def _update(self, job_id, **fields):
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _select(self, clause, params=()):
+        with self._lock:
+            rows = self._connection.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs {clause}", params).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+
+class JobQueueDaemon:
+    """
+    Starts queued jobs on the host's GPUs within a per-device concurrency limit.
+
+    Run exactly one daemon per queue database, e.g. with
+    ``afusion queue-daemon``. Each job's ``docker run`` is pinned to its
+    device with ``--gpus device=<id>`` and its output goes to a log file
+    next to the database.
+
+    :param job_queue: The queue to serve.
+    :type job_queue: JobQueue
+    :param device_limits: Number of jobs allowed at once on each device id.
+        Defaults to one job on every device :func:`afusion.scheduler.probe_gpu_devices`
+        finds (or one job on "all" GPUs when none are found).
+    :type device_limits: dict, optional
+    :param poll_interval: Seconds between looks at the queue.
+    :type poll_interval: float
+    """
+
+    def __init__(self, job_queue, device_limits=None, poll_interval=2.0):
+        if device_limits is None:
+            device_limits = {device: 1 for device in probe_gpu_devices()} or {'all': 1}
+        self.job_queue = job_queue
+        self.device_limits = {str(device): int(limit) for device, limit in device_limits.items()}
+        self.poll_interval = poll_interval
+        self.log_dir = os.path.join(os.path.dirname(os.path.abspath(job_queue.path)), 'job_logs')
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._running = {}  # job id -> (device, Popen)
+
+    def run_forever(self):
+        """Serves the queue until interrupted."""
+        for job in self.job_queue.jobs(RUNNING):
+            # Left over from a daemon that stopped; its process is gone.
+            logger.warning(f"Job #{job['id']} was running when the daemon stopped; marking it failed.")
+            self.job_queue.mark_finished(job['id'], returncode=None)
+        logger.info(f"Job queue daemon serving {self.job_queue.path} with device limits {self.device_limits}.")
+        try:
+            while True:
+                self.run_once()
+                time.sleep(self.poll_interval)
+        finally:
+            for job_id, (_, process) in self._running.items():
+                logger.warning(f"Daemon stopping; terminating job #{job_id}.")
+                stop_process_group(process)
+
+    def run_once(self):
+        """Reaps finished jobs, handles cancellations and starts jobs on free devices."""
+        for job_id, (device, process) in list(self._running.items()):
+            job = self.job_queue.get(job_id)
+            if process.poll() is None:
+                if job is not None and job['cancel_requested']:
+                    logger.info(f"Stopping cancelled job #{job_id}.")
+                    stop_process_group(process)
+                continue
+            del self._running[job_id]
+            cancelled = bool(job and job['cancel_requested'])
+            self.job_queue.mark_finished(job_id, process.returncode, cancelled=cancelled)
+            logger.info(f"Job #{job_id} on device {device} exited with {process.returncode}.")
+
+        for device, limit in self.device_limits.items():
+            while sum(1 for running_device, _ in self._running.values() if running_device == device) < limit:
+                order = self.job_queue.dispatch_order()
+                if not order:
+                    return
+                self._start(order[0], device)
+
+    def _start(self, job, device):
+        command_args = json.loads(job['command_args'])
+        command_args['gpus'] = 'all' if device == 'all' else f"device={device}"
+        command = build_docker_command(**command_args)
+        log_path = os.path.join(self.log_dir, f"{job['id']}.log")
+        if not self.job_queue.mark_running(job['id'], device, log_path):
+            logger.info(f"Job #{job['id']} was cancelled before it started.")
+            return
+        try:
+            with open(log_path, 'w') as log_file:
+                # A named container, so cancelling stops the container and frees its device.
+                process = start_container_process(command, stdout=log_file, stderr=subprocess.STDOUT)
+        except OSError as e:
+            logger.error(f"Could not start job #{job['id']}: {e}")
+            self.job_queue.mark_finished(job['id'], returncode=None)
+            return
+        self._running[job['id']] = (device, process)
+        logger.info(f"Started job #{job['id']} ('{job['job_name']}' by {job['user']}) on device {device}: {command}")
+
@@ -0,0 +1,153 @@
+# afusion/journal.py
+
+import json
+import sqlite3
+import threading
+import time
+from loguru import logger
+
+QUEUED = 'queued'
+PIPELINE_RUNNING = 'pipeline-running'
+PIPELINE_DONE = 'pipeline-done'
+INFERENCE_RUNNING = 'inference-running'
+DONE = 'done'
+FAILED = 'failed'
+
+STATES = (QUEUED, PIPELINE_RUNNING, PIPELINE_DONE, INFERENCE_RUNNING, DONE, FAILED)
+
+_COLUMNS = (
+    'job_name', 'state', 'status', 'input_path', 'output_folder', 'data_json_path', 'stage_timings', 'attempts',
+    'updated_at',
+)
+_FIELDS = ('status', 'input_path', 'output_folder', 'data_json_path', 'stage_timings')
+
+
+class JobJournal:
+    """
+    Durable record of each batch job's state in a local SQLite database.
+
+    Every state change is committed immediately, so a batch driver that dies
+    can be restarted with the same journal and pick up where it stopped.
+    A job moves through queued -> pipeline-running -> pipeline-done ->
+    inference-running -> done, or to failed from any running state.
+
+    :param path: Path of the SQLite database file. It is created if needed.
+    :type path: str
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_name TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " status TEXT,"
+            " input_path TEXT,"
+            " output_folder TEXT,"
+            " data_json_path TEXT,"
+            " stage_timings TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " updated_at REAL NOT NULL"
+            ")"
+        )
+        # Journals written before stage timings were recorded.
+        existing = {row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")}
+        if 'stage_timings' not in existing:
+            self._connection.execute("ALTER TABLE jobs ADD COLUMN stage_timings TEXT")
+
+    def get(self, job_name):
+        """
+        Returns the journal entry of a job.
+
+        :return: Dict with the journal columns, or None for an unknown job.
+        :rtype: dict or None
+        """
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE job_name = ?", (job_name,)
+            ).fetchone()
+        return _entry(row) if row else None
+
+    def record(self, job_name, state, **fields):
+        """
+        Records a job's new state, creating its entry if needed.
+
+        Entering a running state counts as another attempt.
+
+        :param job_name: Name of the job.
+        :type job_name: str
+        :param state: One of :data:`STATES`.
+        :type state: str
+        :param fields: Optional 'status', 'input_path', 'output_folder',
+            'data_json_path' or 'stage_timings' (dict of stage seconds) values
+            to store with the state.
+        """
+        if state not in STATES:
+            raise ValueError(f"Unknown job state: {state}")
+        unknown = set(fields) - set(_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown journal fields: {', '.join(sorted(unknown))}")
+        if 'stage_timings' in fields:
+            fields['stage_timings'] = json.dumps(fields['stage_timings'] or {})
+
+        attempt = 1 if state in (PIPELINE_RUNNING, INFERENCE_RUNNING) else 0
+        names = ['job_name', 'state', 'attempts', 'updated_at'] + list(fields)
+        values = [job_name, state, attempt, time.time()] + list(fields.values())
+        updates = ', '.join(
+            ['state = excluded.state', 'attempts = attempts + excluded.attempts', 'updated_at = excluded.updated_at']
+            + [f"{name} = excluded.{name}" for name in fields]
+        )
+        with self._lock:
+            self._connection.execute(
+                f"INSERT INTO jobs ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+                f"ON CONFLICT(job_name) DO UPDATE SET {updates}",
+                values,
+            )
+        logger.debug(f"Journal: job '{job_name}' -> {state}")
+
+    def jobs(self, state=None):
+        """
+        Returns all journal entries, optionally only those in one state.
+
+        :rtype: list of dict
+        """
+        query = f"SELECT {', '.join(_COLUMNS)} FROM jobs"
+        params = ()
+        if state is not None:
+            query += " WHERE state = ?"
+            params = (state,)
+        with self._lock:
+            rows = self._connection.execute(query + " ORDER BY updated_at", params).fetchall()
+        return [_entry(row) for row in rows]
+
+    def summary(self):
+        """
+        Returns the number of jobs in each state.
+
+        :rtype: dict
+        """
+        with self._lock:
+            rows = self._connection.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return dict(rows)
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _entry(row):
+    """Turns a jobs row into an entry dict, with 'stage_timings' as a dict."""
+    entry = dict(zip(_COLUMNS, row))
+    entry['stage_timings'] = json.loads(entry['stage_timings']) if entry['stage_timings'] else {}
+    return entry
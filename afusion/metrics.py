@@ -0,0 +1,184 @@
+# afusion/metrics.py
+
+import http.server
+import os
+import threading
+from loguru import logger
+
+# Histogram bucket upper bounds.
+STAGE_SECONDS_BUCKETS = (10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400, 28800)
+MEMORY_BYTES_BUCKETS = tuple(gib * 2**30 for gib in (1, 2, 4, 8, 16, 24, 32, 40, 48, 64, 80, 128, 256))
+
+
+class JobMetrics:
+    """
+    Aggregates job results into Prometheus metrics.
+
+    Give it to :func:`afusion.api.run_batch_predictions` as ``metrics`` (or
+    call :meth:`observe` with results yourself) and expose it with
+    :meth:`write` for node_exporter's textfile collector, or :meth:`serve`
+    for a scrape endpoint. The metrics are:
+
+    - ``afusion_jobs_total{status}``: finished jobs, 'success' or 'failed'.
+    - ``afusion_job_failures_total{failure}``: failed jobs by failure class
+      (see :func:`afusion.retry.classify_failure`).
+    - ``afusion_job_retries_total``: runs retried or requeued after a failure.
+    - ``afusion_job_cpu_seconds_total``, ``afusion_job_read_bytes_total`` and
+      ``afusion_job_write_bytes_total``: summed over profiled jobs.
+    - ``afusion_job_stage_seconds{stage}``: histogram of stage timings.
+    - ``afusion_job_wall_seconds``: histogram of profiled container time per job.
+    - ``afusion_job_peak_rss_bytes`` and ``afusion_job_peak_gpu_memory_bytes``:
+      histograms of per-job peaks.
+
+    :param namespace: Prefix of the metric names.
+    :type namespace: str
+    """
+
+    def __init__(self, namespace='afusion'):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> (buckets, counts, sum, count)
+        self._help = {}
+        self._server = None
+
+    def observe(self, result):
+        """
+        Adds one job result, as returned by run_batch_predictions.
+
+        :param result: Dict with 'status' and optionally 'failure', 'retries',
+            'stage_timings' and 'resource_usage'.
+        :type result: dict
+        """
+        with self._lock:
+            status = 'success' if result.get('status') == 'Success' else 'failed'
+            self._inc('jobs_total', 'Finished AlphaFold jobs.', 1, status=status)
+            if status == 'failed' and result.get('failure'):
+                self._inc('job_failures_total', 'Failed AlphaFold jobs by failure class.', 1,
+                          failure=result['failure'])
+            if result.get('retries'):
+                self._inc('job_retries_total', 'AlphaFold runs retried after a failure.', result['retries'])
+            for stage, seconds in (result.get('stage_timings') or {}).items():
+                self._observe('job_stage_seconds', 'Wall-clock seconds per job stage.', STAGE_SECONDS_BUCKETS,
+                              seconds, stage=stage)
+            usage = result.get('resource_usage')
+            if not usage:
+                return
+            self._inc('job_cpu_seconds_total', 'CPU seconds used by profiled jobs.', usage['cpu_seconds'])
+            self._inc('job_read_bytes_total', 'Bytes read from disk by profiled jobs.', usage['read_bytes'])
+            self._inc('job_write_bytes_total', 'Bytes written to disk by profiled jobs.', usage['write_bytes'])
+            self._observe('job_wall_seconds', 'Container seconds per profiled job.', STAGE_SECONDS_BUCKETS,
+                          usage['wall_seconds'])
+            self._observe('job_peak_rss_bytes', 'Peak resident memory per profiled job.', MEMORY_BYTES_BUCKETS,
+                          usage['peak_rss_bytes'])
+            if usage.get('peak_gpu_memory_bytes') is not None:
+                self._observe('job_peak_gpu_memory_bytes', 'Peak GPU memory in use per profiled job.',
+                              MEMORY_BYTES_BUCKETS, usage['peak_gpu_memory_bytes'])
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+
+        :rtype: str
+        """
+        with self._lock:
+            lines = []
+            described = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in described:
+                    described.add(name)
+                    lines += [f"# HELP {name} {self._help[name]}", f"# TYPE {name} counter"]
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            for (name, labels), (buckets, counts, total, count) in sorted(self._histograms.items()):
+                if name not in described:
+                    described.add(name)
+                    lines += [f"# HELP {name} {self._help[name]}", f"# TYPE {name} histogram"]
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', _format_value(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+            return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Writes the metrics to a file atomically, e.g. ``<dir>/afusion.prom``
+        in the directory of node_exporter's textfile collector.
+
+        :param path: Path of the metrics file.
+        :type path: str
+        """
+        # Per thread, for the per-GPU claim loops of one queue worker.
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port=9464, host=''):
+        """
+        Serves the metrics at ``http://<host>:<port>/metrics`` from a
+        background thread.
+
+        :param port: Port to listen on.
+        :type port: int
+        :param host: Address to bind; all interfaces by default.
+        :type host: str
+        :return: The HTTP server; call ``shutdown()`` on it to stop serving.
+        :rtype: http.server.ThreadingHTTPServer
+        """
+        metrics = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"Metrics request: {format % args}")
+
+        self._server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logger.info(f"Serving Prometheus metrics on port {self._server.server_address[1]}.")
+        return self._server
+
+    def _inc(self, name, help_text, value, **labels):
+        name = f"{self.namespace}_{name}"
+        self._help[name] = help_text
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def _observe(self, name, help_text, buckets, value, **labels):
+        name = f"{self.namespace}_{name}"
+        self._help[name] = help_text
+        key = (name, tuple(sorted(labels.items())))
+        bucket_bounds, counts, total, count = self._histograms.get(key, (buckets, [0] * len(buckets), 0, 0))
+        for index, bound in enumerate(bucket_bounds):
+            if value <= bound:
+                counts[index] += 1
+                break
+        self._histograms[key] = (bucket_bounds, counts, total + value, count + 1)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
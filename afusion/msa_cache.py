@@ -0,0 +1,296 @@
+# afusion/msa_cache.py
+
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from loguru import logger
+
+# Fields the data pipeline fills in for each chain type.
+MSA_FIELDS = {
+    'protein': ('unpairedMsa', 'pairedMsa', 'templates'),
+    'rna': ('unpairedMsa',),
+}
+
+
+def databases_fingerprint(databases_dir):
+    """
+    Returns a short fingerprint of the genetic databases in a directory.
+
+    The fingerprint changes whenever a database file is added, removed,
+    resized or rewritten, which makes it a convenient ``database_version``
+    for :class:`MsaCache`.
+
+    :param databases_dir: Path to databases directory.
+    :type databases_dir: str
+    :return: Hex digest identifying the database files.
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    for entry in sorted(os.scandir(databases_dir), key=lambda e: e.name):
+        stat = entry.stat()
+        digest.update(f"{entry.name}\0{stat.st_size}\0{int(stat.st_mtime)}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def chain_needs_search(entity_type, chain):
+    """
+    Returns whether the data pipeline still has to search for a chain.
+
+    A field that is None or missing is searched by AlphaFold 3 unless the
+    chain references a file instead (e.g. ``unpairedMsaPath``); an empty
+    string or list means "use nothing" and is left alone.
+
+    :param entity_type: 'protein', 'rna', 'dna' or 'ligand'.
+    :type entity_type: str
+    :param chain: The chain's entry from a task's ``sequences`` list.
+    :type chain: dict
+    :rtype: bool
+    """
+    return any(_field_missing(chain, field) for field in MSA_FIELDS.get(entity_type, ()))
+
+
+def _field_missing(chain, field):
+    return chain.get(field) is None and not chain.get(f"{field}Path")
+
+
+def plan_unique_chains(tasks, msa_cache=None):
+    """
+    Finds the distinct chains across a task list that still need a search.
+
+    Chains are distinct by (entity type, sequence). Chains already in
+    ``msa_cache`` are left out.
+
+    :param tasks: Task dicts, as generated by create_batch_task.
+    :type tasks: list of dict
+    :param msa_cache: Optional cache to check first.
+    :type msa_cache: MsaCache, optional
+    :return: Dicts with keys 'entity_type', 'sequence', 'search_fields' (the
+        fields at least one task wants searched) and 'task_count', in order
+        of first appearance.
+    :rtype: list of dict
+    """
+    plan = {}
+    for task in tasks:
+        for sequence_entry in task.get('sequences', []):
+            for entity_type, chain in sequence_entry.items():
+                if not chain_needs_search(entity_type, chain):
+                    continue
+                chain_key = (entity_type, chain.get('sequence', ''))
+                if chain_key not in plan:
+                    plan[chain_key] = {
+                        'entity_type': entity_type,
+                        'sequence': chain_key[1],
+                        'search_fields': set(),
+                        'task_count': 0,
+                    }
+                plan[chain_key]['search_fields'].update(
+                    field for field in MSA_FIELDS[entity_type] if _field_missing(chain, field)
+                )
+                plan[chain_key]['task_count'] += 1
+
+    unique_chains = list(plan.values())
+    if msa_cache is not None:
+        unique_chains = [
+            chain for chain in unique_chains
+            if msa_cache.get(chain['entity_type'], chain['sequence']) is None
+        ]
+    return unique_chains
+
+
+def make_chain_task(name, entity_type, sequence, search_fields):
+    """
+    Builds a single-chain task that makes the data pipeline search one chain.
+
+    Fields outside ``search_fields`` are set to empty values so that only
+    the requested searches run.
+
+    :rtype: dict
+    """
+    chain = {'id': 'A', 'sequence': sequence}
+    for field in MSA_FIELDS[entity_type]:
+        if field in search_fields:
+            chain[field] = None
+        else:
+            chain[field] = [] if field == 'templates' else ""
+    return {
+        "name": name,
+        "modelSeeds": [1],
+        "sequences": [{entity_type: chain}],
+        "dialect": "alphafold3",
+        "version": 1
+    }
+
+
+class MsaCache:
+    """
+    On-disk cache of per-chain data pipeline results.
+
+    Entries are keyed by a hash of (entity type, sequence, database version)
+    and hold the unpairedMsa/pairedMsa/templates the data pipeline produced
+    for that chain. When the cache grows past ``max_size_bytes`` the least
+    recently used entries are removed.
+
+    :param cache_dir: Directory holding the cache entries.
+    :type cache_dir: str
+    :param database_version: Identifies the databases the entries were
+        searched against, e.g. :func:`databases_fingerprint`. Entries for a
+        different version are never returned.
+    :type database_version: str
+    :param max_size_bytes: Size limit for the cache directory.
+    :type max_size_bytes: int, optional
+    """
+
+    def __init__(self, cache_dir, database_version='', max_size_bytes=None):
+        self.cache_dir = cache_dir
+        self.database_version = database_version
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size_bytes = sum(size for _, size, _ in self._entries())
+        self.reset_stats()
+
+    def key(self, entity_type, sequence):
+        """Returns the cache key of a chain."""
+        payload = json.dumps([entity_type, sequence, self.database_version])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, entity_type, sequence):
+        """
+        Looks up the cached data pipeline result for a chain.
+
+        :return: Dict of cached fields, or None on a miss.
+        :rtype: dict or None
+        """
+        path = self._path(self.key(entity_type, sequence))
+        try:
+            with open(path) as entry_file:
+                entry = json.load(entry_file)
+            os.utime(path)  # Mark as recently used for LRU eviction.
+        except FileNotFoundError:
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable MSA cache entry {path}: {e}")
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+        with self._lock:
+            self.stats['hits'] += 1
+        return entry
+
+    def put(self, entity_type, sequence, fields):
+        """
+        Stores the data pipeline result for a chain.
+
+        :param fields: The chain's unpairedMsa/pairedMsa/templates values.
+        :type fields: dict
+        """
+        path = self._path(self.key(entity_type, sequence))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as entry_file:
+            json.dump(fields, entry_file, separators=(',', ':'))
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size_bytes += os.path.getsize(path) - old_size
+            self.stats['stored'] += 1
+        self.evict()
+
+    def inject(self, task):
+        """
+        Fills a task's chains from the cache.
+
+        Only fields the data pipeline would otherwise search for are filled.
+
+        :param task: Task dict, as generated by create_batch_task.
+        :type task: dict
+        :return: A copy of the task with cached fields filled in, and whether
+            no chain needs the data pipeline anymore.
+        :rtype: tuple of (dict, bool)
+        """
+        task = copy.deepcopy(task)
+        ready = True
+        for sequence_entry in task.get('sequences', []):
+            for entity_type, chain in sequence_entry.items():
+                if not chain_needs_search(entity_type, chain):
+                    continue
+                cached = self.get(entity_type, chain.get('sequence', ''))
+                if cached is not None:
+                    for field in MSA_FIELDS[entity_type]:
+                        if _field_missing(chain, field) and field in cached:
+                            chain[field] = cached[field]
+                if chain_needs_search(entity_type, chain):
+                    ready = False
+        return task, ready
+
+    def store(self, input_task, data_task):
+        """
+        Caches every chain the data pipeline searched for.
+
+        :param input_task: The task as it was sent to the data pipeline.
+        :type input_task: dict
+        :param data_task: The contents of the ``*_data.json`` it produced.
+        :type data_task: dict
+        """
+        for input_entry, data_entry in zip(input_task.get('sequences', []), data_task.get('sequences', [])):
+            for entity_type, input_chain in input_entry.items():
+                data_chain = data_entry.get(entity_type)
+                if data_chain is None or data_chain.get('sequence') != input_chain.get('sequence'):
+                    logger.warning("Data JSON chains do not line up with the fold input; not caching them.")
+                    return
+                if not chain_needs_search(entity_type, input_chain):
+                    continue
+                # Only cache what was actually searched: templates=[] in the
+                # input means no template search ran for this chain.
+                fields = {
+                    field: data_chain.get(field)
+                    for field in MSA_FIELDS[entity_type]
+                    if _field_missing(input_chain, field) and data_chain.get(field) is not None
+                }
+                if fields:
+                    self.put(entity_type, input_chain['sequence'], fields)
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits its size limit."""
+        if self.max_size_bytes is None or self._size_bytes <= self.max_size_bytes:
+            return
+        with self._lock:
+            for path, size, _ in sorted(self._entries(), key=lambda entry: entry[2]):
+                if self._size_bytes <= self.max_size_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                self._size_bytes -= size
+                self.stats['evicted'] += 1
+
+    def reset_stats(self):
+        """Resets the hit/miss counters, e.g. at the start of a batch."""
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+
+    def report(self):
+        """
+        Returns the counters since the last reset and the current cache size.
+
+        :rtype: dict
+        """
+        return dict(self.stats, size_bytes=self._size_bytes)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _entries(self):
+        """Yields (path, size, last used time) for every entry."""
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.json'):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime
@@ -0,0 +1,356 @@
+# afusion/profiling.py
+
+import contextlib
+import os
+import shlex
+import subprocess
+import tempfile
+import threading
+import time
+from loguru import logger
+
+DEFAULT_CGROUP_ROOT = '/sys/fs/cgroup'
+
+# Samples kept per job; when full, every other sample is dropped.
+_MAX_SAMPLES = 720
+
+
+def nvidia_smi_gpu_memory():
+    """
+    Returns the GPU memory in use on every device, as reported by ``nvidia-smi``.
+
+    This is the default GPU memory probe of :class:`ResourceProfiler`. Any
+    callable with the same return value can replace it, e.g.
+    ``lambda: {'0': 8 * 2**30}`` in tests or on hosts without NVIDIA tools.
+
+    :return: Bytes in use per device id, or None if ``nvidia-smi`` is not usable.
+    :rtype: dict or None
+    """
+    try:
+        output = subprocess.run(
+            ['nvidia-smi', '--query-gpu=index,memory.used', '--format=csv,noheader,nounits'],
+            capture_output=True, text=True, check=True, timeout=30,
+        ).stdout
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.debug(f"nvidia-smi is not usable: {e}")
+        return None
+    memory = {}
+    for line in output.splitlines():
+        index, _, used = line.partition(',')
+        if used.strip().isdigit():
+            memory[index.strip()] = int(used.strip()) * 2**20
+    return memory
+
+
+class ResourceProfiler:
+    """
+    Samples the CPU time, memory, disk I/O and GPU memory of AlphaFold runs.
+
+    For each run, :meth:`profile` samples the run's container from its
+    cgroup (cgroup v2, or v1 controllers) every ``interval`` seconds. If no
+    container cgroup can be found, e.g. for runs outside Docker, it samples
+    the launched process tree from ``/proc`` instead. GPU memory comes from
+    ``gpu_memory_probe`` for the devices the run was given. It is the memory
+    in use on those devices, so it is per job only while one job runs per
+    device.
+
+    Totals are taken from the last sample before the container exits, so
+    they can miss up to ``interval`` seconds of work at the end of a run.
+
+    :param interval: Seconds between samples.
+    :type interval: float
+    :param gpu_memory_probe: Callable returning the bytes in use per device
+        id. Defaults to :func:`nvidia_smi_gpu_memory`; None-returning probes
+        disable GPU sampling.
+    :type gpu_memory_probe: callable, optional
+    :param cgroup_root: Where the cgroup filesystem is mounted.
+    :type cgroup_root: str
+    """
+
+    def __init__(self, interval=5.0, gpu_memory_probe=nvidia_smi_gpu_memory, cgroup_root=DEFAULT_CGROUP_ROOT):
+        self.interval = interval
+        self.gpu_memory_probe = gpu_memory_probe
+        self.cgroup_root = cgroup_root
+
+    def prepare_command(self, docker_command, cidfile):
+        """Makes ``docker run`` write the container id to ``cidfile``, so the container's cgroup can be found."""
+        if not docker_command.startswith('docker run '):
+            return docker_command
+        return docker_command.replace('docker run ', f'docker run --cidfile {shlex.quote(cidfile)} ', 1)
+
+    @contextlib.contextmanager
+    def profile(self, docker_command, gpus=None):
+        """
+        Profiles one run of ``docker_command`` while the block runs.
+
+        Yields a :class:`RunProfile` whose ``command`` is the command to run
+        and whose :meth:`RunProfile.attach` must be given the launched
+        process. After the block, ``usage()`` of the profile returns the
+        summary.
+
+        :param docker_command: The command that will run.
+        :type docker_command: str
+        :param gpus: The ``--gpus`` value of the run ('all', 'device=1', ...),
+            or None for CPU-only runs.
+        :type gpus: str, optional
+        """
+        with tempfile.TemporaryDirectory(prefix='afusion-profile-') as tmp_dir:
+            cidfile = os.path.join(tmp_dir, 'container.id')
+            run_profile = RunProfile(self, self.prepare_command(docker_command, cidfile), cidfile, _gpu_devices(gpus))
+            try:
+                yield run_profile
+            finally:
+                run_profile.stop()
+
+
+class RunProfile:
+    """Resource samples of one run; created by :meth:`ResourceProfiler.profile`."""
+
+    def __init__(self, profiler, command, cidfile, gpu_devices):
+        self.command = command
+        self.samples = []
+        self._profiler = profiler
+        self._cidfile = cidfile
+        self._gpu_devices = gpu_devices
+        self._source = None
+        self._process = None
+        self._started_at = time.time()
+        self._stopped_at = None
+        self._totals = {'cpu_seconds': 0.0, 'read_bytes': 0, 'write_bytes': 0}
+        self._peaks = {'rss_bytes': 0, 'gpu_memory_bytes': None}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def attach(self, process):
+        """Starts sampling the launched process (a ``subprocess.Popen``)."""
+        self._process = process
+        self._started_at = time.time()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._stopped_at is None:
+            self._stopped_at = time.time()
+
+    def usage(self):
+        """
+        Summarizes the run.
+
+        :return: Dict with 'wall_seconds', 'cpu_seconds', 'peak_rss_bytes',
+            'read_bytes', 'write_bytes', 'peak_gpu_memory_bytes' (None
+            without GPU samples), 'source' ('cgroup', 'proc' or None) and
+            'samples' (dicts with 'time', 'cpu_seconds', 'rss_bytes' and
+            'gpu_memory_bytes').
+        :rtype: dict
+        """
+        return {
+            'wall_seconds': round((self._stopped_at or time.time()) - self._started_at, 3),
+            'cpu_seconds': round(self._totals['cpu_seconds'], 3),
+            'peak_rss_bytes': self._peaks['rss_bytes'],
+            'read_bytes': self._totals['read_bytes'],
+            'write_bytes': self._totals['write_bytes'],
+            'peak_gpu_memory_bytes': self._peaks['gpu_memory_bytes'],
+            'source': self._source,
+            'samples': list(self.samples),
+        }
+
+    def _run(self):
+        while True:
+            try:
+                self._sample()
+            except Exception as e:
+                logger.debug(f"Resource sample failed: {e}")
+            if self._stop.wait(self._profiler.interval):
+                return
+
+    def _sample(self):
+        reading = None
+        cgroup = self._find_cgroup()
+        if cgroup is not None:
+            reading = _read_cgroup(cgroup)
+            if reading is not None:
+                self._source = 'cgroup'
+        if reading is None and self._source != 'cgroup':
+            # The container is not known (yet); fall back to the process tree.
+            reading = _read_process_tree(self._process.pid)
+            if reading is not None:
+                self._source = 'proc'
+        if reading is not None:
+            for key in self._totals:
+                self._totals[key] = max(self._totals[key], reading[key])
+            self._peaks['rss_bytes'] = max(self._peaks['rss_bytes'], reading['rss_bytes'])
+
+        gpu_memory = None
+        if self._gpu_devices is not None and self._profiler.gpu_memory_probe is not None:
+            per_device = self._profiler.gpu_memory_probe()
+            if per_device:
+                devices = per_device if self._gpu_devices == 'all' else self._gpu_devices
+                gpu_memory = sum(per_device.get(device, 0) for device in devices)
+                self._peaks['gpu_memory_bytes'] = max(self._peaks['gpu_memory_bytes'] or 0, gpu_memory)
+
+        self.samples.append({
+            'time': time.time(),
+            'cpu_seconds': round(self._totals['cpu_seconds'], 3),
+            'rss_bytes': reading['rss_bytes'] if reading else None,
+            'gpu_memory_bytes': gpu_memory,
+        })
+        if len(self.samples) > _MAX_SAMPLES:
+            del self.samples[::2]
+
+    def _find_cgroup(self):
+        try:
+            with open(self._cidfile) as cid_file:
+                container_id = cid_file.read().strip()
+        except OSError:
+            return None
+        if not container_id:
+            return None
+        root = self._profiler.cgroup_root
+        for path in (
+            os.path.join(root, 'system.slice', f'docker-{container_id}.scope'),
+            os.path.join(root, 'docker', container_id),
+        ):
+            if os.path.exists(os.path.join(path, 'cgroup.controllers')):
+                return {'version': 2, 'path': path}
+        for relative in (os.path.join('system.slice', f'docker-{container_id}.scope'), os.path.join('docker', container_id)):
+            if os.path.isdir(os.path.join(root, 'cpuacct', relative)):
+                return {'version': 1, 'root': root, 'relative': relative}
+        return None
+
+
+def _gpu_devices(gpus):
+    """Returns the device ids a ``--gpus`` value selects, 'all', or None for CPU-only runs."""
+    if not gpus:
+        return None
+    if gpus.startswith('device='):
+        return [device.strip() for device in gpus[len('device='):].strip('"\'').split(',')]
+    return 'all'
+
+
+def _read_cgroup(cgroup):
+    """Reads CPU seconds, memory and I/O bytes of a container cgroup."""
+    try:
+        if cgroup['version'] == 2:
+            path = cgroup['path']
+            cpu_stat = _read_key_values(os.path.join(path, 'cpu.stat'))
+            rss = _read_int(os.path.join(path, 'memory.peak'))
+            if rss is None:
+                rss = _read_int(os.path.join(path, 'memory.current')) or 0
+            read_bytes = write_bytes = 0
+            with open(os.path.join(path, 'io.stat')) as io_file:
+                for line in io_file:
+                    fields = dict(field.split('=', 1) for field in line.split()[1:] if '=' in field)
+                    read_bytes += int(fields.get('rbytes', 0))
+                    write_bytes += int(fields.get('wbytes', 0))
+            return {
+                'cpu_seconds': cpu_stat.get('usage_usec', 0) / 1e6,
+                'rss_bytes': rss,
+                'read_bytes': read_bytes,
+                'write_bytes': write_bytes,
+            }
+
+        root, relative = cgroup['root'], cgroup['relative']
+        read_bytes = write_bytes = 0
+        with contextlib.suppress(OSError):
+            with open(os.path.join(root, 'blkio', relative, 'blkio.throttle.io_service_bytes')) as io_file:
+                for line in io_file:
+                    fields = line.split()
+                    if len(fields) == 3 and fields[1] == 'Read':
+                        read_bytes += int(fields[2])
+                    elif len(fields) == 3 and fields[1] == 'Write':
+                        write_bytes += int(fields[2])
+        return {
+            'cpu_seconds': (_read_int(os.path.join(root, 'cpuacct', relative, 'cpuacct.usage')) or 0) / 1e9,
+            'rss_bytes': _read_int(os.path.join(root, 'memory', relative, 'memory.max_usage_in_bytes')) or 0,
+            'read_bytes': read_bytes,
+            'write_bytes': write_bytes,
+        }
+    except OSError:
+        # The container has exited and its cgroup is gone.
+        return None
+
+
+def _read_process_tree(pid):
+    """Sums CPU seconds, resident memory and I/O bytes over a process and its descendants."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat_file:
+                # The command name may contain spaces; fields after it are fixed.
+                fields = stat_file.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+
+    tree = [pid]
+    for member in tree:
+        tree.extend(children.get(member, []))
+
+    ticks = os.sysconf('SC_CLK_TCK')
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    reading = {'cpu_seconds': 0.0, 'rss_bytes': 0, 'read_bytes': 0, 'write_bytes': 0}
+    found = False
+    for member in tree:
+        try:
+            with open(f'/proc/{member}/stat') as stat_file:
+                fields = stat_file.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        found = True
+        # utime, stime, cutime and cstime; rss in pages.
+        reading['cpu_seconds'] += sum(int(value) for value in fields[11:15]) / ticks
+        reading['rss_bytes'] += int(fields[21]) * page_size
+        with contextlib.suppress(OSError):
+            io = _read_key_values(f'/proc/{member}/io')
+            reading['read_bytes'] += io.get('read_bytes', 0)
+            reading['write_bytes'] += io.get('write_bytes', 0)
+    return reading if found else None
+
+
+def _read_key_values(path):
+    values = {}
+    with open(path) as stat_file:
+        for line in stat_file:
+            key, _, value = line.replace(':', ' ').partition(' ')
+            if value.strip().lstrip('-').isdigit():
+                values[key] = int(value.strip())
+    return values
+
+
+def _read_int(path):
+    try:
+        with open(path) as value_file:
+            return int(value_file.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def merge_resource_usage(*usages):
+    """
+    Combines the resource usage of the containers of one job: CPU time, I/O
+    and container wall time add up, peaks take the maximum, and samples are
+    kept in time order.
+
+    :rtype: dict or None
+    """
+    usages = [usage for usage in usages if usage]
+    if not usages:
+        return None
+    gpu_peaks = [usage['peak_gpu_memory_bytes'] for usage in usages if usage['peak_gpu_memory_bytes'] is not None]
+    sources = {usage['source'] for usage in usages if usage['source']}
+    return {
+        'wall_seconds': round(sum(usage['wall_seconds'] for usage in usages), 3),
+        'cpu_seconds': round(sum(usage['cpu_seconds'] for usage in usages), 3),
+        'peak_rss_bytes': max(usage['peak_rss_bytes'] for usage in usages),
+        'read_bytes': sum(usage['read_bytes'] for usage in usages),
+        'write_bytes': sum(usage['write_bytes'] for usage in usages),
+        'peak_gpu_memory_bytes': max(gpu_peaks) if gpu_peaks else None,
+        'source': sources.pop() if len(sources) == 1 else ('mixed' if sources else None),
+        'samples': sorted((sample for usage in usages for sample in usage['samples']), key=lambda s: s['time']),
+    }
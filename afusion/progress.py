@@ -0,0 +1,204 @@
+# afusion/progress.py
+
+import re
+import statistics
+import time
+
+# Stages that follow each other in a run; starting one ends the previous one.
+DATA_PIPELINE = 'data_pipeline'
+FEATURISATION = 'featurisation'
+INFERENCE = 'inference'
+OUTPUT_WRITING = 'output_writing'
+
+# Stages reported inside the ones above, possibly several at once.
+MSA_SEARCH = 'msa_search'
+TEMPLATE_SEARCH = 'template_search'
+SAMPLE_EXTRACTION = 'sample_extraction'
+
+# Estimated from the inference timings; included in INFERENCE.
+COMPILATION = 'compilation'
+
+_SEQUENTIAL_STAGES = (DATA_PIPELINE, FEATURISATION, INFERENCE, OUTPUT_WRITING)
+
+# (pattern, stage, 'start' or 'end'). The first matching pattern wins, so the
+# specific "... took N seconds" lines come before the start lines they extend.
+# 'detail' names the database, chain or seed; 'seconds' is the duration
+# AlphaFold 3 measured itself.
+_LINE_PATTERNS = (
+    (re.compile(r'Running data pipeline for chain (?P<detail>\S+) took (?P<seconds>[\d.]+) seconds'),
+     DATA_PIPELINE, 'end'),
+    (re.compile(r'Running data pipeline\.\.\.'), DATA_PIPELINE, 'start'),
+    (re.compile(r'Finished (?:Jackhmmer|Nhmmer) \((?P<detail>[^)]+)\)(?: query)? in (?P<seconds>[\d.]+) seconds'),
+     MSA_SEARCH, 'end'),
+    (re.compile(r'Finished (?:Hmmsearch|Hmmbuild)(?: \((?P<detail>[^)]+)\))?(?: query)? in (?P<seconds>[\d.]+) seconds'),
+     TEMPLATE_SEARCH, 'end'),
+    (re.compile(r'Featurising data with seed (?P<detail>\d+) took (?P<seconds>[\d.]+) seconds'), FEATURISATION, 'end'),
+    (re.compile(r'Featurising data with \d+ seed'), FEATURISATION, 'start'),
+    (re.compile(r'Running model inference with seed (?P<detail>\d+) took (?P<seconds>[\d.]+) seconds'), INFERENCE, 'end'),
+    (re.compile(r'Running model inference'), INFERENCE, 'start'),
+    (re.compile(r'Extracting (?:\d+ )?(?:inference|output structure) samples with seed (?P<detail>\d+) took (?P<seconds>[\d.]+) seconds'),
+     SAMPLE_EXTRACTION, 'end'),
+    (re.compile(r'Writing outputs'), OUTPUT_WRITING, 'start'),
+    (re.compile(r'Fold job .* done'), OUTPUT_WRITING, 'end'),
+)
+
+
+class ProgressParser:
+    """
+    Turns AlphaFold 3 output, line by line, into stage events and timings.
+
+    Feed it every line of a run (e.g. as ``on_line`` of
+    :func:`afusion.execution.run_alphafold`) and call :meth:`finish` when the
+    run ends. Stages are the data pipeline (with its MSA and template
+    searches per database), featurisation, inference per seed, sample
+    extraction and output writing. Where AlphaFold reports how long a step
+    took, that duration is used; otherwise a stage runs from its first line
+    until the next stage starts.
+
+    Each event is a dict with keys 'event' ('stage_start' or 'stage_end'),
+    'stage', 'detail' (database, chain or seed, or None), 'time' and, for
+    ends, 'seconds'.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._open = {}  # sequential stage -> start time
+        self._intervals = {}  # stage -> list of (start, end, detail)
+
+    def feed(self, line, timestamp=None):
+        """
+        Parses one line of output.
+
+        :param line: A line of AlphaFold 3 output.
+        :type line: str
+        :param timestamp: When the line was printed. Defaults to now.
+        :type timestamp: float, optional
+        :return: The events the line produced.
+        :rtype: list of dict
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        for pattern, stage, kind in _LINE_PATTERNS:
+            match = pattern.search(line)
+            if match is None:
+                continue
+            fields = match.groupdict()
+            detail = fields.get('detail')
+            if kind == 'start':
+                return self._start(stage, timestamp)
+            if fields.get('seconds') is not None:
+                seconds = float(fields['seconds'])
+                self._intervals.setdefault(stage, []).append((timestamp - seconds, timestamp, detail))
+                return self._emit([{'event': 'stage_end', 'stage': stage, 'detail': detail,
+                                    'time': timestamp, 'seconds': seconds}])
+            return self._emit(self._close(stage, timestamp))
+        return []
+
+    def finish(self, timestamp=None):
+        """
+        Ends every stage still running, e.g. when the run exits.
+
+        :return: The events this produced.
+        :rtype: list of dict
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        events = []
+        for stage in list(self._open):
+            events += self._close(stage, timestamp)
+        return self._emit(events)
+
+    def current_stage(self):
+        """
+        Returns the stage running now and when it started.
+
+        :return: ``(stage, start time)``, or None before the first stage and
+            after the last one.
+        :rtype: tuple or None
+        """
+        for stage, start in list(self._open.items()):
+            return stage, start
+        return None
+
+    def timings(self, detailed=False):
+        """
+        Returns the wall-clock seconds spent in each stage.
+
+        Steps that ran at the same time (e.g. MSA searches against several
+        databases) count once. 'compilation' is estimated as how much
+        longer the first inference seed took than the median of the others,
+        so it needs at least two seeds and is included in 'inference'.
+
+        :param detailed: Whether to break each stage down by detail.
+        :type detailed: bool
+        :return: Seconds per stage, or with ``detailed`` a dict per stage
+            with 'total' and seconds per database, chain or seed.
+        :rtype: dict
+        """
+        timings = {}
+        for stage, intervals in self._intervals.items():
+            total = round(_covered_seconds(intervals), 3)
+            if not detailed:
+                timings[stage] = total
+                continue
+            breakdown = {'total': total}
+            for start, end, detail in intervals:
+                if detail is not None:
+                    breakdown[detail] = round(breakdown.get(detail, 0.0) + end - start, 3)
+            timings[stage] = breakdown
+
+        seed_seconds = [end - start for start, end, detail in self._intervals.get(INFERENCE, []) if detail is not None]
+        if len(seed_seconds) >= 2:
+            compilation = round(max(0.0, seed_seconds[0] - statistics.median(seed_seconds[1:])), 3)
+            timings[COMPILATION] = {'total': compilation} if detailed else compilation
+        return timings
+
+    def _start(self, stage, timestamp):
+        if stage in self._open:
+            return []
+        events = []
+        for open_stage in list(self._open):
+            events += self._close(open_stage, timestamp)
+        self._open[stage] = timestamp
+        events.append({'event': 'stage_start', 'stage': stage, 'detail': None, 'time': timestamp})
+        return self._emit(events)
+
+    def _close(self, stage, timestamp):
+        start = self._open.pop(stage, None)
+        if start is None:
+            return []
+        self._intervals.setdefault(stage, []).append((start, timestamp, None))
+        return [{'event': 'stage_end', 'stage': stage, 'detail': None, 'time': timestamp,
+                 'seconds': timestamp - start}]
+
+    def _emit(self, events):
+        self.events.extend(events)
+        return events
+
+
+def merge_stage_timings(*timings):
+    """
+    Combines the stage timings of runs that happened at the same time, such
+    as the seed shards of one job, keeping the longest time per stage.
+
+    :rtype: dict
+    """
+    merged = {}
+    for run_timings in timings:
+        for stage, seconds in (run_timings or {}).items():
+            merged[stage] = max(merged.get(stage, 0.0), seconds)
+    return merged
+
+
+def _covered_seconds(intervals):
+    """Returns the length of the union of (start, end, detail) intervals."""
+    covered = 0.0
+    current_start = current_end = None
+    for start, end, _ in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                covered += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        covered += current_end - current_start
+    return covered
@@ -0,0 +1,310 @@
+# afusion/retry.py
+
+import copy
+import random
+import re
+import threading
+import time
+from afusion.execution import stop_process_group
+from loguru import logger
+
+# Failure classes, from the exit code and the last lines of output.
+TIMEOUT = 'timeout'
+GPU_OOM = 'gpu_oom'
+HOST_OOM = 'host_oom'
+TRANSIENT = 'transient'
+INVALID_INPUT = 'invalid_input'
+UNKNOWN = 'unknown'
+
+# Remedies tried, in order, for GPU out-of-memory failures.
+UNIFIED_MEMORY = 'unified_memory'
+FEWER_SAMPLES = 'fewer_samples'
+LARGER_GPU = 'larger_gpu'
+
+# Environment AlphaFold 3 documents for inputs that do not fit in GPU memory:
+# let XLA spill into host memory through CUDA unified memory.
+UNIFIED_MEMORY_ENV = {
+    'XLA_PYTHON_CLIENT_PREALLOCATE': 'false',
+    'TF_FORCE_UNIFIED_MEMORY': 'true',
+    'XLA_CLIENT_MEM_FRACTION': '3.2',
+}
+
+# (pattern, failure class), checked in order against the output.
+_FAILURE_PATTERNS = (
+    (re.compile(r'RESOURCE_EXHAUSTED|CUDA_ERROR_OUT_OF_MEMORY|CUDA out of memory|Out of memory while trying to allocate'),
+     GPU_OOM),
+    (re.compile(r'MemoryError|OOMKilled|Cannot allocate memory'), HOST_OOM),
+    (re.compile(r'Cannot connect to the Docker daemon|Error response from daemon|TLS handshake timeout|'
+                r'i/o timeout|Stale file handle|Resource temporarily unavailable|Connection reset by peer'),
+     TRANSIENT),
+    # AlphaFold 3 rejecting its flags or fold input: errors raised while
+    # folding_input.py parses the JSON, and its input-specific messages. Any
+    # other ValueError or KeyError (e.g. from JAX or a failed write) is not
+    # the input's fault and stays retryable.
+    (re.compile(r'FATAL Flags parsing error|JSONDecodeError|'
+                r'File "[^"]*folding_input\.py", line \d+|'
+                r'Failed to (?:load|parse) (?:fold )?input|'
+                r'Unsupported (?:dialect|version)|Unknown CCD code|Unknown (?:residue|ligand)|'
+                r'Invalid (?:chain ID|sequence|SMILES|CCD)|Duplicate chain ID|'
+                r'(?:ValueError|KeyError): .*\b(?:fold input|chain ID|modelSeeds|bondedAtomPairs|ccdCodes)\b'),
+     INVALID_INPUT),
+)
+
+# Exit codes that say what happened without any output.
+_EXIT_CODE_FAILURES = {
+    137: HOST_OOM,  # SIGKILL, which is what the kernel's OOM killer sends
+    125: TRANSIENT,  # docker run could not start the container
+}
+
+
+def classify_failure(returncode, output='', timed_out=False):
+    """
+    Classifies how an AlphaFold run failed.
+
+    :param returncode: Exit code of the run.
+    :type returncode: int
+    :param output: The run's output, or its last lines.
+    :type output: str
+    :param timed_out: Whether the run was stopped for taking too long.
+    :type timed_out: bool
+    :return: None if the run succeeded, otherwise one of TIMEOUT, GPU_OOM,
+        HOST_OOM, TRANSIENT, INVALID_INPUT or UNKNOWN.
+    :rtype: str or None
+    """
+    if timed_out:
+        return TIMEOUT
+    if returncode == 0:
+        return None
+    for pattern, failure in _FAILURE_PATTERNS:
+        if pattern.search(output or ''):
+            return failure
+    return _EXIT_CODE_FAILURES.get(returncode, UNKNOWN)
+
+
+class RetryPolicy:
+    """
+    Decides whether and how a failed AlphaFold run is tried again.
+
+    Give it to :func:`afusion.api.run_batch_predictions` as ``retry_policy``.
+    Every container a job runs is then watched against ``stage_timeouts``
+    and, if it fails, classified with :func:`classify_failure`:
+
+    - Failures in ``retry_failures`` (by default transient Docker or file
+      system errors, timeouts and host out-of-memory kills) are retried
+      after an exponential backoff.
+    - GPU out-of-memory failures of inference runs are retried at once with
+      the next of ``oom_remedies``: AlphaFold 3's unified memory settings,
+      fewer diffusion samples per seed, and finally requeueing the job onto
+      one of ``large_gpu_devices`` after the rest of the batch.
+    - Invalid input is never retried.
+
+    Each container of a job runs at most ``max_attempts`` times, and a job
+    requeued onto a larger GPU gets that many attempts there.
+
+    :param max_attempts: Runs per job, including the first.
+    :type max_attempts: int
+    :param backoff: Seconds to wait before the first retry.
+    :type backoff: float
+    :param backoff_factor: Factor the wait grows by with every retry.
+    :type backoff_factor: float
+    :param max_backoff: Longest wait between retries, in seconds.
+    :type max_backoff: float
+    :param stage_timeouts: Seconds each stage may run, keyed by the stages of
+        :mod:`afusion.progress` (e.g. ``{'data_pipeline': 4 * 3600,
+        'inference': 3600}``), plus 'total' for the whole run.
+    :type stage_timeouts: dict, optional
+    :param retry_failures: Failure classes retried after a backoff.
+    :type retry_failures: iterable of str
+    :param oom_remedies: Remedies for GPU out-of-memory failures, in the
+        order they are tried; each one is kept for later attempts.
+    :type oom_remedies: iterable of str
+    :param oom_diffusion_samples: Diffusion samples per seed for the
+        FEWER_SAMPLES remedy (AlphaFold 3 runs 5).
+    :type oom_diffusion_samples: int
+    :param large_gpu_devices: Device ids with more memory, for LARGER_GPU.
+    :type large_gpu_devices: list, optional
+    :param kill_grace: Seconds between SIGTERM and SIGKILL for a run that
+        timed out.
+    :type kill_grace: float
+    """
+
+    def __init__(
+        self,
+        max_attempts=3,
+        backoff=30.0,
+        backoff_factor=2.0,
+        max_backoff=600.0,
+        stage_timeouts=None,
+        retry_failures=(TRANSIENT, TIMEOUT, HOST_OOM),
+        oom_remedies=(UNIFIED_MEMORY, FEWER_SAMPLES, LARGER_GPU),
+        oom_diffusion_samples=2,
+        large_gpu_devices=None,
+        kill_grace=30.0,
+    ):
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff = backoff
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.stage_timeouts = dict(stage_timeouts or {})
+        self.retry_failures = set(retry_failures)
+        self.oom_remedies = tuple(oom_remedies)
+        self.oom_diffusion_samples = oom_diffusion_samples
+        self.large_gpu_devices = [str(device) for device in large_gpu_devices or []]
+        self.kill_grace = kill_grace
+
+    def delay(self, attempt):
+        """
+        Returns the seconds to wait after failed attempt ``attempt`` (1-based),
+        with up to 10% jitter so workers that failed together do not retry
+        together.
+
+        :rtype: float
+        """
+        delay = min(self.max_backoff, self.backoff * self.backoff_factor ** (attempt - 1))
+        return delay * random.uniform(0.9, 1.0)
+
+    def next_remedy(self, applied, gpus=None):
+        """
+        Returns the next GPU out-of-memory remedy to try, or None if none is left.
+
+        :param applied: Remedies already applied to the run.
+        :type applied: list of str
+        :param gpus: The run's ``--gpus`` value; LARGER_GPU is skipped when
+            the run is already on one of the large devices.
+        :type gpus: str, optional
+        """
+        for remedy in self.oom_remedies:
+            if remedy in applied:
+                continue
+            if remedy == LARGER_GPU and (not self.large_gpu_devices or _device_of(gpus) in self.large_gpu_devices):
+                continue
+            return remedy
+        return None
+
+    def retry(self, failure, attempt, applied, gpus=None, inference=True):
+        """
+        Decides what to do after a failed attempt.
+
+        :param failure: The failure class, from :func:`classify_failure`.
+        :type failure: str
+        :param attempt: Number of the attempt that failed, 1-based.
+        :type attempt: int
+        :param applied: Remedies already applied to the run.
+        :type applied: list of str
+        :param gpus: The run's ``--gpus`` value.
+        :type gpus: str, optional
+        :param inference: Whether the run includes inference.
+        :type inference: bool
+        :return: None to give up, otherwise ``(delay, remedy)``: seconds to
+            wait and the remedy to add (None for a plain retry).
+        :rtype: tuple or None
+        """
+        if failure is None or attempt >= self.max_attempts:
+            return None
+        if failure == GPU_OOM and inference:
+            remedy = self.next_remedy(applied, gpus)
+            return None if remedy is None else (0.0, remedy)
+        if failure in self.retry_failures:
+            return self.delay(attempt), None
+        return None
+
+    def without_requeue(self):
+        """Returns a copy of the policy that never requeues onto a larger GPU."""
+        policy = copy.copy(self)
+        policy.oom_remedies = tuple(remedy for remedy in self.oom_remedies if remedy != LARGER_GPU)
+        return policy
+
+    def timeout_for(self, stage):
+        """Returns the timeout of a stage, or None."""
+        return self.stage_timeouts.get(stage)
+
+
+def apply_remedies(docker_command, remedies, policy):
+    """
+    Adds the options of GPU out-of-memory remedies to a ``docker run`` command.
+
+    LARGER_GPU is not applied here: the run is requeued instead (see
+    :func:`with_gpus`).
+
+    :param docker_command: Command from :func:`afusion.execution.build_docker_command`.
+    :type docker_command: str
+    :param remedies: Remedies to apply.
+    :type remedies: list of str
+    :param policy: The policy the remedies came from.
+    :type policy: RetryPolicy
+    :rtype: str
+    """
+    if UNIFIED_MEMORY in remedies:
+        env_options = ''.join(f"--env {name}={value} " for name, value in UNIFIED_MEMORY_ENV.items())
+        docker_command = docker_command.replace('docker run ', f'docker run {env_options}', 1)
+    if FEWER_SAMPLES in remedies:
+        docker_command = f"{docker_command.rstrip()} --num_diffusion_samples={policy.oom_diffusion_samples}"
+    return docker_command
+
+
+def with_gpus(docker_command, gpus):
+    """Returns a ``docker run`` command with its ``--gpus`` value replaced, e.g. by 'device=2'."""
+    return re.sub(r'--gpus \S+', f'--gpus {gpus}', docker_command, count=1)
+
+
+def _device_of(gpus):
+    if gpus and gpus.startswith('device='):
+        return gpus[len('device='):]
+    return None
+
+
+class StageWatchdog:
+    """
+    Stops a run whose current stage has run longer than its timeout.
+
+    The stage comes from a :class:`afusion.progress.ProgressParser` fed with
+    the run's output; before the first stage starts, and for stages without
+    a timeout, only the 'total' timeout applies. The run is stopped with
+    :func:`afusion.execution.stop_process_group`.
+
+    :param policy: Policy with the timeouts.
+    :type policy: RetryPolicy
+    :param progress: Parser fed with the run's output.
+    :type progress: afusion.progress.ProgressParser
+    :param poll_interval: Seconds between checks.
+    :type poll_interval: float
+    """
+
+    def __init__(self, policy, progress, poll_interval=5.0):
+        self.policy = policy
+        self.progress = progress
+        self.poll_interval = poll_interval
+        self.timed_out_stage = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def attach(self, process):
+        """Starts watching ``process``, a ``subprocess.Popen``."""
+        if not self.policy.stage_timeouts:
+            return
+        self._thread = threading.Thread(target=self._watch, args=(process, time.time()), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops watching; call when the run has ended."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _watch(self, process, started):
+        while not self._stopped.wait(self.poll_interval):
+            now = time.time()
+            stage, stage_started = self.progress.current_stage() or (None, started)
+            expired = None
+            stage_timeout = self.policy.timeout_for(stage) if stage else None
+            if stage_timeout is not None and now - stage_started > stage_timeout:
+                expired = stage
+            total_timeout = self.policy.timeout_for('total')
+            if total_timeout is not None and now - started > total_timeout:
+                expired = expired or 'total'
+            if expired is None:
+                continue
+            self.timed_out_stage = expired
+            logger.warning(f"Stopping AlphaFold run: stage '{expired}' exceeded its timeout.")
+            stop_process_group(process, self.policy.kill_grace)
+            return
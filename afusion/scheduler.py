@@ -0,0 +1,245 @@
+# afusion/scheduler.py
+
+import collections
+import contextlib
+import os
+import queue
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+
+
+class CpuSlots:
+    """
+    Splits the host's cores into disjoint slots, one per concurrently running job.
+
+    Each slot is a dict with 'cpuset' (a ``--cpuset-cpus`` value) and 'n_cpu'
+    (the thread count to give jackhmmer/nhmmer). A job checks a slot out for
+    as long as its container runs, so running jobs never share cores.
+
+    :param workers: Number of jobs that may run at the same time.
+    :type workers: int
+    :param cores_per_job: Cores given to each job. Defaults to an even split
+        of ``total_cores`` across ``workers``.
+    :type cores_per_job: int, optional
+    :param total_cores: Cores available for scheduling. Defaults to the cores
+        this process may run on.
+    :type total_cores: int, optional
+    """
+
+    def __init__(self, workers, cores_per_job=None, total_cores=None):
+        if total_cores is None:
+            if hasattr(os, 'sched_getaffinity'):
+                cpu_ids = sorted(os.sched_getaffinity(0))
+            else:
+                cpu_ids = list(range(os.cpu_count() or 1))
+        else:
+            cpu_ids = list(range(total_cores))
+        total_cores = len(cpu_ids)
+
+        workers = max(1, int(workers))
+        if cores_per_job is None:
+            cores_per_job = max(1, total_cores // workers)
+        cores_per_job = min(cores_per_job, total_cores)
+        if cores_per_job * workers > total_cores:
+            logger.warning(
+                f"{workers} workers x {cores_per_job} cores exceeds the {total_cores} available cores; "
+                f"running {total_cores // cores_per_job} jobs at a time."
+            )
+            workers = total_cores // cores_per_job
+
+        self.workers = workers
+        self.cores_per_job = cores_per_job
+        self._slots = queue.Queue()
+        for i in range(workers):
+            slot_cpu_ids = cpu_ids[i * cores_per_job:(i + 1) * cores_per_job]
+            self._slots.put({
+                'cpuset': _format_cpuset(slot_cpu_ids),
+                'n_cpu': len(slot_cpu_ids),
+            })
+
+    @contextlib.contextmanager
+    def acquire(self):
+        """Checks out a free slot, blocking until one is available."""
+        slot = self._slots.get()
+        try:
+            yield slot
+        finally:
+            self._slots.put(slot)
+
+
+def probe_gpu_devices():
+    """
+    Lists the GPU devices on this host.
+
+    Asks ``nvidia-smi`` first and falls back to ``CUDA_VISIBLE_DEVICES``.
+
+    :return: Device ids as strings, empty if no GPU was found.
+    :rtype: list of str
+    """
+    try:
+        output = subprocess.run(
+            ['nvidia-smi', '--query-gpu=index', '--format=csv,noheader'],
+            capture_output=True, text=True, check=True, timeout=30,
+        ).stdout
+        devices = [line.strip() for line in output.splitlines() if line.strip()]
+        if devices:
+            return devices
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.debug(f"nvidia-smi is not usable: {e}")
+    visible = os.environ.get('CUDA_VISIBLE_DEVICES', '')
+    return [device.strip() for device in visible.split(',') if device.strip() and device.strip() != '-1']
+
+
+class GpuSlots:
+    """
+    Hands out GPU devices, one per concurrently running inference job.
+
+    Each slot is a device id; a job checks it out for as long as its
+    container runs and passes it to ``docker run --gpus device=<id>``.
+
+    :param devices: Device ids to schedule on. Defaults to what ``probe``
+        finds.
+    :type devices: list, optional
+    :param probe: Callable returning the device ids; defaults to
+        :func:`probe_gpu_devices`. Pass a fake to schedule without GPUs.
+    :type probe: callable, optional
+    :raises ValueError: If no devices were given or found.
+    """
+
+    def __init__(self, devices=None, probe=None):
+        if devices is None:
+            devices = (probe or probe_gpu_devices)()
+        devices = [str(device) for device in devices]
+        if not devices:
+            raise ValueError("No GPU devices found to schedule inference on.")
+        logger.info(f"Scheduling inference on GPU devices: {', '.join(devices)}")
+
+        self.devices = devices
+        self.workers = len(devices)
+        self._slots = queue.Queue()
+        for device in devices:
+            self._slots.put(device)
+
+    @contextlib.contextmanager
+    def acquire(self):
+        """Checks out a free device, blocking until one is available."""
+        device = self._slots.get()
+        try:
+            yield device
+        finally:
+            self._slots.put(device)
+
+
+def _format_cpuset(cpu_ids):
+    """Formats sorted CPU ids as a ``--cpuset-cpus`` value, e.g. '0-3,8'."""
+    ranges = []
+    for cpu_id in cpu_ids:
+        if ranges and ranges[-1][1] == cpu_id - 1:
+            ranges[-1][1] = cpu_id
+        else:
+            ranges.append([cpu_id, cpu_id])
+    return ','.join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+
+def run_parallel(jobs, run_stage, workers=1):
+    """
+    Runs one stage for every job on a pool of ``workers`` threads.
+
+    :param jobs: Job dicts to process.
+    :type jobs: iterable of dict
+    :param run_stage: Called once with each job.
+    :type run_stage: callable
+    :param workers: Number of jobs to run at the same time.
+    :type workers: int
+    :return: The processed jobs, in input order.
+    :rtype: list of dict
+    """
+    jobs = list(jobs)
+    with ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="afusion-worker") as executor:
+        for job, future in [(job, executor.submit(run_stage, job)) for job in jobs]:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Stage raised for job '{job['job_name']}': {e}")
+                job['status'] = f'Failed: {e}'
+    return jobs
+
+
+def run_pipelined(jobs, run_pipeline_stage, run_inference_stage, lookahead=1, pipeline_workers=1,
+                  inference_workers=1):
+    """
+    Runs a batch as a two-stage pipeline: data pipeline (CPU) then inference (GPU).
+
+    While inference runs for job N, the data pipeline for jobs N+1..N+lookahead
+    runs on a pool of ``pipeline_workers`` background threads. Jobs reach the
+    inference stage in the order they were given, and a job whose data
+    pipeline failed is not passed on. With ``inference_workers`` > 1, that
+    many inference stages run at the same time (e.g. one per GPU).
+
+    :param jobs: Job dicts to process.
+    :type jobs: iterable of dict
+    :param run_pipeline_stage: Called with a job; returns True if the data
+        pipeline output is ready for inference.
+    :type run_pipeline_stage: callable
+    :param run_inference_stage: Called with a job whose data pipeline succeeded.
+    :type run_inference_stage: callable
+    :param lookahead: Maximum number of jobs whose data pipeline may run ahead
+        of inference. Raised to ``pipeline_workers`` if smaller, so that
+        every worker has a job to run.
+    :type lookahead: int
+    :param pipeline_workers: Number of data pipelines that may run at the
+        same time.
+    :type pipeline_workers: int
+    :param inference_workers: Number of inference stages that may run at
+        the same time.
+    :type inference_workers: int
+    :return: The processed jobs, in input order.
+    :rtype: list of dict
+    """
+    pipeline_workers = max(1, int(pipeline_workers))
+    inference_workers = max(1, int(inference_workers))
+    lookahead = max(1, int(lookahead), pipeline_workers)
+    jobs = iter(jobs)
+    pending = collections.deque()
+    processed = []
+    inference_free = threading.Semaphore(inference_workers)
+
+    def inference_stage(job):
+        try:
+            run_inference_stage(job)
+        except Exception as e:
+            logger.error(f"Inference stage raised for job '{job['job_name']}': {e}")
+            job['status'] = f'Failed to run inference: {e}'
+        finally:
+            inference_free.release()
+
+    with ThreadPoolExecutor(max_workers=pipeline_workers, thread_name_prefix="afusion-pipeline") as executor, \
+            ThreadPoolExecutor(max_workers=inference_workers, thread_name_prefix="afusion-inference") as inference:
+        def fill():
+            while len(pending) < lookahead:
+                job = next(jobs, None)
+                if job is None:
+                    return
+                pending.append((job, executor.submit(run_pipeline_stage, job)))
+
+        fill()
+        while pending:
+            job, future = pending.popleft()
+            try:
+                ready = future.result()
+            except Exception as e:
+                logger.error(f"Data pipeline stage raised for job '{job['job_name']}': {e}")
+                job['status'] = f'Failed to run data pipeline: {e}'
+                ready = False
+            # Keep the CPU busy with the next jobs while this one is on the GPU.
+            fill()
+            if ready:
+                # Wait for a free inference worker, so the data pipeline stays
+                # at most `lookahead` jobs ahead of inference.
+                inference_free.acquire()
+                inference.submit(inference_stage, job)
+            processed.append(job)
+
+    return processed
@@ -0,0 +1,286 @@
+# afusion/screen.py
+
+import hashlib
+import os
+from afusion.fasta import FastaRecord, iter_fasta_records
+from afusion.msa_cache import MSA_FIELDS, make_chain_task
+from loguru import logger
+
+# Separates the bait and prey IDs in a pair's job name.
+PAIR_NAME_SEPARATOR = '__'
+
+# Folder under the input and output base paths for the chain searches.
+_CHAINS_FOLDER = '_screen_chains'
+
+# Options of run_batch_predictions that apply to the chain searches.
+_CHAIN_OPTIONS = (
+    'pipeline_workers', 'cores_per_job', 'memory_per_job', 'journal_path', 'retry_policy',
+    'resource_profiler', 'metrics', 'validate',
+)
+
+
+def load_library(library):
+    """
+    Reads a bait or prey library.
+
+    :param library: Path to a FASTA file, or an iterable of
+        :class:`afusion.fasta.FastaRecord` or ``(id, sequence)`` pairs, or a
+        dict of sequences by ID.
+    :type library: str or iterable or dict
+    :return: The library's records, in order.
+    :rtype: list of FastaRecord
+    :raises ValueError: If two records share an ID, which would give two
+        jobs the same name.
+    """
+    if isinstance(library, str):
+        records = iter_fasta_records(library)
+    elif isinstance(library, dict):
+        records = library.items()
+    else:
+        records = library
+    loaded = []
+    seen = set()
+    for record in records:
+        if not isinstance(record, FastaRecord):
+            record_id, sequence = record
+            record = FastaRecord(record_id, record_id, sequence)
+        if record.id in seen:
+            raise ValueError(f"Library record ID '{record.id}' is used twice")
+        seen.add(record.id)
+        loaded.append(record)
+    return loaded
+
+
+def screen_job_name(bait, prey):
+    """Returns the job name of a bait-prey pair: ``<bait ID>__<prey ID>``."""
+    return f"{bait.id}{PAIR_NAME_SEPARATOR}{prey.id}"
+
+
+def screen_size(baits, preys):
+    """Returns the number of pair tasks of a screen."""
+    return len(baits) * len(preys)
+
+
+def iter_screen_tasks(baits, preys, shard_index=0, num_shards=1, model_seeds=None, bait_type='protein',
+                      prey_type='protein'):
+    """
+    Lazily creates one task per bait-prey pair.
+
+    Pairs are numbered bait by bait (every prey of the first bait, then of
+    the second, ...) and shard ``shard_index`` of ``num_shards`` gets every
+    ``num_shards``-th pair starting at ``shard_index``, so shards have
+    about the same size and together cover the screen exactly once. Only
+    the pairs of the shard are generated, one at a time.
+
+    The bait is chain A and the prey chain B; a pair of identical sequences
+    becomes one entity with both IDs. Chains have no MSA fields, so the
+    data pipeline searches them, or ``run_batch_predictions(msa_cache=...)``
+    fills them from the results of :func:`iter_screen_chain_tasks`.
+
+    :param baits: Bait library, from :func:`load_library`.
+    :type baits: list of FastaRecord
+    :param preys: Prey library, from :func:`load_library`.
+    :type preys: list of FastaRecord
+    :param shard_index: Shard to generate, from 0.
+    :type shard_index: int
+    :param num_shards: Number of shards the screen is split into.
+    :type num_shards: int
+    :param model_seeds: Model seeds of every task. Defaults to [1].
+    :type model_seeds: list of int, optional
+    :param bait_type: 'protein', 'rna' or 'dna'.
+    :type bait_type: str
+    :param prey_type: 'protein', 'rna' or 'dna'.
+    :type prey_type: str
+    :return: Generator of task dictionaries, named with :func:`screen_job_name`.
+    :rtype: generator of dict
+    """
+    from afusion.api import create_batch_task
+
+    _check_shard(shard_index, num_shards)
+    model_seeds = list(model_seeds or [1])
+    for pair_index in range(shard_index, screen_size(baits, preys), num_shards):
+        bait = baits[pair_index // len(preys)]
+        prey = preys[pair_index % len(preys)]
+        yield create_batch_task(
+            screen_job_name(bait, prey),
+            [
+                {'type': bait_type, 'id': 'A', 'sequence_data': _chain_data(bait_type, bait.sequence)},
+                {'type': prey_type, 'id': 'B', 'sequence_data': _chain_data(prey_type, prey.sequence)},
+            ],
+            list(model_seeds),
+        )
+
+
+def iter_screen_chain_tasks(baits, preys, shard_index=0, num_shards=1, bait_type='protein', prey_type='protein'):
+    """
+    Creates one single-chain data pipeline task per distinct chain of a screen.
+
+    A sequence in both libraries, or several times in one, is one chain, so
+    running these tasks with ``run_inference=False`` and an
+    :class:`afusion.msa_cache.MsaCache` searches every chain once. The
+    pair tasks then find all their chains in the cache and skip the data
+    pipeline. DNA chains are left out, as AlphaFold 3 searches nothing for
+    them. Shards split the chains like :func:`iter_screen_tasks` splits
+    the pairs.
+
+    :return: Generator of task dictionaries named ``chain_<hash>``.
+    :rtype: generator of dict
+    """
+    _check_shard(shard_index, num_shards)
+    chains = {}
+    for entity_type, library in ((bait_type, baits), (prey_type, preys)):
+        if entity_type not in MSA_FIELDS:
+            continue
+        for record in library:
+            chains.setdefault((entity_type, record.sequence), None)
+    logger.info(f"Screen of {len(baits)} baits and {len(preys)} preys has {len(chains)} distinct chains to search.")
+    for chain_index, (entity_type, sequence) in enumerate(chains):
+        if chain_index % num_shards != shard_index:
+            continue
+        digest = hashlib.sha256(f"{entity_type}\0{sequence}".encode()).hexdigest()[:16]
+        # Search only what the pair tasks leave to the data pipeline.
+        chain_data = _chain_data(entity_type, sequence)
+        search_fields = [field for field in MSA_FIELDS[entity_type] if chain_data.get(field) is None]
+        yield make_chain_task(f"chain_{digest}", entity_type, sequence, search_fields)
+
+
+def run_screen_chains(baits, preys, af_input_base_path, af_output_base_path, model_parameters_dir, databases_dir,
+                      msa_cache, shard_index=0, num_shards=1, bait_type='protein', prey_type='protein',
+                      **batch_options):
+    """
+    Runs the data pipeline for the distinct chains of a screen, or one shard of them.
+
+    Chains already in ``msa_cache`` are not searched again. Run every shard
+    (on as many hosts, sharing the cache) before any shard of
+    :func:`run_screen` with ``search_chains=False``, so that no pair
+    searches a chain itself.
+
+    :param baits: Bait library, for :func:`load_library`.
+    :type baits: str or iterable or dict
+    :param preys: Prey library, for :func:`load_library`.
+    :type preys: str or iterable or dict
+    :param af_input_base_path: Base path for AlphaFold input; the chain
+        tasks go to its ``_screen_chains`` folder.
+    :type af_input_base_path: str
+    :param af_output_base_path: Base path for AlphaFold output; the chain
+        searches go to its ``_screen_chains`` folder.
+    :type af_output_base_path: str
+    :param model_parameters_dir: Path to model parameters directory.
+    :type model_parameters_dir: str
+    :param databases_dir: Path to databases directory.
+    :type databases_dir: str
+    :param msa_cache: Cache the chain searches are stored in.
+    :type msa_cache: afusion.msa_cache.MsaCache
+    :param shard_index: Shard of the chains to search, from 0.
+    :type shard_index: int
+    :param num_shards: Number of shards the chains are split into.
+    :type num_shards: int
+    :param batch_options: Further keyword arguments for
+        :func:`afusion.api.run_batch_predictions`; only those that apply
+        to the data pipeline (such as ``pipeline_workers``,
+        ``cores_per_job``, ``memory_per_job``, ``journal_path`` and
+        ``retry_policy``) are used.
+    :return: The chain results, as from :func:`afusion.api.run_batch_predictions`.
+    :rtype: list of dict
+    """
+    from afusion.api import run_batch_predictions
+
+    baits = load_library(baits)
+    preys = load_library(preys)
+    chain_options = {name: value for name, value in batch_options.items() if name in _CHAIN_OPTIONS}
+    chain_results = run_batch_predictions(
+        iter_screen_chain_tasks(baits, preys, shard_index, num_shards, bait_type=bait_type, prey_type=prey_type),
+        os.path.join(af_input_base_path, _CHAINS_FOLDER),
+        os.path.join(af_output_base_path, _CHAINS_FOLDER),
+        model_parameters_dir,
+        databases_dir,
+        run_inference=False,
+        msa_cache=msa_cache,
+        **chain_options
+    )
+    failed = [result['job_name'] for result in chain_results if result['status'] != 'Success']
+    if failed:
+        logger.warning(f"Data pipeline failed for {len(failed)} screen chains; their pairs search them again.")
+    return chain_results
+
+
+def run_screen(baits, preys, af_input_base_path, af_output_base_path, model_parameters_dir, databases_dir,
+               msa_cache, shard_index=0, num_shards=1, model_seeds=None, search_chains=None, **batch_options):
+    """
+    Runs a bait-prey screen, or one shard of it, searching every chain once.
+
+    With ``search_chains``, first every distinct chain of the screen not
+    yet in ``msa_cache`` is searched (see :func:`run_screen_chains`), then
+    every pair of the shard runs with its chains filled from the cache.
+
+    By default chains are searched only for an unsharded screen. To spread
+    a screen over several hosts, run shard i of :func:`run_screen_chains`
+    on host i and, once all hosts are done, shard i of this function with
+    the same cache; the pairs then search nothing. Pass
+    ``search_chains=True`` only when shards run one after another, as
+    shards started together would each search every chain. A pair whose
+    chains are not cached still runs its own data pipeline.
+
+    :param baits: Bait library, for :func:`load_library`.
+    :type baits: str or iterable or dict
+    :param preys: Prey library, for :func:`load_library`.
+    :type preys: str or iterable or dict
+    :param af_input_base_path: Base path for AlphaFold input.
+    :type af_input_base_path: str
+    :param af_output_base_path: Base path for AlphaFold output; chain
+        searches go to its ``_screen_chains`` folder.
+    :type af_output_base_path: str
+    :param model_parameters_dir: Path to model parameters directory.
+    :type model_parameters_dir: str
+    :param databases_dir: Path to databases directory.
+    :type databases_dir: str
+    :param msa_cache: Cache the chain searches are stored in.
+    :type msa_cache: afusion.msa_cache.MsaCache
+    :param shard_index: Shard to run, from 0.
+    :type shard_index: int
+    :param num_shards: Number of shards the screen is split into.
+    :type num_shards: int
+    :param model_seeds: Model seeds of every pair. Defaults to [1].
+    :type model_seeds: list of int, optional
+    :param search_chains: Whether to search all chains of the screen
+        first. Defaults to True for an unsharded screen, False otherwise.
+    :type search_chains: bool, optional
+    :param batch_options: Further keyword arguments for
+        :func:`afusion.api.run_batch_predictions`, used for the pairs and,
+        where they apply, for the chain searches.
+    :return: The pair results, as from :func:`afusion.api.run_batch_predictions`.
+    :rtype: list of dict
+    """
+    from afusion.api import run_batch_predictions
+
+    baits = load_library(baits)
+    preys = load_library(preys)
+    if search_chains is None:
+        search_chains = num_shards == 1
+    if search_chains:
+        run_screen_chains(baits, preys, af_input_base_path, af_output_base_path, model_parameters_dir,
+                          databases_dir, msa_cache, **batch_options)
+    return run_batch_predictions(
+        iter_screen_tasks(baits, preys, shard_index, num_shards, model_seeds=model_seeds),
+        af_input_base_path,
+        af_output_base_path,
+        model_parameters_dir,
+        databases_dir,
+        msa_cache=msa_cache,
+        **batch_options
+    )
+
+
+def _chain_data(entity_type, sequence):
+    from afusion.api import create_dna_sequence_data, create_protein_sequence_data, create_rna_sequence_data
+
+    if entity_type == 'rna':
+        return create_rna_sequence_data(sequence)
+    if entity_type == 'dna':
+        return create_dna_sequence_data(sequence)
+    return create_protein_sequence_data(sequence)
+
+
+def _check_shard(shard_index, num_shards):
+    if num_shards < 1 or not 0 <= shard_index < num_shards:
+        raise ValueError(f"Shard {shard_index} does not exist in a screen of {num_shards} shards")
@@ -0,0 +1,109 @@
+# afusion/seed_fanout.py
+
+import csv
+import os
+import shutil
+from loguru import logger
+
+
+def split_model_seeds(model_seeds, num_shards):
+    """
+    Splits a task's model seeds into contiguous groups, one per inference run.
+
+    :param model_seeds: The task's ``modelSeeds``.
+    :type model_seeds: list of int
+    :param num_shards: Number of inference runs to split the seeds across.
+        Capped at the number of seeds.
+    :type num_shards: int
+    :return: Non-empty seed lists, in seed order.
+    :rtype: list of list of int
+    """
+    num_shards = max(1, min(int(num_shards), len(model_seeds)))
+    base, extra = divmod(len(model_seeds), num_shards)
+    shards = []
+    start = 0
+    for i in range(num_shards):
+        end = start + base + (1 if i < extra else 0)
+        shards.append(list(model_seeds[start:end]))
+        start = end
+    return shards
+
+
+def merge_seed_shard_outputs(shard_output_folders, output_folder):
+    """
+    Merges the outputs of inference runs over disjoint seeds of one job.
+
+    The ``seed-*`` sample folders of every run are moved into
+    ``output_folder``, the ranking score CSVs are combined, and the
+    top-level files (top-ranked model and its confidences) are taken from
+    the run that produced the best-ranked sample, so the result has the
+    layout of a single run over all seeds. Shard folders are removed
+    afterwards.
+
+    :param shard_output_folders: Each run's job output folder.
+    :type shard_output_folders: list of str
+    :param output_folder: The job's final output folder.
+    :type output_folder: str
+    :return: The merged ranking rows as dicts with keys 'seed', 'sample' and
+        'ranking_score', best first.
+    :rtype: list of dict
+    :raises FileNotFoundError: If a run produced no ranking scores.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    rows = []
+    ranking_file_name = None
+    best_folder = None
+    best_score = None
+    for shard_folder in shard_output_folders:
+        shard_ranking = _find_ranking_scores(shard_folder)
+        if shard_ranking is None:
+            raise FileNotFoundError(f"No ranking scores in seed shard output {shard_folder}")
+        ranking_file_name = ranking_file_name or os.path.basename(shard_ranking)
+        with open(shard_ranking, newline='') as ranking_file:
+            for row in csv.DictReader(ranking_file):
+                rows.append(row)
+                score = float(row['ranking_score'])
+                if best_score is None or score > best_score:
+                    best_score = score
+                    best_folder = shard_folder
+
+    if best_folder is None:
+        raise FileNotFoundError(f"No ranked samples in seed shard outputs {', '.join(shard_output_folders)}")
+
+    # Top-level files come from the best run; other runs only fill in files
+    # it lacks (e.g. TERMS_OF_USE.md).
+    for shard_folder in [best_folder] + [f for f in shard_output_folders if f != best_folder]:
+        for entry in list(os.scandir(shard_folder)):
+            target = os.path.join(output_folder, entry.name)
+            if entry.is_dir():
+                if entry.name.startswith('seed-'):
+                    if os.path.exists(target):
+                        shutil.rmtree(target)
+                    os.replace(entry.path, target)
+            elif entry.name == ranking_file_name:
+                continue
+            elif shard_folder == best_folder or not os.path.exists(target):
+                shutil.copy2(entry.path, target)
+
+    rows.sort(key=lambda row: (int(row['seed']), int(row['sample'])))
+    with open(os.path.join(output_folder, ranking_file_name), 'w', newline='') as ranking_file:
+        fieldnames = list(rows[0].keys()) if rows else ['seed', 'sample', 'ranking_score']
+        writer = csv.DictWriter(ranking_file, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    for shard_folder in shard_output_folders:
+        shutil.rmtree(shard_folder, ignore_errors=True)
+    logger.info(
+        f"Merged {len(shard_output_folders)} seed shards ({len(rows)} samples) into {output_folder}; "
+        f"best ranking score {best_score}."
+    )
+    return sorted(rows, key=lambda row: float(row['ranking_score']), reverse=True)
+
+
+def _find_ranking_scores(folder):
+    """Returns the ranking scores CSV of a job output folder (named with or without the job name prefix)."""
+    for entry in os.scandir(folder):
+        if entry.is_file() and entry.name.endswith('ranking_scores.csv'):
+            return entry.path
+    return None
@@ -0,0 +1,345 @@
+# afusion/validation.py
+
+import re
+import numpy as np
+
+# Letters AlphaFold 3 accepts in polymer sequences.
+ALPHABETS = {
+    'protein': 'ACDEFGHIKLMNPQRSTVWYX',
+    'rna': 'ACGUN',
+    'dna': 'ACGTN',
+}
+
+_ENTITY_TYPES = ('protein', 'rna', 'dna', 'ligand')
+_CHAIN_ID = re.compile(r'[A-Z]+')
+_MAX_SEED = 2**32 - 1
+
+# Per polymer type: (key of the modification type, key of its 1-based position).
+_MODIFICATION_KEYS = {
+    'protein': ('ptmType', 'ptmPosition'),
+    'rna': ('modificationType', 'basePosition'),
+    'dna': ('modificationType', 'basePosition'),
+}
+
+
+def validate_tasks(tasks, seen_folders=None):
+    """
+    Checks tasks against what AlphaFold 3 accepts, before any of them runs.
+
+    Checks the job name (and that no two tasks share an output folder), the
+    model seeds, every entity's type, chain IDs, sequence letters,
+    modification positions, templates and ligand definition, the bonded
+    atom pairs against the task's chain IDs and sequence lengths, the user
+    CCD, and that inline MSAs, mmCIFs and CCDs are not also given by path
+    (``unpairedMsaPath`` etc.). Sequence letters are checked for all tasks at once, one
+    vectorized pass per polymer type, so large batches validate in seconds.
+
+    :param tasks: Task dicts, as generated by create_batch_task.
+    :type tasks: iterable of dict
+    :param seen_folders: Output folders (sanitized job names) of tasks
+        validated earlier in the same batch, for a batch checked in chunks.
+        Tasks using one of them are invalid, and this call's folders are
+        added to the set.
+    :type seen_folders: set of str, optional
+    :return: One dict per invalid task, in task order, with keys 'index'
+        (position in ``tasks``), 'job_name' and 'errors' (list of str).
+        Empty if every task is valid.
+    :rtype: list of dict
+    """
+    from afusion.api import sanitize_job_name
+
+    tasks = list(tasks)
+    errors = [[] for _ in tasks]
+    # Polymer sequences per type, checked together: (sequence, task index, label).
+    polymers = {entity_type: [] for entity_type in ALPHABETS}
+    folders = {}
+
+    for index, task in enumerate(tasks):
+        if not isinstance(task, dict):
+            errors[index].append("Task is not a dict")
+            continue
+        name = task.get('name')
+        if not isinstance(name, str) or not name.strip():
+            errors[index].append("Missing job name")
+        else:
+            folders.setdefault(sanitize_job_name(name), []).append(index)
+        _check_seeds(task.get('modelSeeds'), errors[index])
+        if 'dialect' in task and task['dialect'] != 'alphafold3':
+            errors[index].append(f"Unsupported dialect {task['dialect']!r}")
+        if 'userCCD' in task and not isinstance(task['userCCD'], str):
+            errors[index].append("userCCD must be an mmCIF string")
+        _check_path_field(task, 'userCCD', 'Task', errors[index])
+
+        chains = _check_sequences(task.get('sequences'), index, errors[index], polymers)
+        _check_bonds(task.get('bondedAtomPairs'), chains, errors[index])
+
+    for folder, indices in folders.items():
+        if len(indices) > 1:
+            for index in indices:
+                errors[index].append(f"Output folder '{folder}' is shared by {len(indices)} tasks in the batch")
+        if seen_folders is not None:
+            if folder in seen_folders:
+                for index in indices:
+                    errors[index].append(f"Output folder '{folder}' is used by an earlier task in the batch")
+            seen_folders.add(folder)
+
+    for entity_type, entries in polymers.items():
+        for position, letters in _invalid_letters([entry[0] for entry in entries], ALPHABETS[entity_type]).items():
+            _, index, label = entries[position]
+            errors[index].append(f"{label}: invalid letters {', '.join(repr(letter) for letter in letters)}")
+
+    return [
+        {
+            'index': index,
+            'job_name': task.get('name') if isinstance(task, dict) else None,
+            'errors': task_errors,
+        }
+        for index, (task, task_errors) in enumerate(zip(tasks, errors))
+        if task_errors
+    ]
+
+
+def normalize_task(task):
+    """
+    Returns a copy of a task with common input slips fixed.
+
+    Whitespace is removed from polymer sequences and they are upper-cased
+    (as pasted from FASTA files), numeric strings in ``modelSeeds`` and
+    modification positions become integers, and a single CCD code given as
+    a string becomes a list. Anything else is left for
+    :func:`validate_tasks` to report.
+
+    :param task: Task dict, as generated by create_batch_task.
+    :type task: dict
+    :rtype: dict
+    """
+    task = dict(task)
+    if isinstance(task.get('modelSeeds'), list):
+        task['modelSeeds'] = [_to_int(seed) for seed in task['modelSeeds']]
+    sequences = []
+    for entry in task.get('sequences') or []:
+        if not isinstance(entry, dict) or len(entry) != 1:
+            sequences.append(entry)
+            continue
+        (entity_type, entity), = entry.items()
+        if not isinstance(entity, dict):
+            sequences.append(entry)
+            continue
+        entity = dict(entity)
+        if entity_type in ALPHABETS and isinstance(entity.get('sequence'), str):
+            entity['sequence'] = ''.join(entity['sequence'].split()).upper()
+        if entity_type in _MODIFICATION_KEYS and isinstance(entity.get('modifications'), list):
+            _, position_key = _MODIFICATION_KEYS[entity_type]
+            entity['modifications'] = [
+                dict(modification, **{position_key: _to_int(modification[position_key])})
+                if isinstance(modification, dict) and position_key in modification else modification
+                for modification in entity['modifications']
+            ]
+        if entity_type == 'ligand' and isinstance(entity.get('ccdCodes'), str):
+            entity['ccdCodes'] = [entity['ccdCodes']]
+        sequences.append({entity_type: entity})
+    if 'sequences' in task:
+        task['sequences'] = sequences
+    return task
+
+
+def format_report(report):
+    """
+    Formats the result of :func:`validate_tasks` as text, one line per error.
+
+    :rtype: str
+    """
+    return '\n'.join(
+        f"{entry['job_name'] or '#' + str(entry['index'])}: {error}"
+        for entry in report
+        for error in entry['errors']
+    )
+
+
+def _check_seeds(seeds, errors):
+    if not isinstance(seeds, list) or not seeds:
+        errors.append("modelSeeds must be a non-empty list")
+        return
+    bad = [seed for seed in seeds if not _is_int(seed) or not 0 <= seed <= _MAX_SEED]
+    if bad:
+        errors.append(f"modelSeeds must be integers from 0 to {_MAX_SEED}, got {bad[:5]}")
+
+
+def _check_sequences(sequences, index, errors, polymers):
+    """Checks a task's entities; returns their chains as {chain ID: (entity type, length)}."""
+    chains = {}
+    if not isinstance(sequences, list) or not sequences:
+        errors.append("sequences must be a non-empty list")
+        return chains
+    for position, entry in enumerate(sequences):
+        if not isinstance(entry, dict) or len(entry) != 1 or next(iter(entry)) not in _ENTITY_TYPES:
+            errors.append(f"sequences[{position}]: must have exactly one of {', '.join(_ENTITY_TYPES)}")
+            continue
+        (entity_type, entity), = entry.items()
+        label = f"sequences[{position}] ({entity_type})"
+        if not isinstance(entity, dict) or not entity:
+            errors.append(f"{label}: empty entity")
+            continue
+
+        chain_ids = entity.get('id')
+        chain_ids = [chain_ids] if isinstance(chain_ids, str) else chain_ids
+        if not isinstance(chain_ids, list) or not chain_ids:
+            errors.append(f"{label}: missing id")
+            chain_ids = []
+        for chain_id in chain_ids:
+            if not isinstance(chain_id, str) or not _CHAIN_ID.fullmatch(chain_id):
+                errors.append(f"{label}: chain ID {chain_id!r} must be upper-case letters")
+            elif chain_id in chains:
+                errors.append(f"{label}: chain ID {chain_id!r} is used twice")
+        if chain_ids and all(isinstance(chain_id, str) for chain_id in chain_ids):
+            label = f"sequences[{position}] ({entity_type} {','.join(chain_ids)})"
+
+        if entity_type == 'ligand':
+            _check_ligand(entity, label, errors)
+            length = None
+        else:
+            sequence = entity.get('sequence')
+            if not isinstance(sequence, str) or not sequence:
+                errors.append(f"{label}: missing sequence")
+                length = 0
+            else:
+                length = len(sequence)
+                polymers[entity_type].append((sequence, index, label))
+            _check_modifications(entity, entity_type, length, label, errors)
+            if entity_type == 'protein':
+                _check_templates(entity.get('templates'), length, label, errors)
+            for msa_key in ('unpairedMsa', 'pairedMsa'):
+                if entity.get(msa_key) is not None and not isinstance(entity[msa_key], str):
+                    errors.append(f"{label}: {msa_key} must be an A3M string")
+                _check_path_field(entity, msa_key, label, errors)
+
+        for chain_id in chain_ids:
+            if isinstance(chain_id, str):
+                chains.setdefault(chain_id, (entity_type, length))
+    return chains
+
+
+def _check_ligand(entity, label, errors):
+    ccd_codes = entity.get('ccdCodes')
+    smiles = entity.get('smiles')
+    if ccd_codes and smiles:
+        errors.append(f"{label}: has both ccdCodes and smiles")
+    elif ccd_codes:
+        if not isinstance(ccd_codes, list) or not all(isinstance(code, str) and code.strip() for code in ccd_codes):
+            errors.append(f"{label}: ccdCodes must be a list of CCD codes")
+    elif smiles:
+        if not isinstance(smiles, str):
+            errors.append(f"{label}: smiles must be a string")
+    else:
+        errors.append(f"{label}: has neither ccdCodes nor smiles")
+
+
+def _check_modifications(entity, entity_type, length, label, errors):
+    modifications = entity.get('modifications')
+    if modifications is None:
+        return
+    if not isinstance(modifications, list):
+        errors.append(f"{label}: modifications must be a list")
+        return
+    type_key, position_key = _MODIFICATION_KEYS[entity_type]
+    for modification in modifications:
+        if not isinstance(modification, dict):
+            errors.append(f"{label}: modification {modification!r} is not a dict")
+            continue
+        if not modification.get(type_key):
+            errors.append(f"{label}: modification without {type_key}")
+        position = modification.get(position_key)
+        if not _is_int(position) or position < 1 or (length and position > length):
+            errors.append(f"{label}: {position_key} {position!r} is outside the sequence (1-{length})")
+
+
+def _check_templates(templates, length, label, errors):
+    if templates is None:
+        return
+    if not isinstance(templates, list):
+        errors.append(f"{label}: templates must be a list")
+        return
+    for position, template in enumerate(templates):
+        if not isinstance(template, dict):
+            errors.append(f"{label}: template {position} is not a dict")
+            continue
+        if not template.get('mmcif') and not template.get('mmcifPath'):
+            errors.append(f"{label}: template {position} has no mmcif")
+        _check_path_field(template, 'mmcif', f"{label}: template {position}", errors)
+        query_indices = template.get('queryIndices')
+        template_indices = template.get('templateIndices')
+        if not isinstance(query_indices, list) or not isinstance(template_indices, list):
+            errors.append(f"{label}: template {position} needs queryIndices and templateIndices lists")
+        elif len(query_indices) != len(template_indices):
+            errors.append(f"{label}: template {position} has {len(query_indices)} queryIndices "
+                          f"but {len(template_indices)} templateIndices")
+        elif any(not _is_int(query) or not 0 <= query < (length or 0) for query in query_indices):
+            errors.append(f"{label}: template {position} queryIndices must be 0-based positions in the sequence")
+
+
+def _check_path_field(fields, key, label, errors):
+    """Checks the ``<key>Path`` variant of an inline field, which AlphaFold 3 accepts instead of it."""
+    path_key = f"{key}Path"
+    if path_key not in fields:
+        return
+    if not isinstance(fields[path_key], str) or not fields[path_key]:
+        errors.append(f"{label}: {path_key} must be a file path")
+    elif fields.get(key) is not None:
+        errors.append(f"{label}: has both {key} and {path_key}")
+
+
+def _check_bonds(bonds, chains, errors):
+    if bonds is None:
+        return
+    if not isinstance(bonds, list):
+        errors.append("bondedAtomPairs must be a list")
+        return
+    for position, bond in enumerate(bonds):
+        if not isinstance(bond, list) or len(bond) != 2:
+            errors.append(f"bondedAtomPairs[{position}]: must be a pair of atoms")
+            continue
+        for atom in bond:
+            if not isinstance(atom, list) or len(atom) != 3:
+                errors.append(f"bondedAtomPairs[{position}]: atom {atom!r} must be [chain ID, residue, atom name]")
+                continue
+            chain_id, residue, atom_name = atom
+            if chain_id not in chains:
+                errors.append(f"bondedAtomPairs[{position}]: chain ID {chain_id!r} is not in the task")
+                continue
+            _, length = chains[chain_id]
+            if not _is_int(residue) or residue < 1 or (length and residue > length):
+                errors.append(f"bondedAtomPairs[{position}]: residue {residue!r} is outside chain {chain_id}")
+            if not isinstance(atom_name, str) or not atom_name:
+                errors.append(f"bondedAtomPairs[{position}]: missing atom name")
+
+
+def _invalid_letters(sequences, alphabet):
+    """
+    Finds sequences with letters outside ``alphabet``, in one vectorized pass
+    over all of them; returns {sequence position: sorted invalid letters}.
+    """
+    if not sequences:
+        return {}
+    allowed = np.zeros(256, dtype=bool)
+    allowed[np.frombuffer(alphabet.encode(), dtype=np.uint8)] = True
+    # Non-ASCII characters become '?', one byte each, so offsets match.
+    encoded = [sequence.encode('ascii', errors='replace') for sequence in sequences]
+    lengths = np.fromiter((len(sequence) for sequence in encoded), dtype=np.int64, count=len(encoded))
+    letters = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    invalid = np.flatnonzero(~allowed[letters])
+    if invalid.size == 0:
+        return {}
+    starts = np.cumsum(lengths) - lengths
+    # side='right' skips empty sequences that start at the same offset.
+    positions = np.unique(np.searchsorted(starts, invalid, side='right') - 1)
+    return {int(position): sorted(set(sequences[position]) - set(alphabet)) for position in positions}
+
+
+def _is_int(value):
+    return isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+
+
+def _to_int(value):
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return value
@@ -0,0 +1,409 @@
+# afusion/work_queue.py
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from afusion.api import move_incomplete_output_aside, run_batch_predictions, sanitize_job_name
+from afusion.metrics import JobMetrics
+from afusion.scheduler import GpuSlots
+from loguru import logger
+
+_TASKS = 'tasks'
+_LEASES = 'leases'
+_DONE = 'done'
+
+
+class FileWorkQueue:
+    """
+    A batch queue in a shared directory that workers on many hosts drain together.
+
+    Tasks are written once to ``<queue_dir>/tasks``. A worker claims a task
+    by creating its lease file in ``<queue_dir>/leases`` with a hard link,
+    which is atomic on local filesystems and on NFS, so exactly one worker
+    wins. While the task runs the worker touches the lease; a lease that has
+    not been touched for ``lease_seconds`` belongs to a crashed worker and is
+    taken over by the next worker that looks. Finished tasks get a result
+    file in ``<queue_dir>/done``.
+
+    Lease ages are measured against the shared filesystem's clock, not the
+    hosts' clocks, so clock skew between hosts does not expire leases early.
+
+    :param queue_dir: Shared directory holding the queue.
+    :type queue_dir: str
+    :param lease_seconds: Time after which an untouched lease is considered
+        abandoned. Workers renew their leases every third of this.
+    :type lease_seconds: float
+    :param worker_id: Name of this worker in leases and results. Defaults to
+        host name, process id and a random suffix.
+    :type worker_id: str, optional
+    """
+
+    def __init__(self, queue_dir, lease_seconds=600, worker_id=None):
+        self.queue_dir = queue_dir
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        for folder in (_TASKS, _LEASES, _DONE):
+            os.makedirs(os.path.join(queue_dir, folder), exist_ok=True)
+
+    def submit(self, tasks):
+        """
+        Adds tasks to the queue. Tasks already in the queue are left as they are.
+
+        :param tasks: Task dicts, as generated by create_batch_task.
+        :type tasks: iterable of dict
+        :return: Number of tasks added.
+        :rtype: int
+        """
+        added = 0
+        for task in tasks:
+            key = sanitize_job_name(task['name'])
+            if self._publish(self._path(_TASKS, key), task):
+                added += 1
+            else:
+                logger.debug(f"Task '{task['name']}' is already queued.")
+        logger.info(f"Queued {added} tasks in {self.queue_dir}.")
+        return added
+
+    def claim(self):
+        """
+        Claims the next task that is neither done nor leased by a live worker.
+
+        :return: The task's queue key and task dict, or None if nothing can
+            be claimed right now.
+        :rtype: tuple of (str, dict) or None
+        """
+        done = self._keys(_DONE)
+        for key in sorted(self._keys(_TASKS) - done):
+            lease_path = self._path(_LEASES, key)
+            if os.path.exists(lease_path) and not self._recover_expired_lease(key):
+                continue
+            if not self._publish(lease_path, {'worker': self.worker_id, 'host': socket.gethostname(), 'pid': os.getpid()}):
+                continue
+            if os.path.exists(self._path(_DONE, key)):
+                # Finished by another worker between listing and claiming.
+                self.release(key)
+                continue
+            try:
+                with open(self._path(_TASKS, key)) as task_file:
+                    task = json.load(task_file)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"Cannot read queued task '{key}': {e}")
+                self.complete(key, f'Failed to read task: {e}')
+                continue
+            logger.info(f"Worker {self.worker_id} claimed task '{key}'.")
+            return key, task
+        return None
+
+    def renew(self, key):
+        """
+        Renews this worker's lease on a task.
+
+        :return: False if the lease was lost to another worker.
+        :rtype: bool
+        """
+        lease = self._read(self._path(_LEASES, key))
+        if lease is not None and lease.get('worker') == self.worker_id:
+            try:
+                # Another worker may recover the lease after the read.
+                os.utime(self._path(_LEASES, key))
+                return True
+            except OSError:
+                pass
+        logger.warning(f"Worker {self.worker_id} lost its lease on task '{key}'.")
+        return False
+
+    def complete(self, key, status):
+        """Records a task's result and drops its lease."""
+        self._publish(self._path(_DONE, key), {
+            'status': status,
+            'worker': self.worker_id,
+            'finished_at': time.time(),
+        }, replace=True)
+        self.release(key)
+
+    def release(self, key):
+        """Drops this worker's lease on a task without finishing it."""
+        lease_path = self._path(_LEASES, key)
+        lease = self._read(lease_path)
+        if lease is not None and lease.get('worker') == self.worker_id:
+            try:
+                os.remove(lease_path)
+            except FileNotFoundError:
+                pass
+
+    def status(self):
+        """
+        Counts the queue's tasks by state.
+
+        :return: Dict with keys 'pending', 'running', 'done' and 'failed'.
+        :rtype: dict
+        """
+        tasks = self._keys(_TASKS)
+        done = self._keys(_DONE) & tasks
+        running = (self._keys(_LEASES) & tasks) - done
+        failed = sum(1 for key in done if (self._read(self._path(_DONE, key)) or {}).get('status') != 'Success')
+        return {
+            'pending': len(tasks - done - running),
+            'running': len(running),
+            'done': len(done) - failed,
+            'failed': failed,
+        }
+
+    def results(self):
+        """
+        Returns the result of every finished task.
+
+        :return: Dicts with keys 'job_name', 'status', 'worker' and 'finished_at'.
+        :rtype: list of dict
+        """
+        results = []
+        for key in sorted(self._keys(_DONE)):
+            result = self._read(self._path(_DONE, key))
+            if result is not None:
+                results.append(dict(result, job_name=key))
+        return results
+
+    def work(self, run_task, poll_interval=30, wait_for_leases=True):
+        """
+        Claims and runs tasks until the queue is drained.
+
+        The lease of the running task is renewed from a background thread.
+        If the lease is lost anyway, e.g. because the worker stalled for
+        longer than ``lease_seconds``, the task belongs to whichever worker
+        took it over, and this worker drops its result instead of recording it.
+
+        :param run_task: Called with each task dict; returns its status
+            ('Success' or an error message).
+        :type run_task: callable
+        :param poll_interval: Seconds to wait before looking again when every
+            remaining task is leased by another worker.
+        :type poll_interval: float
+        :param wait_for_leases: Whether to keep waiting while other workers
+            hold leases, so that tasks of a crashed worker are picked up.
+            Otherwise the worker stops once nothing can be claimed.
+        :type wait_for_leases: bool
+        :return: Number of tasks this worker ran.
+        :rtype: int
+        """
+        processed = 0
+        while True:
+            claimed = self.claim()
+            if claimed is None:
+                if not wait_for_leases or self.status()['running'] == 0:
+                    break
+                time.sleep(poll_interval)
+                continue
+            key, task = claimed
+            stop_renewing = threading.Event()
+            lease_lost = threading.Event()
+            renewer = threading.Thread(target=self._keep_renewing, args=(key, stop_renewing, lease_lost), daemon=True)
+            renewer.start()
+            try:
+                status = run_task(task)
+            except Exception as e:
+                logger.error(f"Task '{key}' raised: {e}")
+                status = f'Failed: {e}'
+            finally:
+                stop_renewing.set()
+                renewer.join()
+            if lease_lost.is_set() or not self.renew(key):
+                logger.warning(f"Dropping the result of task '{key}' ({status}); another worker owns it now.")
+                continue
+            self.complete(key, status)
+            processed += 1
+        logger.info(f"Worker {self.worker_id} finished after {processed} tasks: {self.status()}")
+        return processed
+
+    def _keep_renewing(self, key, stop, lease_lost):
+        while not stop.wait(self.lease_seconds / 3):
+            if not self.renew(key):
+                lease_lost.set()
+                return
+
+    def _recover_expired_lease(self, key):
+        """Removes a lease that has not been renewed in time. Returns whether it was removed."""
+        lease_path = self._path(_LEASES, key)
+        try:
+            age = self._filesystem_time() - os.stat(lease_path).st_mtime
+        except FileNotFoundError:
+            return True
+        if age <= self.lease_seconds:
+            return False
+        # Renaming is atomic, so only one worker takes the lease over.
+        stale_path = f"{lease_path}.expired-{uuid.uuid4().hex}"
+        try:
+            os.rename(lease_path, stale_path)
+        except FileNotFoundError:
+            return True
+        if self._filesystem_time() - os.stat(stale_path).st_mtime <= self.lease_seconds:
+            # The owner renewed it just before the rename; give it back.
+            try:
+                os.link(stale_path, lease_path)
+            except FileExistsError:
+                pass
+            os.remove(stale_path)
+            return False
+        lease = self._read(stale_path) or {}
+        os.remove(stale_path)
+        logger.warning(
+            f"Recovered task '{key}' from worker {lease.get('worker')}, "
+            f"whose lease expired {age:.0f}s ago."
+        )
+        return True
+
+    def _filesystem_time(self):
+        """Returns the current time according to the shared filesystem."""
+        clock_path = os.path.join(self.queue_dir, _LEASES, f".clock-{self.worker_id}")
+        with open(clock_path, 'w'):
+            pass
+        try:
+            return os.stat(clock_path).st_mtime
+        finally:
+            os.remove(clock_path)
+
+    def _publish(self, path, content, replace=False):
+        """Writes a JSON file atomically. Without ``replace``, returns False if it already exists."""
+        tmp_path = f"{path}.{self.worker_id}.tmp"
+        with open(tmp_path, 'w') as tmp_file:
+            json.dump(content, tmp_file)
+        try:
+            if replace:
+                os.replace(tmp_path, path)
+                return True
+            os.link(tmp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _read(self, path):
+        try:
+            with open(path) as json_file:
+                return json.load(json_file)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _path(self, folder, key):
+        return os.path.join(self.queue_dir, folder, f"{key}.json")
+
+    def _keys(self, folder):
+        return {
+            name[:-len('.json')]
+            for name in os.listdir(os.path.join(self.queue_dir, folder))
+            if name.endswith('.json')
+        }
+
+
+def run_queue_worker(
+    queue_dir,
+    af_input_base_path,
+    af_output_base_path,
+    model_parameters_dir,
+    databases_dir,
+    lease_seconds=600,
+    poll_interval=30,
+    wait_for_leases=True,
+    metrics_path=None,
+    worker_id=None,
+    **batch_options,
+):
+    """
+    Drains a shared :class:`FileWorkQueue`, running each task it claims.
+
+    Start one per host on the same ``queue_dir``; together they run every
+    queued task once. With several ``gpu_devices`` (or 'auto' finding
+    several), the worker claims one task per device and runs them at the
+    same time, each pinned to its device, as one queue worker per GPU would.
+
+    :param queue_dir: Shared directory holding the queue.
+    :type queue_dir: str
+    :param af_input_base_path: Base path for AlphaFold input.
+    :type af_input_base_path: str
+    :param af_output_base_path: Base path for AlphaFold output.
+    :type af_output_base_path: str
+    :param model_parameters_dir: Path to model parameters directory.
+    :type model_parameters_dir: str
+    :param databases_dir: Path to databases directory.
+    :type databases_dir: str
+    :param lease_seconds: Time after which the task of a silent worker is
+        taken over.
+    :type lease_seconds: float
+    :param poll_interval: Seconds between looks at a queue whose remaining
+        tasks are all leased.
+    :type poll_interval: float
+    :param wait_for_leases: Whether to wait for other workers' leases to
+        finish or expire before stopping.
+    :type wait_for_leases: bool
+    :param metrics_path: Optional file to write this worker's Prometheus
+        metrics to after every task (see :class:`afusion.metrics.JobMetrics`).
+    :type metrics_path: str, optional
+    :param worker_id: Name of this worker in leases and results (suffixed
+        with '-gpu<id>' per device). Defaults to host name, process id and a
+        random suffix.
+    :type worker_id: str, optional
+    :param batch_options: Passed on to :func:`afusion.api.run_batch_predictions`
+        for each task.
+    :return: Number of tasks this worker ran.
+    :rtype: int
+    """
+    if metrics_path is not None and batch_options.get('metrics') is None:
+        batch_options['metrics'] = JobMetrics()
+
+    gpu_devices = batch_options.pop('gpu_devices', None)
+    gpu_probe = batch_options.pop('gpu_probe', None)
+    if gpu_devices is not None and batch_options.get('run_inference', True):
+        gpu_devices = GpuSlots(None if gpu_devices == 'auto' else gpu_devices, probe=gpu_probe).devices
+    if gpu_devices is None or len(gpu_devices) == 1:
+        if gpu_devices is not None:
+            batch_options['gpu_devices'] = gpu_devices
+        work_queue = FileWorkQueue(queue_dir, lease_seconds=lease_seconds, worker_id=worker_id)
+        return work_queue.work(
+            _queue_task_runner(af_input_base_path, af_output_base_path, model_parameters_dir, databases_dir,
+                               metrics_path, batch_options),
+            poll_interval=poll_interval,
+            wait_for_leases=wait_for_leases,
+        )
+
+    # One claim loop per device, each a worker of its own in the queue.
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    def work_on(device):
+        work_queue = FileWorkQueue(queue_dir, lease_seconds=lease_seconds, worker_id=f"{worker_id}-gpu{device}")
+        return work_queue.work(
+            _queue_task_runner(af_input_base_path, af_output_base_path, model_parameters_dir, databases_dir,
+                               metrics_path, dict(batch_options, gpu_devices=[device])),
+            poll_interval=poll_interval,
+            wait_for_leases=wait_for_leases,
+        )
+
+    with ThreadPoolExecutor(max_workers=len(gpu_devices)) as executor:
+        return sum(executor.map(work_on, gpu_devices))
+
+
+def _queue_task_runner(af_input_base_path, af_output_base_path, model_parameters_dir, databases_dir,
+                       metrics_path, batch_options):
+    """Returns the ``run_task`` of :meth:`FileWorkQueue.work` for run_queue_worker."""
+
+    def run_task(task):
+        if batch_options.get('run_inference', True):
+            # A task taken over from a crashed worker may have partial output.
+            move_incomplete_output_aside(af_output_base_path, task['name'])
+        results = run_batch_predictions(
+            [task],
+            af_input_base_path,
+            af_output_base_path,
+            model_parameters_dir,
+            databases_dir,
+            **batch_options,
+        )
+        if metrics_path is not None:
+            batch_options['metrics'].write(metrics_path)
+        return results[0]['status']
+
+    return run_task
@@ -289,7 +289,7 @@ def main():
         # Run the command and display output in a box
         with st.spinner('AlphaFold 3 is running...'):
             output_placeholder = st.empty()
-            output = run_alphafold(docker_command, placeholder=output_placeholder)
+            output = run_alphafold(docker_command, placeholder=output_placeholder).tail
 
         # Display the output in an expander box
         st.markdown("#### Command Output:")
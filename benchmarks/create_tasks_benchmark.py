@@ -0,0 +1,201 @@
+# benchmarks/create_tasks_benchmark.py
+#
+# Times create_tasks_from_dataframe against the original row-by-row
+# implementation on synthetic batches and checks that both build the same
+# tasks.
+#
+#   python benchmarks/create_tasks_benchmark.py
+#   python benchmarks/create_tasks_benchmark.py --sizes 1000 10000 --repeat 3
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+from loguru import logger
+
+# Run from a checkout without installing afusion, as documented above.
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from afusion.api import (
+    create_batch_task,
+    create_dna_sequence_data,
+    create_ligand_sequence_data,
+    create_protein_sequence_data,
+    create_rna_sequence_data,
+    create_tasks_from_dataframe,
+    parse_json_field,
+    parse_list_field,
+)
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def reference_create_tasks_from_dataframe(df):
+    """The groupby + iterrows implementation create_tasks_from_dataframe replaced."""
+    tasks = []
+    grouped = df.groupby('job_name')
+    for job_name, group in grouped:
+        entities = []
+        model_seeds = None
+        bonded_atom_pairs = None
+        user_ccd = None
+
+        for _, row in group.iterrows():
+            entity_type = row['type']
+            entity_id = row['id']
+            sequence = row.get('sequence', '')
+
+            modifications = parse_json_field(row.get('modifications'))
+            msa_option = row.get('msa_option', 'auto')
+            unpaired_msa = row.get('unpaired_msa')
+            paired_msa = row.get('paired_msa')
+            templates = parse_json_field(row.get('templates'))
+
+            if entity_type == 'protein':
+                sequence_data = create_protein_sequence_data(
+                    sequence=sequence,
+                    modifications=modifications,
+                    msa_option=msa_option,
+                    unpaired_msa=unpaired_msa,
+                    paired_msa=paired_msa,
+                    templates=templates
+                )
+            elif entity_type == 'rna':
+                sequence_data = create_rna_sequence_data(
+                    sequence=sequence,
+                    modifications=modifications,
+                    msa_option=msa_option,
+                    unpaired_msa=unpaired_msa
+                )
+            elif entity_type == 'dna':
+                sequence_data = create_dna_sequence_data(
+                    sequence=sequence,
+                    modifications=modifications
+                )
+            elif entity_type == 'ligand':
+                ccd_codes = parse_list_field(row.get('ccd_codes'))
+                smiles = row.get('smiles')
+                sequence_data = create_ligand_sequence_data(
+                    ccd_codes=ccd_codes,
+                    smiles=smiles
+                )
+            else:
+                logger.error(f"Unknown entity type: {entity_type}")
+                continue
+
+            entities.append({
+                'type': entity_type,
+                'id': entity_id,
+                'sequence_data': sequence_data
+            })
+
+            if model_seeds is None and pd.notna(row.get('model_seeds')):
+                model_seeds = parse_list_field(row.get('model_seeds'), data_type=int)
+            if bonded_atom_pairs is None and pd.notna(row.get('bonded_atom_pairs')):
+                bonded_atom_pairs = parse_json_field(row.get('bonded_atom_pairs'))
+            if user_ccd is None and pd.notna(row.get('user_ccd')):
+                user_ccd = row.get('user_ccd')
+
+        if model_seeds is None:
+            model_seeds = [1]
+
+        tasks.append(create_batch_task(
+            job_name=job_name,
+            entities=entities,
+            model_seeds=model_seeds,
+            bonded_atom_pairs=bonded_atom_pairs,
+            user_ccd=user_ccd
+        ))
+    return tasks
+
+
+def make_batch(num_rows, seed=0):
+    """Builds a shuffled synthetic batch covering every column and entity type."""
+    rng = random.Random(seed)
+    rows = []
+    job = 0
+    while len(rows) < num_rows:
+        job_name = f"job_{job:07d}"
+        job += 1
+        for chain_index in range(rng.randint(1, 4)):
+            entity_type = rng.choices(['protein', 'rna', 'dna', 'ligand'], weights=[6, 1, 1, 2])[0]
+            row = {'job_name': job_name, 'type': entity_type, 'id': 'ABCD'[chain_index]}
+            if entity_type == 'ligand':
+                if rng.random() < 0.7:
+                    row['ccd_codes'] = rng.choice(['ATP', 'ATP,MG', 'HEM', 'NAD, ZN'])
+                else:
+                    row['smiles'] = 'CC(=O)OC1=CC=CC=C1C(=O)O'
+            else:
+                alphabet = AMINO_ACIDS if entity_type == 'protein' else 'ACGU' if entity_type == 'rna' else 'ACGT'
+                row['sequence'] = ''.join(rng.choice(alphabet) for _ in range(rng.randint(20, 200)))
+                if entity_type != 'dna':
+                    row['msa_option'] = rng.choice(['auto', 'auto', 'none', 'upload'])
+                    if row['msa_option'] == 'upload':
+                        row['unpaired_msa'] = f">query\n{row['sequence']}\n"
+                        if entity_type == 'protein':
+                            row['paired_msa'] = ''
+                            row['templates'] = '[]'
+                if entity_type == 'protein' and rng.random() < 0.1:
+                    row['modifications'] = json.dumps([{'ptmType': 'SEP', 'ptmPosition': 1}])
+            if chain_index == 0:
+                if rng.random() < 0.5:
+                    row['model_seeds'] = rng.choice(['1', '1,2', '1, 2, 3'])
+                if rng.random() < 0.05:
+                    row['bonded_atom_pairs'] = json.dumps([[['A', 1, 'CA'], ['B', 1, 'CA']]])
+                if rng.random() < 0.02:
+                    row['user_ccd'] = 'data_MY-LIG\n#\n'
+            rows.append(row)
+    rows = rows[:num_rows]
+    rng.shuffle(rows)
+    # Every value is text or missing, as pd.read_csv(..., dtype=str) produces it.
+    return pd.DataFrame(rows)
+
+
+def best_time(function, df, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(df)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark create_tasks_from_dataframe')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--no-reference', action='store_true',
+                        help='Only time the current implementation (no output check).')
+    args = parser.parse_args()
+
+    # Per-task logging would dominate the timings.
+    logger.remove()
+
+    print(f"{'rows':>8} {'jobs':>8} {'reference s':>12} {'current s':>10} {'speedup':>8}  match")
+    mismatches = 0
+    for size in args.sizes:
+        df = make_batch(size)
+        current_time, current_tasks = best_time(create_tasks_from_dataframe, df, args.repeat)
+        if args.no_reference:
+            print(f"{size:>8} {len(current_tasks):>8} {'-':>12} {current_time:>10.3f} {'-':>8}  -")
+            continue
+        reference_time, reference_tasks = best_time(reference_create_tasks_from_dataframe, df, args.repeat)
+        match = current_tasks == reference_tasks
+        mismatches += not match
+        print(
+            f"{size:>8} {len(current_tasks):>8} {reference_time:>12.3f} {current_time:>10.3f} "
+            f"{reference_time / current_time:>7.1f}x  {'yes' if match else 'NO'}"
+        )
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,451 @@
+# benchmarks/fake_alphafold3.py
+#
+# Stand-in for `docker run ... alphafold3 python run_alphafold.py ...` used by
+# the benchmarks. It understands the commands afusion.execution builds,
+# prints log lines shaped like AlphaFold 3's, sleeps instead of computing,
+# and writes synthetic outputs with AlphaFold 3's file layout.
+#
+# benchmarks/bin/docker runs this file, so putting benchmarks/bin first on
+# PATH makes afusion use it. Environment variables:
+#
+#   AFUSION_FAKE_PIPELINE_SECONDS   sleep of the data pipeline (default 0)
+#   AFUSION_FAKE_INFERENCE_SECONDS  sleep per seed of inference (default 0)
+#   AFUSION_FAKE_LOG_LINES          extra search log lines per chain (default 20)
+#   AFUSION_FAKE_SAMPLES            samples per seed (default 5, as AlphaFold 3)
+#   AFUSION_FAKE_FAIL               comma-separated job names that fail
+#   AFUSION_FAKE_OOM                job names whose inference runs out of GPU
+#                                   memory unless on AFUSION_FAKE_LARGE_GPUS
+#   AFUSION_FAKE_LARGE_GPUS         comma-separated device ids with enough memory
+#   AFUSION_FAKE_HANG               job names whose data pipeline hangs
+#   AFUSION_FAKE_FLAKY              job names whose first run fails to start
+#   AFUSION_FAKE_RUN_LOG            file to append one JSON line per run to, with
+#                                   the job, stages, GPU device, start and end
+#                                   times and exit code (for tests)
+#
+# `docker log-lines N` prints N synthetic log lines and exits, for timing
+# log streaming without any file output.
+#
+# A run with `--name` works like a real container: the work happens in a
+# child process in its own session, which signals to the `docker run`
+# client's process group do not reach, and `docker stop NAME` (or `docker
+# kill NAME`) stops it. Running containers are listed in
+# $TMPDIR/afusion-fake-docker/<name>.pid.
+
+import csv
+import json
+import os
+import random
+import re
+import signal
+import sys
+import tempfile
+import time
+import uuid
+
+# docker run options that take a value.
+_VALUE_OPTIONS = {'--volume', '-v', '--gpus', '--cpuset-cpus', '--memory', '--cidfile', '--name', '--entrypoint', '-e', '--env'}
+
+
+def sanitize_name(name):
+    """AlphaFold 3's job folder name."""
+    name = name.lower().replace(' ', '_')
+    return re.sub(r'[^a-z0-9_.-]', '', name)
+
+
+def chain_tokens(sequences):
+    """Returns (chain id, entity type, residue name, token count) per chain of an input JSON."""
+    chains = []
+    for entry in sequences:
+        entity_type, entity = next(iter(entry.items()))
+        ids = entity['id'] if isinstance(entity['id'], list) else [entity['id']]
+        if entity_type == 'ligand':
+            count = len(entity.get('ccdCodes') or []) or 1
+            residue = (entity.get('ccdCodes') or ['LIG'])[0]
+        else:
+            count = len(entity.get('sequence', ''))
+            residue = {'protein': 'ALA', 'rna': 'A', 'dna': 'DA'}[entity_type]
+        for chain_id in ids:
+            chains.append((chain_id, entity_type, residue, count))
+    return chains
+
+
+def synthetic_log_lines(name, chains, extra_lines=20):
+    """Yields data pipeline log lines shaped like AlphaFold 3's."""
+    yield 'Running data pipeline...\n'
+    for chain_id, entity_type, _, count in chains:
+        yield f'Running data pipeline for chain {chain_id}...\n'
+        if entity_type == 'ligand':
+            continue
+        for database in ('uniref90_2022_05.fa', 'mgy_clusters_2022_05.fa', 'bfd-first_non_consensus_sequences.fasta'):
+            yield f'I1016 12:00:00.000000 140 subprocess_utils.py:68] Launching subprocess "jackhmmer -o /dev/null --cpu 8 {database}"\n'
+            for i in range(extra_lines):
+                yield f'I1016 12:00:00.000000 140 subprocess_utils.py:97] stderr: @@ Round {i}: {count * 13 + i} hits\n'
+            yield f'I1016 12:00:00.000000 140 subprocess_utils.py:97] Finished Jackhmmer ({database}) in 0.001 seconds\n'
+        yield 'I1016 12:00:00.000000 140 subprocess_utils.py:97] Finished Hmmsearch (pdb_seqres_2022_09_28.fasta) in 0.001 seconds\n'
+        yield f'Running data pipeline for chain {chain_id} took 0.01 seconds\n'
+    yield f'Writing model input JSON to /root/af_output/{name}/{name}_data.json\n'
+
+
+def inline_referenced_files(fold_input, json_dir, volumes):
+    """Reads the files of *Path fields into the inline fields, as AlphaFold 3 does when it loads an input."""
+    owners = [fold_input]
+    for entry in fold_input['sequences']:
+        entity = next(iter(entry.values()))
+        owners.append(entity)
+        owners.extend(entity.get('templates') or [])
+    for owner in owners:
+        for path_field in [field for field in owner if field.endswith('Path')]:
+            path = owner.pop(path_field)
+            path = _host_path(path, volumes) if os.path.isabs(path) else os.path.join(json_dir, path)
+            with open(path) as referenced_file:
+                owner[path_field[:-len('Path')]] = referenced_file.read()
+
+
+def write_data_json(fold_input, job_dir):
+    """Writes the data pipeline's ``<name>_data.json`` with small synthetic MSAs."""
+    data = json.loads(json.dumps(fold_input))
+    for entry in data['sequences']:
+        entity_type, entity = next(iter(entry.items()))
+        if entity_type in ('protein', 'rna'):
+            query = f">query\n{entity['sequence']}\n"
+            # Missing or None means "search", as in AlphaFold 3.
+            if entity.get('unpairedMsa') is None:
+                entity['unpairedMsa'] = query + f">hit\n{entity['sequence']}\n"
+            if entity_type == 'protein':
+                if entity.get('pairedMsa') is None:
+                    entity['pairedMsa'] = query
+                if entity.get('templates') is None:
+                    entity['templates'] = []
+    os.makedirs(job_dir, exist_ok=True)
+    name = sanitize_name(fold_input['name'])
+    with open(os.path.join(job_dir, f'{name}_data.json'), 'w') as data_file:
+        json.dump(data, data_file, indent=2)
+
+
+def model_cif(name, chains, rng):
+    """A minimal mmCIF with one atom per token and pLDDT as B-factor."""
+    lines = [
+        f'data_{name}', '#', 'loop_',
+        '_atom_site.group_PDB', '_atom_site.id', '_atom_site.type_symbol', '_atom_site.label_atom_id',
+        '_atom_site.label_alt_id', '_atom_site.label_comp_id', '_atom_site.label_asym_id',
+        '_atom_site.label_entity_id', '_atom_site.label_seq_id', '_atom_site.pdbx_PDB_ins_code',
+        '_atom_site.Cartn_x', '_atom_site.Cartn_y', '_atom_site.Cartn_z', '_atom_site.occupancy',
+        '_atom_site.B_iso_or_equiv', '_atom_site.auth_seq_id', '_atom_site.auth_asym_id',
+        '_atom_site.pdbx_PDB_model_num',
+    ]
+    atom_id = 0
+    for entity_index, (chain_id, entity_type, residue, count) in enumerate(chains, start=1):
+        group = 'HETATM' if entity_type == 'ligand' else 'ATOM'
+        atom, element = ('C1', 'C') if entity_type == 'ligand' else ('CA', 'C') if entity_type == 'protein' else ('P', 'P')
+        for position in range(1, count + 1):
+            atom_id += 1
+            x, y, z = position * 3.8, rng.uniform(-5, 5), entity_index * 10.0
+            seq_id = '.' if entity_type == 'ligand' else position
+            lines.append(
+                f'{group} {atom_id} {element} {atom} . {residue} {chain_id} {entity_index} {seq_id} ? '
+                f'{x:.3f} {y:.3f} {z:.3f} 1.00 {rng.uniform(30, 95):.2f} {position} {chain_id} 1'
+            )
+    lines.append('#')
+    return '\n'.join(lines) + '\n'
+
+
+def confidences(chains, rng):
+    token_chain_ids = [chain_id for chain_id, _, _, count in chains for _ in range(count)]
+    size = len(token_chain_ids)
+    return {
+        'atom_chain_ids': token_chain_ids,
+        'atom_plddts': [round(rng.uniform(30, 95), 2) for _ in range(size)],
+        'pae': [[round(rng.uniform(0, 30), 2) for _ in range(size)] for _ in range(size)],
+        'token_chain_ids': token_chain_ids,
+        'token_res_ids': [i + 1 for i in range(size)],
+    }
+
+
+def summary_confidences(chains, ranking_score, rng):
+    chain_ids = [chain[0] for chain in chains]
+    return {
+        'chain_iptm': [round(rng.uniform(0.2, 0.9), 2) for _ in chain_ids],
+        'chain_pair_iptm': [[round(rng.uniform(0.2, 0.9), 2) for _ in chain_ids] for _ in chain_ids],
+        'chain_pair_pae_min': [[round(rng.uniform(0.5, 20), 2) for _ in chain_ids] for _ in chain_ids],
+        'chain_ptm': [round(rng.uniform(0.2, 0.9), 2) for _ in chain_ids],
+        'fraction_disordered': 0.0,
+        'has_clash': 0.0,
+        'iptm': round(rng.uniform(0.2, 0.9), 2),
+        'num_recycles': 10.0,
+        'ptm': round(rng.uniform(0.2, 0.9), 2),
+        'ranking_score': ranking_score,
+    }
+
+
+def write_inference_outputs(fold_input, job_dir, samples=5, full=True, seed=0):
+    """
+    Writes AlphaFold 3's inference outputs for a fold input: a folder per
+    seed and sample, ranking scores, and the top-ranked model at the top.
+
+    Without ``full`` the confidence files hold no per-token data, which keeps
+    large synthetic batches small on disk.
+    """
+    rng = random.Random(seed)
+    name = sanitize_name(fold_input['name'])
+    chains = chain_tokens(fold_input['sequences'])
+    os.makedirs(job_dir, exist_ok=True)
+    rows = []
+    best = None
+    for model_seed in fold_input.get('modelSeeds') or [1]:
+        for sample in range(samples):
+            score = round(rng.uniform(0.3, 0.95), 4)
+            sample_dir = os.path.join(job_dir, f'seed-{model_seed}_sample-{sample}')
+            os.makedirs(sample_dir, exist_ok=True)
+            files = {
+                'model.cif': model_cif(name, chains, rng),
+                'confidences.json': json.dumps(confidences(chains, rng) if full else {}),
+                'summary_confidences.json': json.dumps(summary_confidences(chains, score, rng)),
+            }
+            for file_name, content in files.items():
+                with open(os.path.join(sample_dir, file_name), 'w') as output_file:
+                    output_file.write(content)
+            rows.append({'seed': model_seed, 'sample': sample, 'ranking_score': score})
+            if best is None or score > best[0]:
+                best = (score, files)
+
+    with open(os.path.join(job_dir, f'{name}_ranking_scores.csv'), 'w', newline='') as ranking_file:
+        writer = csv.DictWriter(ranking_file, fieldnames=['seed', 'sample', 'ranking_score'])
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(os.path.join(job_dir, 'TERMS_OF_USE.md'), 'w') as terms_file:
+        terms_file.write('Synthetic output for benchmarking.\n')
+    # The top-level model is written last: afusion treats it as the
+    # completion marker, as it is for AlphaFold 3.
+    for file_name in ('summary_confidences.json', 'confidences.json', 'model.cif'):
+        with open(os.path.join(job_dir, f'{name}_{file_name}'), 'w') as output_file:
+            output_file.write(best[1][file_name])
+
+
+def _parse_run(args):
+    """Splits ``docker run`` arguments into volume mounts, options and AlphaFold flags."""
+    volumes, options = {}, {}
+    index = 0
+    while index < len(args) and args[index].startswith('-'):
+        option = args[index]
+        if option in _VALUE_OPTIONS:
+            value = args[index + 1]
+            if option in ('--volume', '-v'):
+                host, container = value.split(':')[:2]
+                volumes[container] = host
+            else:
+                options[option] = value
+            index += 2
+        else:
+            index += 1
+    # args[index] is the image; then "python run_alphafold.py" and its flags.
+    flags = {}
+    for arg in args[index + 1:]:
+        if arg.startswith('--'):
+            key, _, value = arg[2:].partition('=')
+            flags[key] = value if value else True
+    return volumes, options, flags
+
+
+def _job_names(variable):
+    return {job.strip() for job in os.environ.get(variable, '').split(',') if job.strip()}
+
+
+def _host_path(path, volumes):
+    for container in sorted(volumes, key=len, reverse=True):
+        if path == container or path.startswith(container + '/'):
+            return volumes[container] + path[len(container):]
+    return path
+
+
+def containers_dir():
+    """Directory with one ``<name>.pid`` file per running named fake container."""
+    return os.path.join(tempfile.gettempdir(), 'afusion-fake-docker')
+
+
+def run_container(args):
+    """Runs a named container in a child process in its own session, as dockerd would."""
+    _, options, _ = _parse_run(args)
+    pid_path = os.path.join(containers_dir(), f"{options['--name']}.pid")
+    child = os.fork()
+    if child == 0:
+        os.setsid()
+        code = 1
+        try:
+            code = run_logged(args)
+        finally:
+            sys.stdout.flush()
+            os._exit(code)
+    os.makedirs(containers_dir(), exist_ok=True)
+    with open(pid_path, 'w') as pid_file:
+        pid_file.write(str(child))
+    try:
+        _, status = os.waitpid(child, 0)
+    finally:
+        if os.path.exists(pid_path):
+            os.remove(pid_path)
+    return os.waitstatus_to_exitcode(status) if os.WIFEXITED(status) else 128 + os.WTERMSIG(status)
+
+
+def stop(args, kill=False):
+    """``docker stop [--time N] NAME...`` or ``docker kill NAME...``."""
+    grace = 10.0
+    names = []
+    index = 0
+    while index < len(args):
+        if args[index] in ('--time', '-t'):
+            grace = float(args[index + 1])
+            index += 2
+            continue
+        names.append(args[index])
+        index += 1
+    code = 0
+    for name in names:
+        try:
+            with open(os.path.join(containers_dir(), f'{name}.pid')) as pid_file:
+                pid = int(pid_file.read())
+        except (OSError, ValueError):
+            print(f'Error response from daemon: No such container: {name}', file=sys.stderr)
+            code = 1
+            continue
+        _signal(pid, signal.SIGKILL if kill else signal.SIGTERM)
+        deadline = time.time() + (0 if kill else grace)
+        while _alive(pid) and time.time() < deadline:
+            time.sleep(0.05)
+        if _alive(pid):
+            _signal(pid, signal.SIGKILL)
+        if os.path.exists(os.path.join(containers_dir(), f'{name}.pid')):
+            # Left behind when the client was killed before the container.
+            os.remove(os.path.join(containers_dir(), f'{name}.pid'))
+        print(name)
+    return code
+
+
+def _signal(pid, signum):
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+def _alive(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as stat_file:
+            # A zombie has exited; its parent just has not reaped it yet.
+            return stat_file.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except OSError:
+        return False
+
+
+def run(args):
+    volumes, options, flags = _parse_run(args)
+    if '--cidfile' in options:
+        with open(options['--cidfile'], 'w') as cid_file:
+            cid_file.write(uuid.uuid4().hex + uuid.uuid4().hex)
+    if 'json_path' not in flags:
+        print('fake alphafold3: only run_alphafold.py runs are supported', file=sys.stderr)
+        return 125
+
+    json_path = _host_path(flags['json_path'], volumes)
+    with open(json_path) as json_file:
+        fold_input = json.load(json_file)
+    try:
+        inline_referenced_files(fold_input, os.path.dirname(json_path), volumes)
+    except OSError as e:
+        print(f'FileNotFoundError: {e}', flush=True)
+        return 1
+    name = sanitize_name(fold_input['name'])
+    job_dir = os.path.join(_host_path(flags['output_dir'], volumes), name)
+    chains = chain_tokens(fold_input['sequences'])
+    seeds = fold_input.get('modelSeeds') or [1]
+    failing = _job_names('AFUSION_FAKE_FAIL')
+
+    if name in _job_names('AFUSION_FAKE_FLAKY'):
+        marker = os.path.join(_host_path(flags['output_dir'], volumes), f'.{name}.flaky')
+        if not os.path.exists(marker):
+            open(marker, 'w').close()
+            print('docker: Error response from daemon: fake failure to start the container.', flush=True)
+            return 125
+
+    print(f'Running fold job {fold_input["name"]}...', flush=True)
+    if flags.get('run_data_pipeline'):
+        for line in synthetic_log_lines(name, chains, int(os.environ.get('AFUSION_FAKE_LOG_LINES', '20'))):
+            sys.stdout.write(line)
+        sys.stdout.flush()
+        if name in _job_names('AFUSION_FAKE_HANG'):
+            time.sleep(3600)
+        time.sleep(float(os.environ.get('AFUSION_FAKE_PIPELINE_SECONDS', '0')))
+        write_data_json(fold_input, job_dir)
+
+    if flags.get('run_inference'):
+        print(f'Predicting 3D structure for {name} with {len(seeds)} seed(s)...', flush=True)
+        print(f'Featurising data with {len(seeds)} seed(s)...', flush=True)
+        print(f'Running model inference and extracting output structure samples with {len(seeds)} seed(s)...', flush=True)
+        for model_seed in seeds:
+            started = time.time()
+            time.sleep(float(os.environ.get('AFUSION_FAKE_INFERENCE_SECONDS', '0')))
+            print(f'Running model inference with seed {model_seed} took {time.time() - started:.2f} seconds.', flush=True)
+        if name in failing:
+            print(f'Fake failure of job {name}', file=sys.stderr, flush=True)
+            return 1
+        device = options.get('--gpus', '').replace('device=', '')
+        if name in _job_names('AFUSION_FAKE_OOM') and device not in _job_names('AFUSION_FAKE_LARGE_GPUS'):
+            print('jaxlib.xla_extension.XlaRuntimeError: RESOURCE_EXHAUSTED: Out of memory while trying to '
+                  'allocate 42.00GiB.', flush=True)
+            return 1
+        print(f'Writing outputs with {len(seeds)} seed(s)...', flush=True)
+        write_inference_outputs(fold_input, job_dir, samples=int(os.environ.get('AFUSION_FAKE_SAMPLES', '5')))
+        print(f'Fold job {fold_input["name"]} done, output written to /root/af_output/{name}', flush=True)
+    return 0
+
+
+def run_logged(args):
+    """Runs ``run`` and appends a record of it to AFUSION_FAKE_RUN_LOG, if set."""
+    started = time.time()
+    code = run(args)
+    run_log = os.environ.get('AFUSION_FAKE_RUN_LOG')
+    volumes, options, flags = _parse_run(args)
+    if run_log and 'json_path' in flags:
+        with open(_host_path(flags['json_path'], volumes)) as json_file:
+            job = sanitize_name(json.load(json_file)['name'])
+        record = {
+            'job': job,
+            'data_pipeline': bool(flags.get('run_data_pipeline')),
+            'inference': bool(flags.get('run_inference')),
+            'device': options.get('--gpus', '').replace('device=', '') or None,
+            'start': started,
+            'end': time.time(),
+            'returncode': code,
+        }
+        # One write per line, so runs in parallel processes do not interleave.
+        with open(run_log, 'a') as log_file:
+            log_file.write(json.dumps(record) + '\n')
+    return code
+
+
+def print_log_lines(count):
+    chains = [('A', 'protein', 'ALA', 100)]
+    written = 0
+    while written < count:
+        for line in synthetic_log_lines('bench', chains):
+            if written == count:
+                break
+            sys.stdout.write(line)
+            written += 1
+
+
+def main(argv):
+    if argv[:1] == ['run']:
+        if '--name' in argv:
+            return run_container(argv[1:])
+        return run_logged(argv[1:])
+    if argv[:1] in (['stop'], ['kill']):
+        return stop(argv[1:], kill=argv[0] == 'kill')
+    if argv[:1] == ['log-lines']:
+        print_log_lines(int(argv[1]))
+        return 0
+    print(f'fake alphafold3: unsupported docker command {argv[:1]}', file=sys.stderr)
+    return 125
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,310 @@
+# benchmarks/overhead_benchmark.py
+#
+# Measures afusion's own overhead, apart from AlphaFold 3's, at 10, 1k and
+# 10k jobs. AlphaFold 3 is replaced by benchmarks/fake_alphafold3.py (run as
+# `docker` from benchmarks/bin), which does no work but prints and writes
+# what AlphaFold 3 would. Stages:
+#
+#   build_tasks       create_tasks_from_dataframe on a synthetic batch
+#   write_json        save_task_json for every task
+#   schedule          run_batch_predictions end to end, minus the time the
+#                     same fake containers take when run directly
+#   stream_logs       run_alphafold on 100 log lines per job, minus reading
+#                     the same output directly
+#   discover_outputs  finding every job's data JSON, completion marker and
+#                     ranking scores
+#   load_results      reading ranking scores, confidences and models
+#
+# Results are compared with benchmarks/baselines/overhead_benchmark.json and
+# the script exits with 1 if a stage got slower than the tolerance allows.
+#
+#   python benchmarks/overhead_benchmark.py
+#   python benchmarks/overhead_benchmark.py --sizes 10 1000 --stages build_tasks write_json
+#   python benchmarks/overhead_benchmark.py --save-baseline
+
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+# Run from a checkout without installing afusion, as documented above; the
+# sibling benchmark modules are imported from this script's folder.
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+for path in (os.path.dirname(BENCHMARKS_DIR), BENCHMARKS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from afusion.api import (
+    create_tasks_from_dataframe,
+    find_data_json,
+    is_job_output_complete,
+    run_batch_predictions,
+    sanitize_job_name,
+    save_task_json,
+)
+from afusion.execution import build_docker_command, run_alphafold
+from afusion.progress import ProgressParser
+from create_tasks_benchmark import make_batch
+from fake_alphafold3 import write_data_json, write_inference_outputs
+
+FAKE_BIN_DIR = os.path.join(BENCHMARKS_DIR, 'bin')
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, 'baselines', 'overhead_benchmark.json')
+STAGES = ('build_tasks', 'write_json', 'schedule', 'stream_logs', 'discover_outputs', 'load_results')
+
+# Rows per job in make_batch batches, on average.
+ROWS_PER_JOB = 2.5
+
+
+class NullPlaceholder:
+    """Stands in for a Streamlit placeholder; counts the refreshes."""
+
+    def __init__(self):
+        self.updates = 0
+
+    def markdown(self, text):
+        self.updates += 1
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def build_tasks(size):
+    tasks = []
+    rows = int(size * ROWS_PER_JOB)
+    while len(tasks) < size:
+        # make_batch draws 1-4 chains per job; top up small batches.
+        tasks = create_tasks_from_dataframe(make_batch(rows))
+        rows = int(rows * 1.2) + 4
+    return tasks[:size]
+
+
+def bench_build_tasks(size, tasks, work_dir, args):
+    df = make_batch(int(size * ROWS_PER_JOB))
+    seconds, built = timed(create_tasks_from_dataframe, df)
+    return {'seconds': seconds, 'jobs': len(built), 'rows': len(df)}
+
+
+def bench_write_json(size, tasks, work_dir, args):
+    input_dir = os.path.join(work_dir, 'write_json')
+    seconds, _ = timed(lambda: [save_task_json(task, os.path.join(input_dir, task['name'])) for task in tasks])
+    return {'seconds': seconds, 'jobs': len(tasks)}
+
+
+def bench_schedule(size, tasks, work_dir, args):
+    jobs = tasks[:args.max_scheduled_jobs]
+    # Containers run directly, without afusion: the cost of the fake itself.
+    direct_input = os.path.join(work_dir, 'schedule_direct_input')
+    direct_output = os.path.join(work_dir, 'schedule_direct_output')
+    commands = []
+    for task in jobs:
+        input_path = os.path.join(direct_input, task['name'])
+        save_task_json(task, input_path)
+        commands.append(build_docker_command(input_path, direct_output, work_dir, work_dir))
+    direct_seconds, _ = timed(lambda: [
+        subprocess.run(command, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for command in commands
+    ])
+
+    seconds, results = timed(
+        run_batch_predictions,
+        jobs,
+        os.path.join(work_dir, 'schedule_input'),
+        os.path.join(work_dir, 'schedule_output'),
+        work_dir,
+        work_dir,
+    )
+    failed = sum(1 for result in results if result['status'] != 'Success')
+    return {
+        'seconds': seconds,
+        'jobs': len(jobs),
+        'direct_seconds': direct_seconds,
+        'overhead_ms_per_job': (seconds - direct_seconds) / len(jobs) * 1000,
+        'failed': failed,
+    }
+
+
+def bench_stream_logs(size, tasks, work_dir, args):
+    lines = size * 100
+    command = f"docker log-lines {lines}"
+    direct_seconds, _ = timed(subprocess.run, command, shell=True, stdout=subprocess.DEVNULL)
+    placeholder = NullPlaceholder()
+    progress = ProgressParser()
+    seconds, run = timed(
+        run_alphafold, command, placeholder=placeholder,
+        log_path=os.path.join(work_dir, 'stream_logs.log'), on_line=progress.feed,
+    )
+    return {
+        'seconds': seconds,
+        'lines': lines,
+        'direct_seconds': direct_seconds,
+        'overhead_us_per_line': (seconds - direct_seconds) / lines * 1e6,
+        'placeholder_updates': placeholder.updates,
+        'tail_bytes': len(run.tail),
+    }
+
+
+def bench_discover_outputs(size, tasks, work_dir, args):
+    output_dir = os.path.join(work_dir, 'discover_outputs')
+    for task in tasks:
+        job_dir = os.path.join(output_dir, sanitize_job_name(task['name']))
+        write_data_json(task, job_dir)
+        write_inference_outputs(task, job_dir, samples=1, full=False)
+
+    def discover():
+        found = 0
+        for task in tasks:
+            name = sanitize_job_name(task['name'])
+            data_json = find_data_json(output_dir, task['name'])
+            complete = is_job_output_complete(output_dir, task['name'])
+            ranking = glob.glob(os.path.join(glob.escape(output_dir), glob.escape(name), '*ranking_scores.csv'))
+            found += bool(data_json and complete and ranking)
+        return found
+
+    seconds, found = timed(discover)
+    return {'seconds': seconds, 'jobs': len(tasks), 'found': found}
+
+
+def bench_load_results(size, tasks, work_dir, args):
+    jobs = tasks[:args.max_loaded_jobs]
+    output_dir = os.path.join(work_dir, 'load_results')
+    for task in jobs:
+        write_inference_outputs(task, os.path.join(output_dir, sanitize_job_name(task['name'])), samples=1)
+    try:
+        from afusion.visualization import extract_residue_bfactors, read_cif_file
+    except ImportError as e:
+        print(f"Not parsing models, the visualization dependencies are missing: {e}")
+        read_cif_file = None
+
+    def load():
+        for task in jobs:
+            name = sanitize_job_name(task['name'])
+            job_dir = os.path.join(output_dir, name)
+            pd.read_csv(os.path.join(job_dir, f'{name}_ranking_scores.csv'))
+            with open(os.path.join(job_dir, f'{name}_summary_confidences.json')) as summary_file:
+                json.load(summary_file)
+            # As afusion.visualization.extract_pae_from_json reads it.
+            with open(os.path.join(job_dir, f'{name}_confidences.json')) as confidences_file:
+                np.array(json.load(confidences_file).get('pae', []), dtype=np.float16)
+            if read_cif_file is not None:
+                structure, _ = read_cif_file(os.path.join(job_dir, f'{name}_model.cif'))
+                extract_residue_bfactors(structure)
+
+    seconds, _ = timed(load)
+    return {'seconds': seconds, 'jobs': len(jobs), 'models_parsed': read_cif_file is not None}
+
+
+BENCHMARKS = {
+    'build_tasks': bench_build_tasks,
+    'write_json': bench_write_json,
+    'schedule': bench_schedule,
+    'stream_logs': bench_stream_logs,
+    'discover_outputs': bench_discover_outputs,
+    'load_results': bench_load_results,
+}
+
+
+def machine():
+    return {
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance, min_seconds):
+    """Returns the stages that got slower than the baseline allows."""
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get('results', {}).get(key)
+        if reference is None:
+            continue
+        allowed = max(reference['seconds'] * (1 + tolerance), reference['seconds'] + min_seconds)
+        if result['seconds'] > allowed:
+            regressions.append((key, reference['seconds'], result['seconds']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark afusion's overhead with a fake AlphaFold 3")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--max-scheduled-jobs', type=int, default=1000,
+                        help='Cap on jobs run end to end; each one starts a fake container process.')
+    parser.add_argument('--max-loaded-jobs', type=int, default=200,
+                        help='Cap on jobs whose full outputs are written and loaded.')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed slowdown against the baseline, as a fraction.')
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help='Slowdowns smaller than this many seconds are never regressions.')
+    parser.add_argument('--keep', action='store_true', help='Keep the working directory.')
+    args = parser.parse_args()
+
+    # Per-job logging would dominate the timings.
+    logger.remove()
+    os.environ['PATH'] = FAKE_BIN_DIR + os.pathsep + os.environ['PATH']
+    os.environ.setdefault('AFUSION_FAKE_SAMPLES', '1')
+
+    results = {}
+    print(f"{'stage':<18} {'size':>6} {'seconds':>9}  details")
+    for size in args.sizes:
+        tasks = build_tasks(size)
+        for stage in args.stages:
+            work_dir = tempfile.mkdtemp(prefix=f'afusion-bench-{stage}-')
+            try:
+                result = BENCHMARKS[stage](size, tasks, work_dir, args)
+            finally:
+                if not args.keep:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+            results[f'{stage}/{size}'] = result
+            details = ', '.join(
+                f'{key}={value:.3f}' if isinstance(value, float) else f'{key}={value}'
+                for key, value in result.items() if key != 'seconds'
+            )
+            print(f"{stage:<18} {size:>6} {result['seconds']:>9.3f}  {details}", flush=True)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+        baseline['machine'] = machine()
+        baseline.setdefault('results', {}).update(results)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get('machine') != machine():
+        print(f"Note: the baseline was measured on {baseline.get('machine')}, this is {machine()}.")
+    regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+    for key, reference, current in regressions:
+        print(f"REGRESSION {key}: {reference:.3f}s -> {current:.3f}s")
+    if not regressions:
+        print("No regressions against the baseline.")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+# tests/conftest.py
+#
+# The tests run afusion against benchmarks/fake_alphafold3.py, which stands
+# in for the AlphaFold 3 container as `docker` from benchmarks/bin.
+
+import json
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+FAKE_BIN_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'bin')
+
+
+@pytest.fixture
+def fake_alphafold(tmp_path, monkeypatch):
+    """
+    Puts the fake AlphaFold 3 first on PATH for this test and its child
+    processes, and returns a function that reads back its runs, one dict per
+    container with 'job', 'data_pipeline', 'inference', 'device', 'start',
+    'end' and 'returncode'.
+    """
+    run_log = tmp_path / 'fake_runs.jsonl'
+    monkeypatch.setenv('PATH', FAKE_BIN_DIR + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get('PYTHONPATH')])))
+    monkeypatch.setenv('AFUSION_FAKE_RUN_LOG', str(run_log))
+    monkeypatch.setenv('AFUSION_FAKE_SAMPLES', '1')
+    monkeypatch.setenv('AFUSION_FAKE_LOG_LINES', '2')
+    # The fake's running containers are listed under TMPDIR.
+    monkeypatch.setenv('TMPDIR', str(tmp_path))
+
+    def runs():
+        if not run_log.exists():
+            return []
+        return [json.loads(line) for line in run_log.read_text().splitlines()]
+
+    return runs
+
+
+@pytest.fixture
+def batch_dirs(tmp_path):
+    """Input, output, model parameters and databases folders of a batch run."""
+    dirs = {name: tmp_path / name for name in ('input', 'output', 'models', 'databases')}
+    for path in dirs.values():
+        path.mkdir()
+    return [str(dirs[name]) for name in ('input', 'output', 'models', 'databases')]
+
+
+@pytest.fixture
+def make_task():
+    """Returns a builder of one-chain protein tasks."""
+
+    def make(name, sequence='MKTAYIAKQR', seeds=(1,)):
+        return {
+            'name': name,
+            'modelSeeds': list(seeds),
+            'sequences': [{'protein': {'id': 'A', 'sequence': sequence}}],
+            'dialect': 'alphafold3',
+            'version': 1,
+        }
+
+    return make
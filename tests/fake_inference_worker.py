@@ -0,0 +1,63 @@
+# tests/fake_inference_worker.py
+#
+# Stand-in for afusion/inference_worker_server.py that speaks the same
+# protocol without AlphaFold 3: it "loads the model" once, then writes
+# benchmarks/fake_alphafold3.py's synthetic outputs for every job it is sent.
+# Each job is appended to AFUSION_FAKE_RUN_LOG like a fake container run,
+# with 'worker' set to this process's id.
+#
+#   --exit_after N   exit, as a crashed worker would, on receiving job N + 1
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from fake_alphafold3 import write_inference_outputs
+
+
+def _send(message):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--exit_after', type=int, default=None)
+    args = parser.parse_args()
+
+    _send({"event": "ready"})
+    served = 0
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        if args.exit_after is not None and served >= args.exit_after:
+            return 1
+        request = json.loads(line)
+        started = time.time()
+        with open(request['json_path']) as json_file:
+            fold_input = json.load(json_file)
+        time.sleep(float(os.environ.get('AFUSION_FAKE_INFERENCE_SECONDS', '0')))
+        write_inference_outputs(fold_input, request['output_dir'], samples=1)
+        served += 1
+        if os.environ.get('AFUSION_FAKE_RUN_LOG'):
+            with open(os.environ['AFUSION_FAKE_RUN_LOG'], 'a') as log_file:
+                log_file.write(json.dumps({
+                    'job': os.path.basename(request['output_dir']),
+                    'data_pipeline': False,
+                    'inference': True,
+                    'device': None,
+                    'start': started,
+                    'end': time.time(),
+                    'returncode': 0,
+                    'worker': os.getpid(),
+                }) + '\n')
+        _send({"id": request.get('id'), "status": "ok", "output_dir": request['output_dir']})
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+# tests/test_inference_worker.py
+
+import os
+import shlex
+import sys
+
+import pytest
+
+from afusion.api import run_batch_predictions
+from afusion.inference_worker import InferenceWorkerError, WarmInferenceWorker
+
+FAKE_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_inference_worker.py')
+
+
+def fake_worker(*args):
+    return WarmInferenceWorker(' '.join(shlex.quote(arg) for arg in (sys.executable, FAKE_WORKER) + args))
+
+
+def test_batch_runs_inference_on_one_warm_worker(fake_alphafold, batch_dirs, make_task):
+    names = ['job_a', 'job_b', 'job_c']
+    with fake_worker() as worker:
+        results = run_batch_predictions([make_task(name) for name in names], *batch_dirs, inference_worker=worker)
+
+    assert [result['status'] for result in results] == ['Success'] * 3
+    runs = fake_alphafold()
+    # Data pipelines ran as containers, every inference on the one worker process.
+    assert sorted(run['job'] for run in runs if run.get('worker') is None) == names
+    assert not any(run['inference'] for run in runs if run.get('worker') is None)
+    worker_runs = [run for run in runs if run.get('worker') is not None]
+    assert sorted(run['job'] for run in worker_runs) == names
+    assert len({run['worker'] for run in worker_runs}) == 1
+    output_dir = batch_dirs[1]
+    for name in names:
+        assert os.path.exists(os.path.join(output_dir, name, f'{name}_model.cif'))
+
+
+def test_batch_falls_back_to_containers_when_the_worker_dies(fake_alphafold, batch_dirs, make_task):
+    names = ['job_a', 'job_b', 'job_c']
+    with fake_worker('--exit_after', '1') as worker:
+        results = run_batch_predictions([make_task(name) for name in names], *batch_dirs, inference_worker=worker)
+        assert not worker.alive
+
+    assert [result['status'] for result in results] == ['Success'] * 3
+    runs = fake_alphafold()
+    assert [run['job'] for run in runs if run.get('worker') is not None] == ['job_a']
+    assert sorted(run['job'] for run in runs if run['inference'] and run.get('worker') is None) == ['job_b', 'job_c']
+
+
+def test_stopped_worker_fails_queued_jobs(tmp_path):
+    worker = fake_worker()
+    assert worker.submit(str(tmp_path / 'fold_input.json'), str(tmp_path)).exception() is not None
+    worker.start()
+    worker.close()
+    with pytest.raises(InferenceWorkerError):
+        worker.run(str(tmp_path / 'fold_input.json'), str(tmp_path))
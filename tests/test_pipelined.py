@@ -0,0 +1,53 @@
+# tests/test_pipelined.py
+
+import os
+
+from afusion.api import run_batch_predictions
+from afusion.retry import RetryPolicy
+
+
+def overlaps(first, second):
+    return first['start'] < second['end'] and second['start'] < first['end']
+
+
+def test_pipelined_batch_overlaps_data_pipeline_with_inference(fake_alphafold, batch_dirs, make_task, monkeypatch):
+    monkeypatch.setenv('AFUSION_FAKE_PIPELINE_SECONDS', '0.5')
+    monkeypatch.setenv('AFUSION_FAKE_INFERENCE_SECONDS', '0.5')
+    names = ['job_a', 'job_b', 'job_c']
+
+    results = run_batch_predictions([make_task(name) for name in names], *batch_dirs, pipelined=True)
+
+    assert [result['status'] for result in results] == ['Success'] * 3
+    runs = fake_alphafold()
+    pipelines = {run['job']: run for run in runs if run['data_pipeline']}
+    inferences = {run['job']: run for run in runs if run['inference']}
+    # Every task ran as a CPU-only data pipeline and a GPU inference container.
+    assert set(pipelines) == set(inferences) == set(names)
+    assert not any(run['data_pipeline'] and run['inference'] for run in runs)
+    for name in names:
+        assert pipelines[name]['end'] <= inferences[name]['start']
+    # The next task's data pipeline runs during the current task's inference ...
+    assert overlaps(pipelines['job_b'], inferences['job_a'])
+    assert overlaps(pipelines['job_c'], inferences['job_b'])
+    # ... but inference runs one task at a time.
+    ordered = sorted(inferences.values(), key=lambda run: run['start'])
+    assert all(first['end'] <= second['start'] for first, second in zip(ordered, ordered[1:]))
+
+
+def test_pipelined_batch_skips_inference_of_failed_data_pipeline(tmp_path, fake_alphafold, batch_dirs, make_task,
+                                                                 monkeypatch):
+    monkeypatch.setenv('AFUSION_FAKE_HANG', 'job_b')
+    tasks = [make_task('job_a'), make_task('job_b'), make_task('job_c')]
+
+    # The hanging data pipeline is stopped by its stage timeout.
+    policy = RetryPolicy(max_attempts=1, stage_timeouts={'data_pipeline': 2})
+    results = {result['job_name']: result for result in run_batch_predictions(tasks, *batch_dirs, pipelined=True,
+                                                                               retry_policy=policy)}
+
+    assert results['job_a']['status'] == results['job_c']['status'] == 'Success'
+    assert results['job_b']['status'] != 'Success'
+    assert results['job_b']['failure'] == 'timeout'
+    inferences = [run['job'] for run in fake_alphafold() if run['inference']]
+    assert sorted(inferences) == ['job_a', 'job_c']
+    # Its container was stopped, not left running.
+    assert not os.listdir(tmp_path / 'afusion-fake-docker')
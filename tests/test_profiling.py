@@ -0,0 +1,54 @@
+# tests/test_profiling.py
+
+from afusion.api import run_batch_predictions
+from afusion.metrics import JobMetrics
+from afusion.profiling import ResourceProfiler
+from afusion.retry import RetryPolicy
+
+GIB = 2**30
+
+# GPU memory in use per device, as the fake probe reports it.
+GPU_MEMORY = {'0': 6 * GIB, '1': 10 * GIB, '2': 70 * GIB}
+
+
+def test_jobs_report_the_gpu_memory_of_their_device(fake_alphafold, batch_dirs, make_task, monkeypatch):
+    monkeypatch.setenv('AFUSION_FAKE_INFERENCE_SECONDS', '0.3')
+    profiler = ResourceProfiler(interval=0.05, gpu_memory_probe=lambda: GPU_MEMORY)
+    names = [f'job_{index}' for index in range(4)]
+
+    results = run_batch_predictions([make_task(name) for name in names], *batch_dirs, gpu_devices=['0', '1'],
+                                    resource_profiler=profiler)
+
+    devices = {run['job']: run['device'] for run in fake_alphafold()}
+    for result in results:
+        usage = result['resource_usage']
+        assert usage['peak_gpu_memory_bytes'] == GPU_MEMORY[devices[result['job_name']]]
+        assert usage['source'] == 'proc'
+        assert usage['peak_rss_bytes'] > 0
+        assert usage['samples']
+
+
+def test_out_of_memory_job_is_requeued_onto_the_large_gpu(fake_alphafold, batch_dirs, make_task, monkeypatch):
+    monkeypatch.setenv('AFUSION_FAKE_INFERENCE_SECONDS', '0.2')
+    monkeypatch.setenv('AFUSION_FAKE_OOM', 'job_big')
+    monkeypatch.setenv('AFUSION_FAKE_LARGE_GPUS', '2')
+    profiler = ResourceProfiler(interval=0.05, gpu_memory_probe=lambda: GPU_MEMORY)
+    metrics = JobMetrics()
+    policy = RetryPolicy(max_attempts=4, large_gpu_devices=['2'], backoff=0)
+
+    results = run_batch_predictions([make_task('job_big'), make_task('job_small')], *batch_dirs,
+                                    gpu_devices=['0', '1'], resource_profiler=profiler, metrics=metrics,
+                                    retry_policy=policy)
+
+    results = {result['job_name']: result for result in results}
+    assert results['job_big']['status'] == results['job_small']['status'] == 'Success'
+    runs = fake_alphafold()
+    big_runs = [run for run in runs if run['job'] == 'job_big']
+    # Out of memory on the small devices, then done on the large one.
+    assert {run['device'] for run in big_runs[:-1]} <= {'0', '1'}
+    assert all(run['returncode'] != 0 for run in big_runs[:-1])
+    assert big_runs[-1]['device'] == '2' and big_runs[-1]['returncode'] == 0
+    assert results['job_big']['resource_usage']['peak_gpu_memory_bytes'] == GPU_MEMORY['2']
+    small_device = next(run['device'] for run in runs if run['job'] == 'job_small')
+    assert results['job_small']['resource_usage']['peak_gpu_memory_bytes'] == GPU_MEMORY[small_device]
+    assert 'afusion_job_peak_gpu_memory_bytes' in metrics.render()
@@ -0,0 +1,66 @@
+# tests/test_scheduler.py
+
+import collections
+import threading
+
+import pytest
+
+from afusion.api import run_batch_predictions
+from afusion.scheduler import GpuSlots
+
+
+def overlaps(first, second):
+    return first['start'] < second['end'] and second['start'] < first['end']
+
+
+def test_gpu_slots_hand_out_each_device_once_and_take_it_back():
+    slots = GpuSlots(probe=lambda: [0, 1])
+    assert slots.devices == ['0', '1']
+    with slots.acquire() as first, slots.acquire() as second:
+        assert {first, second} == {'0', '1'}
+        waiting = threading.Thread(target=lambda: slots.acquire().__enter__())
+        waiting.start()
+        waiting.join(timeout=0.2)
+        # Both devices are checked out, so the third job waits ...
+        assert waiting.is_alive()
+    # ... until they are released.
+    waiting.join(timeout=5)
+    assert not waiting.is_alive()
+
+
+def test_gpu_slots_release_the_device_of_a_failed_job():
+    slots = GpuSlots(['3'])
+    with pytest.raises(RuntimeError):
+        with slots.acquire():
+            raise RuntimeError('container failed')
+    with slots.acquire() as device:
+        assert device == '3'
+
+
+def test_gpu_slots_without_devices():
+    with pytest.raises(ValueError):
+        GpuSlots(probe=lambda: [])
+
+
+def test_batch_runs_one_job_per_probed_device(fake_alphafold, batch_dirs, make_task, monkeypatch):
+    monkeypatch.setenv('AFUSION_FAKE_INFERENCE_SECONDS', '0.4')
+    monkeypatch.setenv('AFUSION_FAKE_FAIL', 'job_1')
+    names = [f'job_{index}' for index in range(6)]
+
+    results = run_batch_predictions([make_task(name) for name in names], *batch_dirs, gpu_devices='auto',
+                                    gpu_probe=lambda: ['3', '7'])
+
+    statuses = {result['job_name']: result['status'] for result in results}
+    assert statuses.pop('job_1') != 'Success'
+    assert set(statuses.values()) == {'Success'}
+    runs = fake_alphafold()
+    assert sorted(run['job'] for run in runs) == names
+    # Every container was pinned to one probed device, including the ones
+    # after the failed job, and the two devices ran jobs at once.
+    devices = collections.Counter(run['device'] for run in runs)
+    assert set(devices) == {'3', '7'}
+    by_device = {device: sorted((run for run in runs if run['device'] == device), key=lambda run: run['start'])
+                 for device in devices}
+    for device_runs in by_device.values():
+        assert all(first['end'] <= second['start'] for first, second in zip(device_runs, device_runs[1:]))
+    assert any(overlaps(first, second) for first in by_device['3'] for second in by_device['7'])
@@ -0,0 +1,63 @@
+# tests/test_work_queue.py
+
+import collections
+import os
+import subprocess
+import sys
+
+from afusion.work_queue import FileWorkQueue, run_queue_worker
+
+
+def overlaps(first, second):
+    return first['start'] < second['end'] and second['start'] < first['end']
+
+
+def test_worker_processes_run_each_task_once(tmp_path, fake_alphafold, batch_dirs, make_task, monkeypatch):
+    monkeypatch.setenv('AFUSION_FAKE_INFERENCE_SECONDS', '0.2')
+    queue_dir = str(tmp_path / 'queue')
+    names = [f'job_{index:02d}' for index in range(12)]
+    FileWorkQueue(queue_dir).submit(make_task(name) for name in names)
+
+    input_dir, output_dir, models_dir, databases_dir = batch_dirs
+    command = [
+        sys.executable, '-m', 'afusion.cli', 'queue', 'work',
+        '--queue_dir', queue_dir,
+        '--af_input_base_path', input_dir,
+        '--af_output_base_path', output_dir,
+        '--model_parameters_dir', models_dir,
+        '--databases_dir', databases_dir,
+        '--poll_interval', '0.1',
+    ]
+    workers = [subprocess.Popen(command) for _ in range(3)]
+    # One more worker with two GPUs runs a task on each at once.
+    workers.append(subprocess.Popen(command + ['--gpu_devices', '0,1']))
+    for worker in workers:
+        assert worker.wait(timeout=120) == 0
+
+    runs = fake_alphafold()
+    assert collections.Counter(run['job'] for run in runs) == collections.Counter(names)
+    results = FileWorkQueue(queue_dir).results()
+    assert sorted(result['job_name'] for result in results) == names
+    assert all(result['status'] == 'Success' for result in results)
+    assert FileWorkQueue(queue_dir).status() == {'pending': 0, 'running': 0, 'done': 12, 'failed': 0}
+    assert not os.listdir(os.path.join(queue_dir, 'leases'))
+
+
+def test_worker_claims_one_task_per_gpu(tmp_path, fake_alphafold, batch_dirs, make_task, monkeypatch):
+    monkeypatch.setenv('AFUSION_FAKE_INFERENCE_SECONDS', '0.5')
+    queue_dir = str(tmp_path / 'queue')
+    FileWorkQueue(queue_dir).submit(make_task(f'job_{index}') for index in range(4))
+
+    processed = run_queue_worker(queue_dir, *batch_dirs, poll_interval=0.1, gpu_probe=lambda: ['0', '1'],
+                                 gpu_devices='auto')
+
+    assert processed == 4
+    runs = fake_alphafold()
+    assert collections.Counter(run['device'] for run in runs) == {'0': 2, '1': 2}
+    by_device = {device: [run for run in runs if run['device'] == device] for device in ('0', '1')}
+    # Each device runs one task at a time, and the devices run at once.
+    for device_runs in by_device.values():
+        assert not overlaps(*device_runs)
+    assert any(overlaps(first, second) for first in by_device['0'] for second in by_device['1'])
+    workers = {result['worker'] for result in FileWorkQueue(queue_dir).results()}
+    assert {worker.rsplit('-', 1)[1] for worker in workers} == {'gpu0', 'gpu1'}